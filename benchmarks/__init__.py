@@ -0,0 +1,10 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file __init__.py
+#
+
+"""
+Micro and end-to-end benchmarks for SnS game components
+性能基准测试脚本，使用 python -m benchmarks.<name> 运行
+"""
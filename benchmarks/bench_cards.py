@@ -0,0 +1,132 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_cards.py
+#
+
+"""
+牌堆基准：对比旧版（deque牌堆、字符串列表手牌、每张牌一个带效果列表的对象）
+与编号数组牌堆的每会话内存、抽牌、洗牌与出牌耗时
+
+    python -m benchmarks.bench_cards [--deck 60] [--sessions 1000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, List
+
+from game.cards import CardEffect, CardPile, register_card
+from game.events import GameEvent, GameEventType
+from game.session import GameSession
+from game.state import GameState
+
+PLAYERS = 4
+HAND = 5
+
+
+@dataclass
+class LegacyCard:
+    """旧版卡牌实现，每个实例带一份效果列表，仅用于对比"""
+    id: str
+    name: str
+    description: str
+    effects: List[Callable]
+
+
+def legacy_session(deck_size: int, rng: random.Random):
+    deck = deque(LegacyCard(f"card-{i}", f"卡牌{i}", "", [lambda: None]) for i in range(deck_size))
+    rng.shuffle(deck)
+    hands = [[deck.pop().id for _ in range(HAND)] for _ in range(PLAYERS)]
+    return deck, hands, []
+
+
+def pile_session(deck_size: int, numbers: List[int], rng: random.Random):
+    deck = CardPile(numbers[:deck_size])
+    deck.shuffle(rng)
+    hands = [CardPile(deck.draw_many(HAND)) for _ in range(PLAYERS)]
+    return deck, hands, CardPile()
+
+
+def measure_memory(factory, sessions: int, *args) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    held = [factory(*args, random.Random(i)) for i in range(sessions)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del held
+    return size / sessions
+
+
+def time_ops(deck_size: int, numbers: List[int], rounds: int, repeat: int = 5):
+    """两种实现交替测量repeat次，各取最快一次，减少调度与频率波动的影响"""
+    rng = random.Random(0)
+    legacy = deque(f"card-{i}" for i in range(deck_size))
+    pile = CardPile(numbers[:deck_size])
+
+    def run_legacy():
+        for _ in range(rounds):
+            rng.shuffle(legacy)
+            hand = [legacy.pop() for _ in range(HAND)]
+            legacy.extend(hand)
+
+    def run_pile():
+        for _ in range(rounds):
+            pile.shuffle(rng)
+            pile.extend(pile.draw_many(HAND))
+
+    best = {run_legacy: float('inf'), run_pile: float('inf')}
+    for _ in range(repeat):
+        for func in best:
+            started = time.perf_counter()
+            func()
+            best[func] = min(best[func], (time.perf_counter() - started) / rounds)
+    print(f"洗牌+抽{HAND}张：旧版 {best[run_legacy] * 1e6:.1f} µs，编号数组 {best[run_pile] * 1e6:.1f} µs")
+
+
+async def time_play(numbers: List[int], rounds: int):
+    """经事件分发的抽牌+出牌"""
+    session = GameSession('bench', game_state=GameState(seed=1))
+    state = session.game_state
+    await session.player_join('p1')
+    await session.player_join('p2')
+    await session.player_character_select('p1', 'YinZhu')
+    await session.player_character_select('p2', 'NekaoHewish')
+    state.deck.extend(numbers)
+    draw = {'player': 'p1', 'count': 1}
+    started = time.perf_counter()
+    for _ in range(rounds):
+        event = await session.handle_event(GameEvent(GameEventType.DRAW_CARD, dict(draw)))
+        card = state.players['p1'].hand[-1]
+        await session.handle_event(GameEvent(GameEventType.PLAY_CARD, {'player': 'p1', 'card': card, 'target': 'p2'}))
+        state.players['p2'].hp = state.players['p2'].hp_max
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f"抽牌+出牌（含效果事件）：{elapsed * 1e6:.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deck', type=int, default=60)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    numbers = [
+        register_card(f"bench-strike-{i}", f"打击{i}", "对目标造成伤害",
+                      [CardEffect(GameEventType.DAMAGE_APPLY, {'damage': 50}, on_target=True)])
+        for i in range(args.deck)
+    ]
+    legacy = measure_memory(legacy_session, args.sessions, args.deck)
+    compact = measure_memory(pile_session, args.sessions, args.deck, numbers)
+    print(f"每会话牌堆内存（{args.deck}张牌，{PLAYERS}名玩家）：旧版 {legacy:.0f} B，编号数组 {compact:.0f} B")
+    time_ops(args.deck, numbers, args.rounds)
+    asyncio.run(time_play(numbers, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
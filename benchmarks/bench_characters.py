@@ -0,0 +1,100 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_characters.py
+#
+
+"""
+角色创建基准：模拟会话批量开局时创建角色，对比旧版逐次查模块表的dataclass角色
+与slots角色的每角色耗时与内存分配
+
+    python -m benchmarks.bench_characters [-n 100000]
+"""
+
+import argparse
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from game.character import Module, MPModule, NekaoHewish, YinZhu
+
+
+@dataclass
+class LegacyCharacter:
+    """旧版角色实现，仅用于对比"""
+    def __init__(self, module_type: str):
+        self.team = 0
+        self.name = ""
+        self.traits = {}
+        self.is_alive = True
+        self.hp_max = Module[module_type].value[0]
+        self.hp = self.hp_max
+        self.attack = Module[module_type].value[1]
+        self.defense = Module[module_type].value[2]
+        self.mp_max = 0
+        self.mp = 0
+        self.mp_restore = 0
+        self.mp_restore_cd = 0
+        self.hand = []
+        self.skill_max = 2
+        self.skills = {}
+        self.cooldowns = {}
+        self.statuses = {}
+
+    def module_apply(self, module):
+        self.mp_max += module.value[0]
+        self.mp_restore += module.value[1]
+        self.mp_restore_cd += module.value[2]
+
+
+class LegacyYinZhu(LegacyCharacter):
+    def __init__(self):
+        super().__init__("HP")
+        self.name = "茵竹"
+        self.module_apply(MPModule.HUMUS_HUMAN)
+        self.traits = {"SELF_ENCOURAGEMENT"}
+
+
+IMPLEMENTATIONS = {
+    'legacy': LegacyYinZhu,
+    'slots': YinZhu,
+}
+
+
+def _measure(make, n: int):
+    """返回 (每角色微秒, 每角色分配块数, 每角色字节数)"""
+    start = time.perf_counter()
+    for _ in range(n):
+        make()
+    per_call = (time.perf_counter() - start) / n * 1e6
+
+    sample = max(n // 10, 1)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [make() for _ in range(sample)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    del keep
+    return (per_call,
+            sum(s.count_diff for s in stats) / sample,
+            sum(s.size_diff for s in stats) / sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=100000, help='每种实现创建的角色数')
+    args = parser.parse_args()
+
+    # 预热原型缓存
+    YinZhu()
+    NekaoHewish()
+
+    print(f"{'impl':<12}{'us/char':>10}{'allocs/char':>14}{'bytes/char':>13}")
+    for name, make in IMPLEMENTATIONS.items():
+        per_call, allocs, size = _measure(make, args.n)
+        print(f"{name:<12}{per_call:>10.2f}{allocs:>14.2f}{size:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
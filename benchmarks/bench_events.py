@@ -0,0 +1,109 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_events.py
+#
+
+"""
+GameEvent 微基准：对比旧版dataclass事件与slots事件/事件池的
+每事件内存分配与每秒创建事件数
+
+    python -m benchmarks.bench_events [-n 200000]
+"""
+
+import argparse
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from game.events import EventPool, GameEvent, GameEventType
+
+
+@dataclass
+class LegacyGameEvent:
+    """旧版事件实现，仅用于对比"""
+    event_type: GameEventType
+    event_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    event_time: datetime = field(default_factory=datetime.now)
+    data: Dict[str, Any] = field(default_factory=dict)
+    cancel: bool = False
+    result: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def _legacy(n: int):
+    for i in range(n):
+        LegacyGameEvent(event_type=GameEventType.DAMAGE_APPLY, data={'player': i})
+
+
+def _slots(n: int):
+    for i in range(n):
+        GameEvent(GameEventType.DAMAGE_APPLY, {'player': i})
+
+
+def _pooled(n: int):
+    pool = EventPool()
+    for i in range(n):
+        pool.release(pool.acquire(GameEventType.DAMAGE_APPLY, {'player': i}))
+
+
+def _make_legacy(i: int):
+    return LegacyGameEvent(event_type=GameEventType.DAMAGE_APPLY, data={'player': i})
+
+
+def _make_slots(i: int):
+    return GameEvent(GameEventType.DAMAGE_APPLY, {'player': i})
+
+
+def _allocations(make, sample: int):
+    """统计持有sample个事件时每事件的 (分配块数, 分配字节数)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [make(i) for i in range(sample)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    count = sum(s.count_diff for s in stats)
+    size = sum(s.size_diff for s in stats)
+    del keep
+    return count / sample, size / sample
+
+
+def _measure(name: str, n: int):
+    """返回 (每秒事件数, 每事件分配块数, 每事件分配字节数)"""
+    sample = max(n // 10, 1)
+    if name == 'legacy':
+        run, make = _legacy, _make_legacy
+    elif name == 'slots':
+        run, make = _slots, _make_slots
+    else:
+        # 预热事件池，统计的是池命中后的分配，即只剩事件数据本身
+        pool = EventPool(max_size=sample)
+        for event in [pool.acquire(GameEventType.DAMAGE_APPLY) for _ in range(sample)]:
+            pool.release(event)
+        run = _pooled
+        make = lambda i: pool.acquire(GameEventType.DAMAGE_APPLY, {'player': i})
+
+    start = time.perf_counter()
+    run(n)
+    rate = n / (time.perf_counter() - start)
+    allocs, size = _allocations(make, sample)
+    return rate, allocs, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=200000, help='每种实现创建的事件数')
+    args = parser.parse_args()
+
+    print(f"{'impl':<10}{'events/s':>14}{'allocs/event':>16}{'bytes/event':>14}")
+    for name in ('legacy', 'slots', 'pooled'):
+        rate, allocs, size = _measure(name, args.n)
+        print(f"{name:<10}{rate:>14,.0f}{allocs:>16.2f}{size:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
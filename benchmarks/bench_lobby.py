@@ -0,0 +1,72 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_lobby.py
+#
+
+"""
+匹配基准：按正态分布的分数让大量玩家排队，测量每轮匹配耗时、成局数与排队时长分位数。
+会话创建替换为空操作，只测量匹配本身。
+
+    python -m benchmarks.bench_lobby [-n 20000] [--team-size 1]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from game.lobby import Lobby
+
+
+class _Session:
+    async def player_join(self, player_id: str):
+        pass
+
+    async def team_system_activate(self, teams=None):
+        pass
+
+
+class _Manager:
+    """只分配会话ID的GameManager替身"""
+
+    def __init__(self):
+        self.session_semaphore = asyncio.Semaphore(1 << 30)
+
+    async def create_session(self, session_id: str):
+        return _Session()
+
+
+async def run(players: int, team_size: int, rounds: int):
+    rng = random.Random(1)
+    lobby = Lobby(_Manager(), team_sizes=(team_size,), window_growth=200)
+
+    started = time.perf_counter()
+    for i in range(players):
+        lobby.enqueue(f"p{i}", int(rng.gauss(1500, 300)), team_size)
+    enqueue_time = time.perf_counter() - started
+    print(f"{players}名玩家排队 {enqueue_time / players * 1e6:.2f} µs/人")
+
+    for index in range(rounds):
+        started = time.perf_counter()
+        formed = await lobby.match_once()
+        elapsed = time.perf_counter() - started
+        queued = len(lobby.queues[team_size])
+        print(f"第{index + 1}轮：成局{formed}，剩余{queued}人，用时{elapsed * 1000:.1f} ms")
+        if not queued:
+            break
+        await asyncio.sleep(0.5)
+    print(lobby.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--players', type=int, default=20000)
+    parser.add_argument('--team-size', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=6)
+    args = parser.parse_args()
+    asyncio.run(run(args.players, args.team_size, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_protocol.py
+#
+
+"""
+/game 消息编解码基准：对比JSON与MessagePack二进制协议的
+每条消息编码/解码耗时与线上字节数
+
+    python -m benchmarks.bench_protocol [-n 100000]
+"""
+
+import argparse
+import json
+import time
+
+from game.events import GameEventType
+from game.protocol import JSON_CODEC, MSGPACK_CODEC
+
+# 典型的客户端消息与服务器回复
+CLIENT_MESSAGES = [
+    (GameEventType.PLAYER_JOIN, {'player': 'player_0001'}),
+    (GameEventType.CHARACTER_SELECT, {'player': 'player_0001', 'character': 'YinZhu'}),
+    (GameEventType.SKILL_USE, {'player': 'player_0001', 'skill': 'skill_03', 'target': 'player_0002'}),
+]
+REPLY = {
+    'success': True,
+    'merged': 1,
+    'events': [
+        {'seq': 100 + i, 'event_type': 'SKILL_USE', 'cancel': False, 'error': None}
+        for i in range(4)
+    ],
+}
+
+
+def _timeit(fn, n: int) -> float:
+    """返回每次调用的微秒数"""
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def _bench_client(n: int):
+    for event_type, data in CLIENT_MESSAGES:
+        text = json.dumps({'event_type': event_type.name, 'data': data})
+        rows = [('json', len(text.encode()),
+                 _timeit(lambda: json.dumps({'event_type': event_type.name, 'data': data}), n),
+                 _timeit(lambda: JSON_CODEC.decode(text), n))]
+        if MSGPACK_CODEC:
+            frame = MSGPACK_CODEC.encode_event(event_type, data)
+            rows.append(('msgpack', len(frame),
+                         _timeit(lambda: MSGPACK_CODEC.encode_event(event_type, data), n),
+                         _timeit(lambda: MSGPACK_CODEC.decode(frame), n)))
+        for name, size, enc, dec in rows:
+            print(f"{event_type.name:<18}{name:<10}{size:>8}{enc:>12.2f}{dec:>12.2f}")
+
+
+def _bench_reply(n: int):
+    rows = [('json', len(JSON_CODEC.encode(REPLY).encode()),
+             _timeit(lambda: JSON_CODEC.encode(REPLY), n))]
+    if MSGPACK_CODEC:
+        rows.append(('msgpack', len(MSGPACK_CODEC.encode(REPLY)),
+                     _timeit(lambda: MSGPACK_CODEC.encode(REPLY), n)))
+    for name, size, enc in rows:
+        print(f"{'reply':<18}{name:<10}{size:>8}{enc:>12.2f}{'-':>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=100000, help='每项测量的循环次数')
+    args = parser.parse_args()
+
+    if MSGPACK_CODEC is None:
+        print("msgpack未安装，仅测量JSON")
+    print(f"{'message':<18}{'codec':<10}{'bytes':>8}{'enc(us)':>12}{'dec(us)':>12}")
+    _bench_client(args.n)
+    _bench_reply(args.n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_replay.py
+#
+
+"""
+对局重放基准：在线上会话中处理一批伤害/治疗/角色更新事件并写入对局日志，
+再由日志重放，校验重放结果与线上状态一致，报告重放吞吐（事件/秒）
+
+    python -m benchmarks.bench_replay [-n 100000] [--repeat 3]
+"""
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from game.events import GameEvent, GameEventType
+from game.journal import EVENT, JournalWriter, read_journal
+from game.replay import replay
+from game.session import GameSession
+from game.state import GameState
+
+
+async def record_match(directory: Path, count: int, seed: int = 7) -> Tuple[Path, Dict[str, Any]]:
+    """运行一局线上会话，返回对局日志路径与线上的最终状态"""
+    journal = JournalWriter(directory)
+    session = GameSession('bench', game_state=GameState(seed=seed), journal=journal)
+    runner = asyncio.create_task(session.run())
+    await session.player_join('p1')
+    await session.player_join('p2')
+    await session.player_character_select('p1', 'YinZhu')
+    await session.player_character_select('p2', 'NekaoHewish')
+
+    rng = random.Random(seed)
+    for i in range(count):
+        player = rng.choice(('p1', 'p2'))
+        kind = rng.random()
+        if kind < 0.5:
+            event = GameEvent(GameEventType.DAMAGE_APPLY, {'player': player, 'damage': rng.randint(10, 120)})
+        elif kind < 0.8:
+            event = GameEvent(GameEventType.HEAL_APPLY, {'player': player, 'hp': rng.randint(10, 80)})
+        else:
+            event = GameEvent(GameEventType.CHARACTER_UPDATE, {'player': player, 'seq': i})
+        await session.process_event(event)
+        if i % 256 == 0:
+            await asyncio.sleep(0)
+    while not session.event_queue.empty():
+        await asyncio.sleep(0)
+    async with session.lock:
+        live = session.game_state.snapshot()
+    await session.cleanup()
+    await runner
+    await journal.close()
+    return journal.path('bench', session.created_at.timestamp()), live
+
+
+async def run(count: int, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        path, live = await record_match(Path(directory), count)
+        elapsed = time.perf_counter() - started
+        _, records = read_journal(path)
+        events = sum(1 for record in records if record[0] == EVENT)
+        print(f"线上处理 {events} 个事件 {elapsed:.3f}s，日志 {path.stat().st_size / 1024:.0f} KiB，"
+              f"{len(records)} 条记录")
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            session = await replay(path)
+            elapsed = time.perf_counter() - started
+            same = session.game_state.snapshot() == live
+            print(f"重放 {elapsed:.3f}s：{events / elapsed:,.0f} 事件/s，状态一致：{same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--events', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.events, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_snapshot.py
+#
+
+"""
+会话快照基准：快照大小、编码/解码耗时，以及启动时从磁盘恢复一批会话的总耗时
+
+    python -m benchmarks.bench_snapshot [-n 500]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from game.cards import register_card
+from game.character import CHARACTERS
+from game.events import GameEvent, GameEventType
+from game.manager import GameManager
+from game.session import GameSession
+from game.snapshot import SnapshotStore, decode_snapshot, encode_session
+from game.state import GameState
+
+
+CARD_NUMBERS = [register_card(f"bench-{i}", f"测试牌{i}", "") for i in range(40)]
+
+
+def make_session(index: int) -> GameSession:
+    """两名玩家、少量日志与未处理事件的进行中对局"""
+    state = GameState()
+    session = GameSession(f"bench-{index}", game_state=state)
+    for pid, name in zip(('p1', 'p2'), CHARACTERS):
+        character = CHARACTERS[name]()
+        character.hand.extend(CARD_NUMBERS[:3])
+        character.cooldowns['strike'] = 1
+        state.player_in_order.append(pid)
+        state.players[pid] = character
+        state.character_selected.append(name)
+        state.traits.attach(pid, character)
+    state.deck.extend(CARD_NUMBERS)
+    state.current_round = 3
+    for turn in range(20):
+        state.logs.append(f"第{turn}回合")
+    state.collect_delta()
+    for _ in range(4):
+        session.event_queue.put_nowait(GameEvent(GameEventType.CHARACTER_UPDATE, {'player': 'p1'}))
+    return session
+
+
+async def run(count: int):
+    sessions = [make_session(i) for i in range(count)]
+
+    started = time.perf_counter()
+    blobs = [encode_session(s) for s in sessions]
+    encode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for blob in blobs:
+        decode_snapshot(blob)
+    decode_time = time.perf_counter() - started
+    size = sum(len(b) for b in blobs) / count
+    print(f"快照大小 {size:.0f} B，编码 {encode_time / count * 1e6:.1f} µs，"
+          f"解码 {decode_time / count * 1e6:.1f} µs")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(Path(directory))
+        started = time.perf_counter()
+        for session in sessions:
+            store.save(session)
+        await store.flush()
+        print(f"写出{count}个快照 {time.perf_counter() - started:.3f}s")
+
+        manager = GameManager(max_sessions=count, snapshots=SnapshotStore(Path(directory)))
+        started = time.perf_counter()
+        restored = await manager.restore_sessions()
+        elapsed = time.perf_counter() - started
+        print(f"恢复{len(restored)}个会话 {elapsed:.3f}s（{len(restored) / elapsed:,.0f} 会话/s）")
+        await manager.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--sessions', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions))
+
+
+if __name__ == '__main__':
+    main()
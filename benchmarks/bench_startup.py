@@ -0,0 +1,125 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file bench_startup.py
+#
+
+"""
+冷启动基准
+
+1. 在新的解释器中导入各模块的耗时（扣除空解释器的启动时间），对应模拟工作进程与服务器进程的导入开销
+2. 从启动main.py进程到第一个/game WebSocket连接被接受并收到第一条消息的耗时
+
+服务器进程以仓库的config.yaml启动（另设令牌密钥，由本脚本签发连接用的登录令牌），
+工作目录为临时目录，快照、对局日志与账号数据写入该目录。
+
+    python -m benchmarks.bench_startup [--repeat 5] [--workers 1]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import aiohttp
+import yaml
+
+from websocket.auth import TokenSigner
+
+ROOT = Path(__file__).resolve().parent.parent
+# 模拟工作进程只需game.simulation，服务器进程需main及其依赖
+MODULES = ('game', 'game.simulation', 'game.session', 'game.server', 'main')
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def interpreter_time(code: str) -> float:
+    """在新的解释器中执行code的墙钟时间"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+    return time.perf_counter() - started
+
+
+def import_times(repeat: int):
+    baseline = statistics.median(interpreter_time('pass') for _ in range(repeat))
+    print(f"空解释器启动 {baseline * 1000:.1f} ms")
+    for module in MODULES:
+        elapsed = statistics.median(interpreter_time(f'import {module}') for _ in range(repeat))
+        print(f"  import {module:<16} {(elapsed - baseline) * 1000:7.1f} ms")
+
+
+async def first_websocket(workers: int, timeout: float = 30) -> float:
+    """启动服务器进程，返回到第一个WebSocket连接收到消息的耗时"""
+    workdir = tempfile.mkdtemp(prefix='sns-startup-')
+    port = free_port()
+    secret = os.urandom(16).hex()
+    with open(ROOT / 'config' / 'config.yaml', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('account', {})['token_secret'] = secret
+    config_path = Path(workdir) / 'config.yaml'
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    url = f"http://127.0.0.1:{port}/game?token={TokenSigner(secret.encode()).issue('startup')}"
+    async with aiohttp.ClientSession() as http:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(ROOT / 'main.py'), '--config', str(config_path),
+             '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"服务器进程退出，返回码{process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError("等待服务器启动超时")
+                try:
+                    ws = await http.ws_connect(url)
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.005)
+                    continue
+                await ws.receive(timeout=timeout)
+                elapsed = time.perf_counter() - started
+                await ws.close()
+                return elapsed
+        finally:
+            # SIGTERM：排空后退出，连接已关闭，无需等待
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=1, help='服务器工作进程数')
+    parser.add_argument('--skip-imports', action='store_true', help='只测量到第一个WebSocket连接的耗时')
+    args = parser.parse_args()
+
+    if not args.skip_imports:
+        import_times(args.repeat)
+    samples: List[float] = [asyncio.run(first_websocket(args.workers)) for _ in range(args.repeat)]
+    print(f"启动到第一个WebSocket连接（{args.workers}个工作进程）："
+          f"中位数 {statistics.median(samples) * 1000:.1f} ms，"
+          f"最短 {min(samples) * 1000:.1f} ms，最长 {max(samples) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
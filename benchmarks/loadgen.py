@@ -0,0 +1,523 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file loadgen.py
+#
+
+"""
+端到端负载基准：在本地子进程中启动main.py的服务器应用，按各并发档位用大量模拟客户端
+连接/game与/account，测量往返延迟分位数、每秒消息数与每会话内存。
+
+每个/game客户端带上以服务器令牌密钥签发的登录令牌，经大厅匹配进入对局，依次发送PLAYER_JOIN、CHARACTER_SELECT，之后循环
+发送一串SKILL_USE（夹杂可合并的CHARACTER_UPDATE），等本串全部确认后按随机思考时间暂停。
+消息数据中带ref，服务器在tick回复中原样返回，以此计算往返延迟；被合并的消息
+在合并后的事件返回时一并确认。/account客户端反复注册并登录新账号，延迟单独统计。
+
+    python -m benchmarks.loadgen [--levels 100,500,1000] [--duration 20] [--output results.json]
+    python -m benchmarks.loadgen --compare baseline.json --input results.json [--tolerance 0.1]
+
+每个档位使用新的服务器进程与临时工作目录，快照、对局日志与账号数据写入该目录。
+结果为JSON，--compare 与基线逐档位比较，延迟、吞吐或内存变差超过容差时退出码为1。
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from game.events import GameEventType
+from game.protocol import HEADER, JSON_PROTOCOL, MSGPACK_CODEC, MSGPACK_PROTOCOL
+from websocket.auth import TokenSigner
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ROOT = Path(__file__).resolve().parent.parent
+CHARACTER_NAMES = ('YinZhu', 'NekaoHewish')
+SKILLS = ('strike', 'guard', 'focus', 'dash')
+PERCENTILES = (50, 99, 99.9)
+
+# 比较时检查的指标：(路径, 数值变大是否为变差)
+COMPARED = (
+    (('rtt_ms', 'p50'), True),
+    (('rtt_ms', 'p99'), True),
+    (('rtt_ms', 'p99.9'), True),
+    (('msgs_per_sec',), False),
+    (('memory_per_session_kb',), True),
+)
+
+
+def percentiles(samples: List[float], points: Iterable[float] = PERCENTILES) -> Dict[str, float]:
+    """样本的分位数，与Lobby.wait_percentiles取法相同"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {f"p{p:g}": ordered[min(last, int(round(p / 100 * last)))] for p in points}
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """进程常驻内存（KB），无/proc时返回None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# ---------------------------------------------------------------- 服务器子进程
+
+def serve(port: int, workdir: str, max_sessions: int, persistence: bool, token_secret: str):
+    """
+    子进程入口：以仓库配置为基础，改为本机端口、足够的会话名额、
+    与负载生成器共享的令牌密钥与安静的日志后运行应用
+    """
+    from aiohttp import web
+    from config.log_setup import setup_logging
+    from config.settings import Settings
+    from main import create_app
+
+    config = copy.deepcopy(Settings().config or {})
+    config['host'] = '127.0.0.1'
+    config['port'] = port
+    game = config.setdefault('game', {})
+    game['max_sessions'] = max_sessions
+    if not persistence:
+        game['snapshot_dir'] = None
+        game['journal_dir'] = None
+    config.setdefault('account', {})['token_secret'] = token_secret
+    log_listener = setup_logging({
+        'level': {'root': 'WARNING'},
+        'handlers': {'console': {'class': 'logging.StreamHandler'}},
+        'patterns': {'console': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'},
+    })
+    # 相对路径的数据目录（快照、对局日志、账号）都落在临时工作目录中
+    os.chdir(workdir)
+    try:
+        web.run_app(create_app(config), host='127.0.0.1', port=port, print=None)
+    finally:
+        log_listener.stop()
+
+
+class ServerProcess:
+    """在子进程中运行的被测服务器"""
+
+    def __init__(self, max_sessions: int, persistence: bool):
+        self.port = free_port()
+        self.workdir = tempfile.TemporaryDirectory(prefix='sns-loadgen-')
+        # 客户端直接用同一密钥签发登录令牌，不必逐个注册登录
+        secret = os.urandom(16).hex()
+        self.tokens = TokenSigner(secret.encode())
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.loadgen', '--serve', str(self.port),
+             '--workdir', self.workdir.name, '--max-sessions', str(max_sessions),
+             '--token-secret', secret]
+            + ([] if persistence else ['--no-persistence']),
+            cwd=ROOT,
+        )
+        self.base = f"http://127.0.0.1:{self.port}"
+
+    async def wait_ready(self, http: aiohttp.ClientSession, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"服务器进程退出，返回码{self.process.returncode}")
+            try:
+                async with http.get(f"{self.base}/lobby") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError("等待服务器启动超时")
+
+    async def sessions(self, http: aiohttp.ClientSession) -> int:
+        async with http.get(f"{self.base}/shards") as resp:
+            return sum(shard['sessions'] for shard in await resp.json())
+
+    def rss_kb(self) -> Optional[int]:
+        return rss_kb(self.process.pid)
+
+    def stop(self):
+        # SIGINT让run_app执行关闭钩子：保存快照、结束会话
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.workdir.cleanup()
+
+
+# ---------------------------------------------------------------- 客户端
+
+class LevelStats:
+    """一个并发档位的统计"""
+
+    def __init__(self):
+        self.rtt: List[float] = []
+        self.match_wait: List[float] = []
+        self.account_rtt: Dict[str, List[float]] = {'register': [], 'login': []}
+        self.account_failures = 0
+        self.connected = 0
+        self.matched = 0
+        self.failed = 0
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.errors = 0
+
+
+class GameClient:
+    """一名/game玩家：匹配进入对局后按消息组合发送并确认回复"""
+
+    def __init__(self, index: int, args, stats: LevelStats):
+        self.player_id = f"lg{index}"
+        self.prefix = f"{self.player_id}:"
+        self.args = args
+        self.stats = stats
+        self.rng = random.Random(index)
+        self.binary = args.protocol == 'msgpack'
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.counter = 0
+        # ref编号 -> 发送时间，按编号递增排列
+        self.pending: Dict[int, float] = {}
+        self.drained = asyncio.Event()
+
+    def _decode(self, msg) -> Dict[str, Any]:
+        if msg.type == aiohttp.WSMsgType.BINARY:
+            return msgpack.unpackb(memoryview(msg.data)[HEADER.size:])
+        return json.loads(msg.data)
+
+    async def connect(self, http: aiohttp.ClientSession, base: str, token: str) -> bool:
+        """以登录令牌连接并等待成局，收到全量快照即进入对局"""
+        url = f"{base}/game?token={token}&team_size={self.args.team_size}"
+        protocol = MSGPACK_PROTOCOL if self.binary else JSON_PROTOCOL
+        try:
+            self.ws = await http.ws_connect(url, protocols=(protocol,), max_msg_size=0)
+            self.stats.connected += 1
+            started = time.perf_counter()
+            async for msg in self.ws:
+                if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    break
+                reply = self._decode(msg)
+                if 'snapshot' in reply:
+                    self.stats.matched += 1
+                    self.stats.match_wait.append(time.perf_counter() - started)
+                    return True
+                if 'error' in reply:
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            pass
+        self.stats.failed += 1
+        return False
+
+    async def send(self, event_type: GameEventType, data: Dict[str, Any]):
+        self.counter += 1
+        data['player'] = self.player_id
+        data['ref'] = f"{self.prefix}{self.counter}"
+        self.pending[self.counter] = time.perf_counter()
+        self.drained.clear()
+        self.stats.sent += 1
+        if self.binary:
+            await self.ws.send_bytes(MSGPACK_CODEC.encode_event(event_type, data))
+        else:
+            await self.ws.send_str(json.dumps({'event_type': event_type.name, 'data': data}))
+
+    def acknowledge(self, number: int):
+        """确认编号不大于number的全部消息：被合并的消息随合并后的事件一起返回"""
+        now = time.perf_counter()
+        while self.pending:
+            first = next(iter(self.pending))
+            if first > number:
+                break
+            self.stats.rtt.append((now - self.pending.pop(first)) * 1000)
+            self.stats.acked += 1
+        if not self.pending:
+            self.drained.set()
+
+    async def receive(self):
+        async for msg in self.ws:
+            if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                break
+            reply = self._decode(msg)
+            if 'error' in reply:
+                self.stats.errors += 1
+            for event in reply.get('events', ()):
+                ref = event.get('ref')
+                if isinstance(ref, str) and ref.startswith(self.prefix):
+                    if event.get('error'):
+                        self.stats.errors += 1
+                    self.acknowledge(int(ref[len(self.prefix):]))
+
+    async def wait_acked(self):
+        try:
+            await asyncio.wait_for(self.drained.wait(), self.args.ack_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += len(self.pending)
+            self.pending.clear()
+            self.drained.set()
+
+    async def play(self, deadline: float):
+        """消息组合：加入、选角，然后按串发送技能直到截止时间"""
+        receiver = asyncio.create_task(self.receive())
+        try:
+            await self.send(GameEventType.PLAYER_JOIN, {})
+            await self.send(GameEventType.CHARACTER_SELECT,
+                            {'character': self.rng.choice(CHARACTER_NAMES)})
+            await self.wait_acked()
+            while time.monotonic() < deadline:
+                for _ in range(self.rng.randint(1, self.args.burst)):
+                    if self.rng.random() < self.args.update_ratio:
+                        await self.send(GameEventType.CHARACTER_UPDATE, {'hp': self.rng.randint(1, 100)})
+                    else:
+                        await self.send(GameEventType.SKILL_USE, {'skill': self.rng.choice(SKILLS)})
+                await self.wait_acked()
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think))
+        except (aiohttp.ClientError, ConnectionError):
+            self.stats.errors += 1
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+
+async def account_client(index: int, http: aiohttp.ClientSession, base: str,
+                         deadline: float, stats: LevelStats):
+    """/account客户端：在截止时间前反复注册并登录新账号"""
+    try:
+        async with http.ws_connect(f"{base}/account") as ws:
+            round_ = 0
+            while time.monotonic() < deadline:
+                username = f"lg{index}x{round_}"
+                round_ += 1
+                for action in ('register', 'login'):
+                    message = {'action': action, 'username': username, 'password': 'loadgen-pw'}
+                    if action == 'register':
+                        message['confirm_password'] = message['password']
+                    started = time.perf_counter()
+                    await ws.send_str(json.dumps(message))
+                    reply = json.loads(await ws.receive_str())
+                    stats.account_rtt[action].append((time.perf_counter() - started) * 1000)
+                    if not reply.get('success'):
+                        stats.account_failures += 1
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError, TypeError):
+        stats.account_failures += 1
+
+
+# ---------------------------------------------------------------- 档位
+
+async def run_level(clients: int, args) -> Dict[str, Any]:
+    stats = LevelStats()
+    server = ServerProcess(max_sessions=clients, persistence=not args.no_persistence)
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            await server.wait_ready(http)
+            rss_base = server.rss_kb()
+
+            # 连接阶段：在ramp秒内陆续连接，全部成局或失败后再开始计时
+            players = [GameClient(i, args, stats) for i in range(clients)]
+
+            async def connect(client: GameClient, delay: float) -> bool:
+                await asyncio.sleep(delay)
+                return await client.connect(http, server.base, server.tokens.issue(client.player_id))
+
+            started = time.perf_counter()
+            joined = await asyncio.gather(*(
+                connect(client, args.ramp * i / clients) for i, client in enumerate(players)
+            ))
+            connect_time = time.perf_counter() - started
+            sessions = await server.sessions(http)
+            rss_loaded = server.rss_kb()
+
+            # 消息阶段
+            deadline = time.monotonic() + args.duration
+            started = time.perf_counter()
+            tasks = [client.play(deadline) for client, ok in zip(players, joined) if ok]
+            tasks += [account_client(i, http, server.base, deadline, stats)
+                      for i in range(args.account_clients)]
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            rss_peak = server.rss_kb()
+            await asyncio.gather(*(client.close() for client in players))
+    finally:
+        server.stop()
+
+    memory_per_session = None
+    if rss_base is not None and rss_loaded is not None and sessions:
+        memory_per_session = round((rss_loaded - rss_base) / sessions, 2)
+    return {
+        'clients': clients,
+        'connected': stats.connected,
+        'matched': stats.matched,
+        'failed': stats.failed,
+        'sessions': sessions,
+        'connect_seconds': round(connect_time, 3),
+        'duration': round(elapsed, 3),
+        'sent': stats.sent,
+        'acked': stats.acked,
+        'timeouts': stats.timeouts,
+        'errors': stats.errors,
+        'msgs_per_sec': round(stats.acked / elapsed, 1) if elapsed else 0.0,
+        'rtt_ms': {k: round(v, 3) for k, v in percentiles(stats.rtt).items()},
+        'match_wait_ms': {k: round(v * 1000, 3) for k, v in percentiles(stats.match_wait).items()},
+        'account_rtt_ms': {
+            action: {k: round(v, 3) for k, v in percentiles(samples).items()}
+            for action, samples in stats.account_rtt.items()
+        },
+        'account_ops': sum(len(samples) for samples in stats.account_rtt.values()),
+        'account_failures': stats.account_failures,
+        'rss_kb': {'base': rss_base, 'loaded': rss_loaded, 'peak': rss_peak},
+        'memory_per_session_kb': memory_per_session,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_level(result: Dict[str, Any]):
+    rtt = result['rtt_ms']
+    print(f"[{result['clients']}客户端] 成局{result['matched']}/{result['clients']}，"
+          f"会话{result['sessions']}，连接阶段{result['connect_seconds']}s")
+    print(f"  往返延迟 p50 {rtt.get('p50', '-')} ms，p99 {rtt.get('p99', '-')} ms，"
+          f"p99.9 {rtt.get('p99.9', '-')} ms；{result['msgs_per_sec']} 消息/s，"
+          f"超时{result['timeouts']}，错误{result['errors']}")
+    for action, values in result['account_rtt_ms'].items():
+        if values:
+            print(f"  账号{action} p50 {values['p50']} ms，p99 {values['p99']} ms")
+    print(f"  每会话内存 {result['memory_per_session_kb']} KB（RSS {result['rss_kb']}）")
+
+
+async def run(args) -> Dict[str, Any]:
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': {k: v for k, v in vars(args).items()
+                       if k not in ('serve', 'workdir', 'token_secret', 'output', 'compare', 'input')},
+        },
+        'levels': [],
+    }
+    for clients in args.levels:
+        result = await run_level(clients, args)
+        print_level(result)
+        results['levels'].append(result)
+    return results
+
+
+# ---------------------------------------------------------------- 比较
+
+def _metric(result: Dict[str, Any], path) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """逐档位比较，返回超过容差的变差项"""
+    regressions = []
+    base_levels = {level['clients']: level for level in baseline['levels']}
+    for level in current['levels']:
+        base = base_levels.get(level['clients'])
+        if base is None:
+            continue
+        for path, higher_is_worse in COMPARED:
+            old, new = _metric(base, path), _metric(level, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            name = '.'.join(path)
+            print(f"[{level['clients']}客户端] {name}: {old} -> {new} ({change:+.1%})")
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{level['clients']}客户端 {name} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', type=lambda s: [int(x) for x in s.split(',')], default=[100, 500, 1000],
+                        help='并发客户端数档位，逗号分隔')
+    parser.add_argument('--duration', type=float, default=20, help='每档位消息阶段时长（秒）')
+    parser.add_argument('--ramp', type=float, default=2, help='连接阶段内陆续连接的时长（秒）')
+    parser.add_argument('--burst', type=int, default=8, help='每串最多的技能消息数')
+    parser.add_argument('--think', type=float, default=0.2, help='两串之间的平均思考时间（秒）')
+    parser.add_argument('--update-ratio', type=float, default=0.2, help='串中CHARACTER_UPDATE的比例')
+    parser.add_argument('--team-size', type=int, default=1)
+    parser.add_argument('--account-clients', type=int, default=20, help='/account并发客户端数')
+    parser.add_argument('--ack-timeout', type=float, default=10, help='等待确认的超时（秒）')
+    parser.add_argument('--protocol', choices=('json', 'msgpack'), default='msgpack' if msgpack else 'json')
+    parser.add_argument('--no-persistence', action='store_true', help='关闭快照与对局日志')
+    parser.add_argument('--output', type=Path, help='结果JSON的保存路径')
+    parser.add_argument('--compare', type=Path, help='与之比较的基线结果JSON')
+    parser.add_argument('--input', type=Path, help='与--compare一起使用，比较已有结果而不运行')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='允许的相对变差')
+    # 内部使用：子进程中运行被测服务器
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--max-sessions', type=int, default=1000, help=argparse.SUPPRESS)
+    parser.add_argument('--token-secret', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.workdir, args.max_sessions, not args.no_persistence, args.token_secret)
+        return
+
+    if args.input:
+        results = json.loads(args.input.read_text())
+    else:
+        results = asyncio.run(run(args))
+        if args.output:
+            args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+            print(f"结果已保存到{args.output}")
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), results, args.tolerance)
+        if regressions:
+            print("超过容差的变差：" + "；".join(regressions))
+            sys.exit(1)
+        print("未发现超过容差的变差")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file log_setup.py
+#
+
+"""
+按config.yaml的logging配置初始化日志
+各logger只把记录放入队列，由后台线程批量写入配置的handler，
+避免在事件循环中直接进行stdout/文件IO。
+"""
+
+import importlib
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Any, Dict, List, Optional
+
+
+class BatchingHandler(logging.handlers.MemoryHandler):
+    """缓冲记录，达到条数、时间间隔或错误级别时一次性写入目标handler"""
+
+    def __init__(self, capacity: int, flush_interval: float, target: logging.Handler):
+        super().__init__(capacity, flushLevel=logging.ERROR, target=target, flushOnClose=True)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return (super().shouldFlush(record)
+                or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
+
+class LogListener(logging.handlers.QueueListener):
+    """停止时写出批量缓冲中剩余的日志"""
+
+    def stop(self):
+        super().stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+def _resolve(path: str):
+    module, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def _build_handlers(config: Dict[str, Any]) -> List[logging.Handler]:
+    patterns = config.get('patterns', {})
+    batch = config.get('batch', {})
+    handlers = []
+    for name, options in config.get('handlers', {}).items():
+        options = dict(options)
+        handler_class = _resolve(options.pop('class', 'logging.StreamHandler'))
+        options.pop('formatter', None)
+        handler = handler_class(**options)
+        handler.setFormatter(logging.Formatter(patterns.get(name)))
+        if isinstance(handler, logging.FileHandler):
+            # 文件写入按批合并
+            handler = BatchingHandler(
+                batch.get('size', 100), batch.get('flush_interval', 1.0), handler
+            )
+        handlers.append(handler)
+    return handlers
+
+
+def setup_logging(config: Dict[str, Any]) -> LogListener:
+    """
+    初始化日志
+
+    Args:
+        config: config.yaml中的logging部分
+
+    Returns:
+        后台写日志的LogListener，退出前需调用stop()
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = LogListener(
+        log_queue, *_build_handlers(config), respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    apply_levels(config.get('level', {}))
+    listener.start()
+    return listener
+
+
+def apply_levels(levels: Dict[str, str], previous: Optional[Dict[str, str]] = None):
+    """
+    设置各logger的级别，可在配置重新加载后调用
+
+    Args:
+        levels: config.yaml中logging.level部分
+        previous: 之前的设置，其中已删除的logger恢复为继承上级级别
+    """
+    levels = levels or {}
+    for name in set(previous or {}) - set(levels):
+        logger = logging.getLogger() if name == 'root' else logging.getLogger(name)
+        logger.setLevel(logging.WARNING if name == 'root' else logging.NOTSET)
+    for name, level in levels.items():
+        logger = logging.getLogger() if name == 'root' else logging.getLogger(name)
+        logger.setLevel(level)
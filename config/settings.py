@@ -1,13 +1,389 @@
-import yaml
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file settings.py
+#
+
+"""
+配置
+config.yaml解析为带类型与默认值的只读对象AppSettings，进程内由Settings共享，只解析一次。
+
+Settings可定期检查配置文件的修改时间，文件修改后重新解析并整体替换current，
+解析或校验失败时保留原配置；替换后按路径通知订阅者，例如：
+
+    settings.subscribe('game.max_sessions', lambda new, old: ...)
+
+订阅的路径的值有变化时回调(新值, 旧值)。分片数、监听地址等需重启才能生效的项修改后只记录警告。
+"""
+
+import asyncio
+import dataclasses
+import functools
+import logging
+import os
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import (Any, Callable, Dict, List, Optional, Set, Tuple, Union,
+                    get_args, get_origin, get_type_hints)
+
+import yaml
+
+from game.backpressure import COALESCE, DISCONNECT, DROP, check_policy
+
+DEFAULT_PATH = Path(__file__).resolve().parent / 'config.yaml'
+
+# 修改后需重启进程才能生效的配置项
+RESTART_REQUIRED = (
+    'server.host', 'server.port', 'server.workers', 'server.uvloop',
+    'server.restart_delay', 'server.restart_delay_max', 'server.stable_after',
+    'game.shards', 'game.snapshot_dir', 'game.journal_dir', 'game.journal_flush_interval',
+    'game.lobby.enabled', 'game.lobby.team_sizes', 'game.lobby.bucket_width',
+    'account', 'logging.handlers', 'logging.patterns', 'logging.batch',
+)
+
+
+class SettingsError(ValueError):
+    """配置项的类型或取值不合法"""
+
+
+class _Section:
+    """配置段的公共方法"""
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]):
+        """由YAML解析出的字典创建，缺少的项使用默认值"""
+        return _build(cls, data or {}, '')
+
+
+@dataclass(frozen=True)
+class ServerSettings(_Section):
+    host: str = 'localhost'
+    port: int = 8080
+    workers: int = 1                # 工作进程数，大于1时由监督进程启动并以SO_REUSEPORT共用端口
+    uvloop: bool = True             # 已安装uvloop时使用
+    drain_timeout: float = 30       # 排空时等待会话结束的最长时间（秒）
+    restart_delay: float = 1.0      # 工作进程崩溃后重启前的等待（秒），连续崩溃时加倍
+    restart_delay_max: float = 30.0
+    stable_after: float = 10.0      # 运行超过该时长（秒）后崩溃，重启等待恢复为restart_delay
+    reload_interval: float = 2.0    # 检查配置文件修改的间隔（秒），0表示不自动重新加载
+
+
+@dataclass(frozen=True)
+class BackpressureSettings(_Section):
+    max_message_size: int = 65536   # 单帧字节上限
+    session_queue: int = 1024       # 每个会话待处理事件的上限，0表示不限
+    session_overflow: str = COALESCE
+    rate: float = 50                # 每连接每秒消息数，0表示不限速
+    burst: float = 100              # 令牌桶容量
+    rate_overflow: str = DROP       # 超过限速时：drop或disconnect
+    send_queue: int = 256           # 每连接发送队列的高水位
+    send_overflow: str = COALESCE
+
+    def __post_init__(self):
+        check_policy(self.session_overflow)
+        check_policy(self.send_overflow)
+        check_policy(self.rate_overflow, (DROP, DISCONNECT))
+
+
+@dataclass(frozen=True)
+class LobbySettings(_Section):
+    enabled: bool = False
+    team_sizes: Tuple[int, ...] = (1, 2)
+    bucket_width: int = 50
+    window_base: float = 100
+    window_growth: float = 25
+    window_max: Optional[float] = 1000
+    match_interval: float = 0.5
+
+
+@dataclass(frozen=True)
+class ProfilerSettings(_Section):
+    enabled: bool = False
+    sample_rate: float = 0.01
+    slow_ms: float = 5.0
+    slow_samples: int = 200
+    allow_remote: bool = False      # 调试路由是否接受非本机请求
+
+
+@dataclass(frozen=True)
+class GameSettings(_Section):
+    max_sessions: int = 100
+    shards: int = 1                 # 工作进程数，大于1时启用多进程会话分片
+    event_batch_size: int = 64
+    event_tick_interval: float = 0.0
+    cleanup_interval: float = 10    # 空闲会话检查间隔（秒）
+    snapshot_dir: Optional[str] = None
+    journal_dir: Optional[str] = None
+    journal_flush_interval: float = 0.05
+    session_timeouts: Dict[str, float] = field(default_factory=lambda: {'default': 3600})
+    allow_guests: bool = False      # 允许不带登录令牌以随机游客身份连接/game
+    backpressure: BackpressureSettings = field(default_factory=BackpressureSettings)
+    lobby: LobbySettings = field(default_factory=LobbySettings)
+    profiler: ProfilerSettings = field(default_factory=ProfilerSettings)
+
+
+@dataclass(frozen=True)
+class AccountSettings(_Section):
+    hash_workers: int = 4
+    hash_queue: int = 64
+    token_ttl: int = 86400
+    token_secret: str = ''          # 留空则每次启动随机生成
+    cache_size: int = 10000         # 内存中缓存的账号数上限
+    data_dir: str = 'data/accounts'  # 账号数据库所在目录，相对路径以工作目录为起点
+
+
+@dataclass(frozen=True)
+class AppSettings(_Section):
+    server: ServerSettings = field(default_factory=ServerSettings)
+    game: GameSettings = field(default_factory=GameSettings)
+    account: AccountSettings = field(default_factory=AccountSettings)
+    logging: Dict[str, Any] = field(default_factory=dict)    # 交给log_setup，结构见config.yaml
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> 'AppSettings':
+        data = dict(data or {})
+        # 兼容旧版顶层的host与port
+        legacy = {key: data.pop(key) for key in ('host', 'port') if key in data}
+        if legacy:
+            data['server'] = {**legacy, **(data.get('server') or {})}
+        return _build(cls, data, '')
+
+
+def _coerce(kind: Any, value: Any, path: str) -> Any:
+    """按字段的类型标注检查并转换YAML中的值"""
+    if dataclasses.is_dataclass(kind):
+        if value is None:
+            value = {}
+        if not isinstance(value, dict):
+            raise SettingsError(f"{path}: 应为映射")
+        return _build(kind, value, path)
+    origin = get_origin(kind)
+    if origin is Union:
+        if value is None:
+            return None
+        kind = next(arg for arg in get_args(kind) if arg is not type(None))
+        return _coerce(kind, value, path)
+    if origin is tuple:
+        if not isinstance(value, (list, tuple)):
+            raise SettingsError(f"{path}: 应为列表")
+        return tuple(_coerce(get_args(kind)[0], item, path) for item in value)
+    if origin is dict:
+        if not isinstance(value, dict):
+            raise SettingsError(f"{path}: 应为映射")
+        item_kind = get_args(kind)[1]
+        return {str(key): _coerce(item_kind, item, f"{path}.{key}") for key, item in value.items()}
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise SettingsError(f"{path}: 应为true或false，而不是{value!r}")
+        return value
+    if kind in (int, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SettingsError(f"{path}: 应为数值，而不是{value!r}")
+        if kind is int and value != int(value):
+            raise SettingsError(f"{path}: 应为整数，而不是{value!r}")
+        return kind(value)
+    if kind is str:
+        return '' if value is None else str(value)
+    return value
+
+
+def _build(cls, data: Dict[str, Any], path: str):
+    hints = get_type_hints(cls)
+    names = {f.name for f in dataclasses.fields(cls)}
+    unknown = set(data) - names
+    if unknown:
+        logging.getLogger('Settings').warning(
+            f"忽略未知的配置项: {', '.join(sorted(f'{path}.{k}'.lstrip('.') for k in unknown))}"
+        )
+    values = {
+        name: _coerce(hints[name], data[name], f"{path}.{name}".lstrip('.'))
+        for name in names if name in data
+    }
+    try:
+        return cls(**values)
+    except ValueError as e:
+        raise SettingsError(f"{path or cls.__name__}: {e}") from e
+
+
+def resolve(settings: Any, path: str) -> Any:
+    """按'game.backpressure.rate'形式的路径取配置值，路径不存在时返回None"""
+    value = settings
+    for name in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(name)
+        else:
+            value = getattr(value, name, None)
+        if value is None:
+            return None
+    return value
+
+
+def with_server(settings: AppSettings, **changes) -> AppSettings:
+    """替换server段中的项，用于命令行参数覆盖配置文件"""
+    return dataclasses.replace(settings, server=dataclasses.replace(settings.server, **changes))
+
+
+Transform = Callable[[AppSettings], AppSettings]
+Callback = Callable[[Any, Any], Any]
+
 
 class Settings:
-    def __init__(self):
-        self.config_path = Path("config/config.yaml")
-        self.config = self._load_config()
-        
-    def _load_config(self):
-        if not self.config_path.exists():
+    """
+    进程内共享的配置
+
+    Args:
+        path: 配置文件路径，None表示不读取文件
+        data: 不读取文件时使用的配置字典
+        transforms: 每次解析后依次应用的修改，如命令行参数覆盖、各工作进程独立的目录；
+            重新加载后同样应用。多进程启动时需可被pickle
+    """
+
+    def __init__(self, path: Union[str, Path, None] = DEFAULT_PATH,
+                 data: Optional[Dict[str, Any]] = None,
+                 transforms: Tuple[Transform, ...] = ()):
+        self.path = Path(path) if path is not None else None
+        self.transforms = tuple(transforms)
+        self.logger = logging.getLogger('Settings')
+        self._subscribers: List[Tuple[str, Callback]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._callbacks: Set[asyncio.Task] = set()     # 尚未完成的协程回调，持有引用避免被回收
+        self._stamp = self._pending = self._file_stamp()
+        if self.path is not None:
+            data = self._read()
+        self.config: Dict[str, Any] = data or {}    # 最近一次成功解析的原始字典
+        self.current: AppSettings = self._apply(AppSettings.from_dict(self.config))
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        if self.path is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Dict[str, Any]:
+        if not self.path.exists():
             return {}
-        with open(self.config_path) as f:
-            return yaml.safe_load(f)
\ No newline at end of file
+        with open(self.path, encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+
+    def _apply(self, settings: AppSettings) -> AppSettings:
+        for transform in self.transforms:
+            settings = transform(settings)
+        return settings
+
+    def add_transform(self, transform: Transform):
+        """追加一个修改并立即应用到当前配置，不通知订阅者，用于启动时"""
+        self.transforms += (transform,)
+        self.current = transform(self.current)
+
+    def derive(self, transform: Transform) -> 'Settings':
+        """同一配置文件上再加一个修改的新实例，不共享订阅者"""
+        return Settings(self.path, None if self.path else self.config, self.transforms + (transform,))
+
+    def subscribe(self, path: str, callback: Callback) -> Callable[[], None]:
+        """
+        订阅某一路径的配置变化，返回取消订阅的函数
+
+        Args:
+            path: 'game'、'game.max_sessions'、'logging.level'等
+            callback: 值有变化时以(新值, 旧值)调用，可为协程函数
+        """
+        entry = (path, callback)
+        self._subscribers.append(entry)
+        return lambda: self._subscribers.remove(entry) if entry in self._subscribers else None
+
+    def reload(self) -> bool:
+        """重新解析配置文件并替换当前配置，失败时保留原配置，返回是否有变化"""
+        try:
+            data = self._read()
+            settings = self._apply(AppSettings.from_dict(data))
+        except (OSError, yaml.YAMLError, SettingsError) as e:
+            self.logger.error(f"配置重新加载失败，保留原配置: {e}")
+            return False
+        previous, self.current, self.config = self.current, settings, data
+        if settings == previous:
+            return False
+        for path in RESTART_REQUIRED:
+            if resolve(settings, path) != resolve(previous, path):
+                self.logger.warning(f"配置项{path}已修改，需重启进程才能生效")
+        self.logger.info("配置已重新加载")
+        self._notify(settings, previous)
+        return True
+
+    def _notify(self, settings: AppSettings, previous: AppSettings):
+        for path, callback in list(self._subscribers):
+            new, old = resolve(settings, path), resolve(previous, path)
+            if new == old:
+                continue
+            try:
+                result = callback(new, old)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.ensure_future(result)
+                    self._callbacks.add(task)
+                    task.add_done_callback(functools.partial(self._callback_done, path))
+            except Exception as e:
+                self.logger.error(f"应用配置{path}失败: {e}", exc_info=True)
+
+    def _callback_done(self, path: str, task: asyncio.Task):
+        """协程回调结束：释放引用并记录其异常"""
+        self._callbacks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.logger.error(f"应用配置{path}失败: {error}", exc_info=error)
+
+    def check(self) -> bool:
+        """
+        文件修改时间或大小变化后重新加载，返回是否已重新加载
+        连续两次检查看到相同的修改时间才读取，避免读到正在写入的文件
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            self._pending = stamp
+            return False
+        if stamp != self._pending:
+            self._pending = stamp
+            return False
+        self._stamp = stamp
+        self.reload()
+        return True
+
+    async def watch(self):
+        """按server.reload_interval定期检查配置文件，间隔为0时停止"""
+        while (interval := self.current.server.reload_interval) > 0:
+            await asyncio.sleep(interval)
+            self.check()
+
+    def start_watching(self):
+        if self.path is not None and self._task is None and self.current.server.reload_interval > 0:
+            self._task = asyncio.create_task(self.watch())
+
+    async def stop_watching(self):
+        """停止检查配置文件，并等待仍在执行的协程回调"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._callbacks:
+            await asyncio.gather(*self._callbacks, return_exceptions=True)
+
+
+_shared: Optional[Settings] = None
+
+
+def get_settings(path: Union[str, Path, None] = None) -> Settings:
+    """
+    进程内共享的配置，首次调用时解析
+
+    Raises:
+        SettingsError: 已按其他路径解析过配置
+    """
+    global _shared
+    if _shared is None:
+        _shared = Settings(path or DEFAULT_PATH)
+    elif path is not None and Path(path).resolve() != _shared.path.resolve():
+        raise SettingsError(f"配置已从{_shared.path}加载，不能再使用{path}")
+    return _shared
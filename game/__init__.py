@@ -7,41 +7,64 @@
 """
 Module for main game progress
 主游戏逻辑模块，包含核心游戏系统组件
+
+导出的组件在首次访问时才导入所在的子模块：只用到game.simulation的模拟工作进程
+不会因为导入本包而加载aiohttp等服务器依赖。
 """
 
+import importlib
+import logging
+from typing import TYPE_CHECKING
+
 __version__ = '0.1.0'
 __author__ = 'Zubmarine & Icecube'
 
-# 导出核心组件
-from .events import GameEvent, GameEventType, EventDispatcher
-from .state import GameState
-from .session import GameSession
-from .manager import GameManager
-from .server import GameServer
-from .combat import CombatSystem
-from .cards import Card
-from .character import Character
-from .traits import Trait
-
-__all__ = [
-    'GameEvent',
-    'GameEventType',
-    'EventDispatcher',
-    'GameState',
-    'GameSession',
-    'GameManager',
-    'GameServer',
-    'CombatSystem',
-    'Card',
-    'Character',
-    'Trait'
-]
+# 导出核心组件：名称 -> 所在子模块
+_EXPORTS = {
+    'GameEvent': 'events',
+    'GameEventType': 'events',
+    'EventDispatcher': 'events',
+    'GameState': 'state',
+    'GameSession': 'session',
+    'GameManager': 'manager',
+    'GameServer': 'server',
+    'CombatSystem': 'combat',
+    'Card': 'cards',
+    'Character': 'character',
+    'Trait': 'traits',
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .events import GameEvent, GameEventType, EventDispatcher
+    from .state import GameState
+    from .session import GameSession
+    from .manager import GameManager
+    from .server import GameServer
+    from .combat import CombatSystem
+    from .cards import Card
+    from .character import Character
+    from .traits import Trait
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # 缓存到包的命名空间，之后的访问不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
 
 # 配置日志
-import logging
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 def get_version():
     """返回当前版本号"""
     return __version__
-
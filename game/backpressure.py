@@ -0,0 +1,190 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file backpressure.py
+#
+
+"""
+/game 连接路径上的背压
+会话事件队列与每个连接的发送队列都有上限，超出时按配置的策略处理：
+
+    drop        丢弃新消息
+    coalesce    合并：会话队列把新事件并入同一玩家排队中的同类事件，无法合并时丢弃；
+                发送队列把积压的回复替换为一次全量快照（或重新同步通知）
+    disconnect  断开该连接
+
+每个连接的入站消息经令牌桶限速，回复由独立的写任务发出，接收循环不再等待慢速的读端。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from .metrics import METRICS
+
+DROP = 'drop'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP, COALESCE, DISCONNECT)
+
+# 过载时关闭连接使用的WebSocket关闭码（WSCloseCode.TRY_AGAIN_LATER），
+# 会话模块也依赖本模块，不在这里引入aiohttp
+TRY_AGAIN_LATER = 1013
+# 会话已超时结束时关闭连接使用的关闭码（WSCloseCode.GOING_AWAY）
+GOING_AWAY = 1001
+
+
+class QueueOverflow(Exception):
+    """队列已满且策略为断开连接"""
+
+
+def check_policy(policy: str, allowed=POLICIES) -> str:
+    """校验溢出策略"""
+    if policy not in allowed:
+        raise ValueError(f"未知的溢出策略: {policy}，可选 {', '.join(allowed)}")
+    return policy
+
+
+class TokenBucket:
+    """令牌桶：平均每秒rate条，允许burst条的突发"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """取一个令牌，桶空时返回False"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ConnectionWriter:
+    """
+    连接的发送端
+    回复先进入发送队列，由独立任务逐条编码写出；队列长度达到高水位时按策略处理。
+    coalesce策略下积压的回复全部丢弃，换成溢出时生成的一次全量快照，之后的增量仍按版本顺序；
+    未提供resync时换成重新同步通知，由客户端带版本号请求STATE_RESYNC。
+
+    Args:
+        ws: WebSocket连接
+        codec: 握手时协商的编解码器
+        high_water: 发送队列的高水位（条）
+        overflow: 溢出策略
+        resync: 生成全量快照的函数，通常为GameSession.resync
+    """
+
+    def __init__(self, ws, codec, high_water: int = 256, overflow: str = COALESCE,
+                 resync: Optional[Callable[[], Dict[str, Any]]] = None):
+        self.ws = ws
+        self.codec = codec
+        self.high_water = max(high_water, 1)
+        self.overflow = check_policy(overflow)
+        self.resync = resync
+        self.queue: Deque[Any] = deque()
+        self.dropped = 0            # 丢弃或被合并掉的回复数
+        self.closed = False
+        self.logger = logging.getLogger('ConnectionWriter')
+        self._finish: Optional[tuple] = None     # 写完队列后关闭连接使用的(关闭码, 原因)
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def send(self, obj: Dict[str, Any]) -> bool:
+        """放入发送队列，不等待写出，返回是否已放入"""
+        if self.closed or self._finish is not None:
+            return False
+        if len(self.queue) >= self.high_water:
+            return self._overflow()
+        self.queue.append(obj)
+        self._ready.set()
+        return True
+
+    async def send_result(self, result: Dict[str, Any]):
+        """作为会话订阅回调"""
+        self.send(result)
+
+    def _overflow(self) -> bool:
+        if self.overflow == DISCONNECT:
+            METRICS.backpressure('send_queue', DISCONNECT)
+            self.abort()
+            return False
+        if self.overflow == COALESCE:
+            METRICS.backpressure('send_queue', COALESCE)
+            # 触发溢出的回复已包含在快照中
+            self.dropped += len(self.queue) + 1
+            self.queue.clear()
+            self.queue.append(self._coalesced())
+            self._ready.set()
+            return True
+        METRICS.backpressure('send_queue', DROP)
+        self.dropped += 1
+        return False
+
+    def _coalesced(self) -> Dict[str, Any]:
+        if self.resync is not None:
+            reply = self.resync()
+        else:
+            reply = {'resync_required': True}
+        reply['coalesced'] = self.dropped
+        return reply
+
+    async def _run(self):
+        try:
+            while True:
+                while not self.queue:
+                    if self._finish is not None:
+                        code, message = self._finish
+                        await self.ws.close(code=code, message=message)
+                        self.closed = True
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                obj = self.queue.popleft()
+                await self.codec.send(self.ws, obj)
+                METRICS.messages_out += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接已断开，之后的回复直接丢弃
+            self.logger.debug(f"写出失败: {e}")
+            self.closed = True
+            self.queue.clear()
+
+    def abort(self):
+        """读端过慢，停止写出并断开连接"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._task.cancel()
+        asyncio.ensure_future(self.ws.close(code=TRY_AGAIN_LATER, message=b'slow reader'))
+
+    def finish(self, code: int, message: bytes):
+        """写完已排队的回复后关闭连接，之后的回复不再放入队列"""
+        if self.closed or self._finish is not None:
+            return
+        self._finish = (code, message)
+        self._ready.set()
+
+    async def close(self, timeout: float = 1.0):
+        """尽量写完已排队的回复（以及finish要求的关闭）后停止写任务"""
+        if not self.closed and (self.queue or self._finish is not None):
+            deadline = time.monotonic() + timeout
+            while (self.queue or self._finish is not None) and not self._task.done() \
+                    and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        self.closed = True
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
@@ -1,11 +1,199 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file cards.py
+#
+
+"""
+卡牌
+卡牌定义在全局注册表中只保存一份，并按注册顺序分配整数编号；牌堆、手牌与弃牌堆
+只保存编号，存放在紧凑的整数数组中。卡牌效果在注册时展开为事件分发条目，
+出牌时按条目直接触发事件。
+
+编号会写入会话快照与对局日志，新卡牌只能追加注册，不能调整已有卡牌的注册顺序。
+"""
+
+import random
+from array import array
 from dataclasses import dataclass
-from typing import List, Callable, Optional
-from .events import GameEventType
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .events import GameEventType, GameEvent
+
+CARD_TYPECODE = 'H'     # 无符号16位，最多65536种卡牌
 
-@dataclass
+
+class CardEffect(NamedTuple):
+    """卡牌效果：出牌时触发的事件"""
+    event_type: GameEventType
+    data: Dict[str, Any] = {}
+    on_target: bool = False     # 作用于出牌时指定的目标，否则作用于出牌者
+
+
+@dataclass(frozen=True)
 class Card:
     id: str
     name: str
     description: str
-    effects: List[Callable]
-    
\ No newline at end of file
+    effects: Tuple[CardEffect, ...] = ()
+
+
+# 分发条目：(事件类型, 事件数据模板, 是否作用于目标)
+DispatchEntry = Tuple[GameEventType, Dict[str, Any], bool]
+
+
+class CardRegistry:
+    """卡牌注册表：每种卡牌只保存一份定义，以整数编号索引"""
+
+    def __init__(self):
+        self.cards: List[Card] = []
+        self.numbers: Dict[str, int] = {}
+        self.entries: List[Tuple[DispatchEntry, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __getitem__(self, number: int) -> Card:
+        return self.cards[number]
+
+    def register(self, card: Card) -> int:
+        """注册卡牌并返回编号，重复注册同一定义时返回已有编号"""
+        number = self.numbers.get(card.id)
+        if number is not None:
+            if self.cards[number] != card:
+                raise ValueError(f"卡牌{card.id}已注册为不同的定义")
+            return number
+        number = len(self.cards)
+        if number > 0xFFFF:
+            raise ValueError("卡牌种类超过编号上限")
+        self.cards.append(card)
+        self.numbers[card.id] = number
+        self.entries.append(tuple(
+            (effect.event_type, dict(effect.data), effect.on_target) for effect in card.effects
+        ))
+        return number
+
+    def number(self, card_id: str) -> int:
+        """卡牌ID对应的编号"""
+        return self.numbers[card_id]
+
+
+# 全局卡牌注册表
+CARDS = CardRegistry()
+
+
+def register_card(card_id: str, name: str, description: str,
+                  effects: Iterable[CardEffect] = ()) -> int:
+    """在全局注册表中注册卡牌，返回编号"""
+    return CARDS.register(Card(card_id, name, description, tuple(effects)))
+
+
+class CardPile(array):
+    """
+    牌堆、手牌或弃牌堆：卡牌编号的紧凑数组，末尾为牌堆顶
+    抽牌与放回都在末尾进行，均为O(1)。
+    """
+    __slots__ = ()
+
+    def __new__(cls, cards: Iterable[int] = ()):
+        return super().__new__(cls, CARD_TYPECODE, cards)
+
+    def draw(self) -> Optional[int]:
+        """从牌堆顶抽一张，牌堆为空时返回None"""
+        return self.pop() if self else None
+
+    def draw_many(self, count: int) -> List[int]:
+        """从牌堆顶依次抽至多count张"""
+        count = min(count, len(self))
+        if count <= 0:
+            return []
+        # 逆序切片一次得到抽牌顺序
+        drawn = self[:-count - 1:-1].tolist()
+        del self[-count:]
+        return drawn
+
+    def shuffle(self, rng: random.Random):
+        """
+        用给定的随机数流原地洗牌
+        数组按下标交换元素较慢，先转为列表洗牌再写回；与直接洗牌得到相同的排列，
+        对局日志重放结果不变
+        """
+        cards = self.tolist()
+        rng.shuffle(cards)
+        del self[:]
+        self.fromlist(cards)
+
+    def take(self, number: int) -> bool:
+        """移除一张指定编号的牌（用于手牌出牌），不存在时返回False"""
+        try:
+            self.remove(number)
+        except ValueError:
+            return False
+        return True
+
+
+class CardSystem:
+    """
+    抽牌与出牌的结算
+
+    DRAW_CARD {'player', 'count'}: 从公共牌堆抽牌到手牌，牌堆抽空时把弃牌堆洗回牌堆
+    PLAY_CARD {'player', 'card', 'target'}: 从手牌打出，按卡牌的分发条目触发效果事件后进入弃牌堆
+    """
+
+    def __init__(self, game_state=None, registry: CardRegistry = CARDS):
+        self.registry = registry
+        self.game_state = game_state
+        if game_state is not None:
+            self.bind(game_state)
+
+    def bind(self, game_state):
+        """在对局的事件分发器上注册抽牌与出牌的结算"""
+        self.game_state = game_state
+        dispatcher = game_state.event_dispatcher
+        dispatcher.add_listener(GameEventType.DRAW_CARD, self._draw, priority=100)
+        dispatcher.add_listener(GameEventType.PLAY_CARD, self._play, priority=100)
+
+    def refill(self) -> bool:
+        """把弃牌堆洗回牌堆，洗牌使用对局的'deck'随机数流"""
+        state = self.game_state
+        if not state.discard:
+            return False
+        state.deck.extend(state.discard)
+        del state.discard[:]
+        state.deck.shuffle(state.rng.stream('deck'))
+        return True
+
+    async def _draw(self, event: GameEvent):
+        state = self.game_state
+        player_id = event.data.get('player')
+        character = state.players.get(player_id)
+        if character is None:
+            return
+        count = int(event.data.get('count', 1))
+        drawn = state.deck.draw_many(count)
+        if len(drawn) < count and self.refill():
+            drawn += state.deck.draw_many(count - len(drawn))
+        character.hand.extend(drawn)
+        event.data['drawn'] = len(drawn)
+        state.mark_player_dirty(player_id, 'hand')
+
+    async def _play(self, event: GameEvent):
+        state = self.game_state
+        player_id = event.data.get('player')
+        character = state.players.get(player_id)
+        number = event.data.get('card')
+        if isinstance(number, str):
+            number = self.registry.numbers.get(number)
+        if character is None or number is None or not character.hand.take(number):
+            event.cancel = True
+            return
+        state.mark_player_dirty(player_id, 'hand')
+        target = event.data.get('target', player_id)
+        dispatcher = state.event_dispatcher
+        for event_type, template, on_target in self.registry.entries[number]:
+            data = dict(template)
+            data['player'] = target if on_target else player_id
+            data['source'] = player_id
+            data['card'] = number
+            await dispatcher.fire_event(event_type, data)
+        state.discard.append(number)
@@ -8,9 +8,9 @@
 None
 """
 
-from dataclasses import dataclass
 from enum import Enum
-from typing import Set, List, Dict, Union
+from typing import Dict, FrozenSet, NamedTuple, Optional, Set, Tuple, Type, Union
+from .cards import CardPile
 from .traits import TraitManager
 
 
@@ -48,32 +48,146 @@ class MPModule(Enum):
     AGENT_ = [-1, 0, 5]
 
 
-@dataclass
+class TableStat:
+    """
+    角色数值描述符
+    未绑定时值保存在实例的slot中；绑定到会话级的CombatantTable后读写其中的数组，
+    Character对象即成为该存储的一个视图。
+    """
+
+    def __init__(self, column: int):
+        self.column = column
+
+    def __set_name__(self, owner, name: str):
+        # 本地存储为同名加下划线的slot
+        self.local = owner.__dict__['_' + name]
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        table = obj._table
+        if table is None:
+            return self.local.__get__(obj, objtype)
+        return table.get(self.column, obj._slot)
+
+    def __set__(self, obj, value):
+        table = obj._table
+        if table is None:
+            self.local.__set__(obj, value)
+        else:
+            table.set(self.column, obj._slot, value)
+
+
+# CombatantTable中各数值的列号
+STAT_COLUMNS = ('hp', 'hp_max', 'attack', 'defense', 'is_alive')
+
+
+class CharacterPrototype(NamedTuple):
+    """角色原型：模块叠加后的最终数值，每种(角色, 模块)只计算一次"""
+    name: str
+    hp_max: int
+    attack: int
+    defense: int
+    mp_max: int
+    mp_restore: int
+    mp_restore_cd: int
+    traits: FrozenSet
+
+
+_prototypes: Dict[Tuple[type, Module], CharacterPrototype] = {}
+
+
+def get_prototype(cls: Type['Character'], module: Optional[Module] = None) -> CharacterPrototype:
+    """取得角色类在指定模块下的原型，首次使用时计算并缓存"""
+    module = module or cls.MODULE
+    key = (cls, module)
+    prototype = _prototypes.get(key)
+    if prototype is None:
+        hp_max, attack, defense = module.value
+        mp_max = mp_restore = mp_restore_cd = 0
+        if cls.MP_MODULE is not None:
+            mp_max, mp_restore, mp_restore_cd = cls.MP_MODULE.value
+        prototype = CharacterPrototype(
+            cls.NAME, hp_max, attack, defense,
+            mp_max, mp_restore, mp_restore_cd, frozenset(cls.TRAITS),
+        )
+        _prototypes[key] = prototype
+    return prototype
+
+
 class Character():
-    def __init__(self, module_type: str):
-        self.team: int = 0              # 队伍编号
-
-        self.name: str = ""             # 角色名
-        self.traits: Set[str] = {}      #
-        self.is_alive: bool = True      #
-
-        self.hp_max: int = Module[module_type].value[0]
-        self.hp: int = self.hp_max
-        self.attack: int = Module[module_type].value[1]
-        self.defense: int = Module[module_type].value[2]
-
-        self.mp_max: int = 0            #
-        self.mp: int = 0                #
-        self.mp_restore: int = 0        #
-        self.mp_restore_cd: int = 0     #
-        
-        self.hand: List[str] = []       #
-        self.skill_max: int = 2         #
-        self.skills: Set[str] = {}      #
-        self.cooldowns: Dict[str, int] = {}                     #
-        self.statuses: Dict[Dict[str, Union[int, bool]]] = {}   #
-
-    async def module_apply(self, module: Union[Module, MPModule]):
+    __slots__ = (
+        'team', 'name', 'traits', '_is_alive',
+        '_hp_max', '_hp', '_attack', '_defense',
+        'mp_max', 'mp', 'mp_restore', 'mp_restore_cd',
+        'hand', 'skill_max', 'skills', '_cooldowns', '_statuses',
+        '_table', '_slot',
+    )
+
+    # 由子类定义的角色数据
+    NAME: str = ""
+    MODULE: Optional[Module] = None
+    MP_MODULE: Optional[MPModule] = None
+    TRAITS: Tuple = ()
+
+    def __init__(self, module_type: Union[str, Module, None] = None):
+        if isinstance(module_type, str):
+            module_type = Module[module_type]
+        # 按原型初始化，数值直接写入slot
+        prototype = get_prototype(type(self), module_type)
+        self._table = None                      # 绑定的CombatantTable
+        self._slot = -1                         # 在CombatantTable中的位置
+        self.team: int = 0                      # 队伍编号
+
+        self.name: str = prototype.name         # 角色名
+        self.traits: FrozenSet = prototype.traits   # 特质，同一原型的实例共享
+        self._is_alive = True
+
+        self._hp_max = prototype.hp_max
+        self._hp = prototype.hp_max
+        self._attack = prototype.attack
+        self._defense = prototype.defense
+
+        self.mp_max: int = prototype.mp_max
+        self.mp: int = 0
+        self.mp_restore: int = prototype.mp_restore
+        self.mp_restore_cd: int = prototype.mp_restore_cd
+
+        self.hand: CardPile = CardPile()       # 手牌的卡牌编号
+        self.skill_max: int = 2
+        self.skills: Set[str] = set()
+        self._cooldowns: Optional[Dict[str, int]] = None
+        self._statuses: Optional[Dict[str, Dict[str, Union[int, bool]]]] = None
+
+    hp = TableStat(0)
+    hp_max = TableStat(1)
+    attack = TableStat(2)
+    defense = TableStat(3)
+    is_alive = TableStat(4)
+
+    @property
+    def cooldowns(self) -> Dict[str, int]:
+        """技能冷却，首次使用时创建"""
+        if self._cooldowns is None:
+            self._cooldowns = {}
+        return self._cooldowns
+
+    @cooldowns.setter
+    def cooldowns(self, value: Dict[str, int]):
+        self._cooldowns = value
+
+    @property
+    def statuses(self) -> Dict[str, Dict[str, Union[int, bool]]]:
+        """状态效果，首次使用时创建"""
+        if self._statuses is None:
+            self._statuses = {}
+        return self._statuses
+
+    @statuses.setter
+    def statuses(self, value: Dict[str, Dict[str, Union[int, bool]]]):
+        self._statuses = value
+
+    def module_apply(self, module: Union[Module, MPModule]):
         if isinstance(module, Module):
             self.hp_max += module.value[0]
             self.attack += module.value[1]
@@ -91,15 +205,21 @@ class Character():
 
 
 class YinZhu(Character):
-    def __init__(self):
-        self.name = "茵竹"
-        self.module_apply(Module.HP)
-        self.module_apply(MPModule.HUMUS_HUMAN)
-        self.traits = {TraitManager.SELF_ENCOURAGEMENT}
+    __slots__ = ()
+    NAME = "茵竹"
+    MODULE = Module.HP
+    MP_MODULE = MPModule.HUMUS_HUMAN
+    TRAITS = (TraitManager.SELF_ENCOURAGEMENT,)
 
 class NekaoHewish(Character):
-    def __init__(self):
-        self.name = "妮卡欧·希纬什"
-        self.module_apply(Module.BALANCE)
-        self.module_apply(MPModule.HUMUS_HUMAN)
-        self.traits = {TraitManager.TIRELESS_OBSERVER, TraitManager.CLEAR_PATH_TO_COME}
\ No newline at end of file
+    __slots__ = ()
+    NAME = "妮卡欧·希纬什"
+    MODULE = Module.BALANCE
+    MP_MODULE = MPModule.HUMUS_HUMAN
+    TRAITS = (TraitManager.TIRELESS_OBSERVER, TraitManager.CLEAR_PATH_TO_COME)
+
+
+# 角色注册表：角色类名 -> 角色类
+CHARACTERS: Dict[str, Type[Character]] = {
+    cls.__name__: cls for cls in (YinZhu, NekaoHewish)
+}
@@ -1,11 +1,105 @@
 import logging
 import random
+from typing import Optional
+
 from .events import GameEventType, GameEvent
 
 class CombatSystem:
-    def __init__(self):
+    def __init__(self, game_state=None, rng: Optional[random.Random] = None, dice_sides: int = 6):
         self.logger = logging.getLogger('CombatSystem')
-    
-    async def attack(self, attacker, target):
-        """执行攻击"""
-        pass
+        self.game_state = game_state
+        self.rng = rng      # 未指定时使用对局的'combat'随机数流
+        self.dice_sides = dice_sides
+        if game_state is not None:
+            self.bind(game_state)
+        elif self.rng is None:
+            self.rng = random.Random()
+
+    def bind(self, game_state):
+        """在对局的事件分发器上注册伤害与治疗的结算"""
+        self.game_state = game_state
+        dispatcher = game_state.event_dispatcher
+        # 结算优先级高于特质，特质处理DAMAGE_APPLY时看到的是结算后的生命值
+        dispatcher.add_listener(GameEventType.DAMAGE_APPLY, self._apply_damage, priority=100)
+        dispatcher.add_listener(GameEventType.HEAL_APPLY, self._apply_heal, priority=100)
+
+    def roll_dice(self) -> int:
+        """掷骰"""
+        if self.rng is None:
+            # 首次掷骰时才派生随机数流，不掷骰的对局快照中不带随机数状态
+            self.rng = self.game_state.rng.stream('combat')
+        return self.rng.randint(1, self.dice_sides)
+
+    @staticmethod
+    def calculate_damage(attack: int, defense: int, roll: int) -> int:
+        """伤害 = 攻击 × 点数 - 防御，最低为0"""
+        return max(attack * roll - defense, 0)
+
+    async def attack(self, attacker, target) -> int:
+        """
+        执行攻击：PRE_ATTACK -> DICE_ROLL -> DAMAGE_CALC -> DAMAGE_APPLY
+
+        Args:
+            attacker: 攻击方玩家id
+            target: 目标玩家id
+
+        Returns:
+            实际造成的伤害
+        """
+        dispatcher = self.game_state.event_dispatcher
+        players = self.game_state.players
+
+        event = await dispatcher.fire_event(GameEventType.PRE_ATTACK, {'player': attacker, 'target': target})
+        if event.cancel:
+            return 0
+
+        event = await dispatcher.fire_event(GameEventType.DICE_ROLL, {'player': attacker, 'roll': self.roll_dice()})
+        roll = event.data['roll']
+
+        damage = self.calculate_damage(players[attacker].attack, players[target].defense, roll)
+        event = await dispatcher.fire_event(
+            GameEventType.DAMAGE_CALC, {'player': target, 'source': attacker, 'damage': damage}
+        )
+        if event.cancel:
+            return 0
+
+        event = await dispatcher.fire_event(
+            GameEventType.DAMAGE_APPLY, {'player': target, 'source': attacker, 'damage': event.data['damage']}
+        )
+        return 0 if event.cancel else event.data['damage']
+
+    def _resolve_player(self, player):
+        """事件数据中的玩家可以是id或角色对象，返回 (id, 角色)"""
+        players = self.game_state.players
+        if isinstance(player, str):
+            return player, players.get(player)
+        for player_id, character in players.items():
+            if character is player:
+                return player_id, character
+        return None, None
+
+    async def _apply_damage(self, event: GameEvent):
+        if event.data.get('applied'):
+            # 批量结算已直接写入数值，此时事件仅作通知
+            return
+        player_id, character = self._resolve_player(event.data.get('player'))
+        if character is None:
+            return
+        # 负伤害不能用来加血
+        damage = max(int(event.data.get('damage', 0)), 0)
+        character.hp = max(character.hp - damage, 0)
+        self.game_state.mark_player_dirty(player_id, 'hp', 'is_alive')
+        if character.hp == 0 and character.is_alive:
+            character.is_alive = False
+            await self.game_state.event_dispatcher.fire_event(
+                GameEventType.CHARACTER_DEATH, {'player': player_id}
+            )
+
+    async def _apply_heal(self, event: GameEvent):
+        player_id, character = self._resolve_player(event.data.get('player'))
+        if character is None or not character.is_alive:
+            return
+        # 负治疗不能用来扣血
+        heal = max(int(event.data.get('hp', 0)), 0)
+        character.hp = min(character.hp + heal, character.hp_max)
+        self.game_state.mark_player_dirty(player_id, 'hp')
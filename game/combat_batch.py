@@ -0,0 +1,198 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file combat_batch.py
+#
+
+"""
+结构数组（SoA）战斗结算，依赖NumPy
+会话内所有参战角色的数值保存在一个二维数组中（每行一种数值），
+掷骰、伤害计算与伤害应用对多组攻击方/目标一次完成。
+绑定后的Character对象通过TableStat描述符读写该数组，原有的逐对象API不变。
+掷骰使用由对局随机数流派生的生成器，同一种子的对局结果相同。
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .character import STAT_COLUMNS, Character
+from .events import GameEventType
+
+HP, HP_MAX, ATTACK, DEFENSE, ALIVE = range(len(STAT_COLUMNS))
+
+
+class CombatantTable:
+    """会话级参战角色数值表"""
+
+    def __init__(self, capacity: int = 16):
+        self.data = np.zeros((len(STAT_COLUMNS), capacity), dtype=np.int64)
+        self.size = 0
+        self.player_ids: List[Optional[str]] = []
+        self.characters: List[Optional[Character]] = []
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, column: int, slot: int):
+        value = self.data[column, slot]
+        return bool(value) if column == ALIVE else int(value)
+
+    def set(self, column: int, slot: int, value):
+        self.data[column, slot] = value
+
+    def _grow(self, capacity: int):
+        data = np.zeros((len(STAT_COLUMNS), capacity), dtype=np.int64)
+        data[:, :self.size] = self.data[:, :self.size]
+        self.data = data
+
+    def add(self, character: Character, player_id: Optional[str] = None) -> int:
+        """把角色的数值移入表中，之后角色的数值读写都作用在表上"""
+        if character._table is not None:
+            raise ValueError("角色已绑定到其他数值表")
+        if self.size == self.data.shape[1]:
+            self._grow(self.size * 2)
+        slot = self.size
+        self.data[:, slot] = [getattr(character, name) for name in STAT_COLUMNS]
+        character._table = self
+        character._slot = slot
+        self.player_ids.append(player_id)
+        self.characters.append(character)
+        self.size += 1
+        return slot
+
+    def remove(self, character: Character):
+        """把数值还给角色对象并解除绑定，表中的位置标记为阵亡"""
+        slot = character._slot
+        values = [self.get(column, slot) for column in range(len(STAT_COLUMNS))]
+        character._table = None
+        character._slot = -1
+        for name, value in zip(STAT_COLUMNS, values):
+            setattr(character, name, value)
+        self.data[ALIVE, slot] = 0
+        self.player_ids[slot] = None
+        self.characters[slot] = None
+
+
+class BatchCombat:
+    """
+    批量战斗结算
+
+    对应逐次结算的 PRE_ATTACK -> DICE_ROLL -> DAMAGE_CALC -> DAMAGE_APPLY：
+    某事件类型有监听器时逐对分发以保留其效果，否则完全向量化。
+    同一批攻击视为同时结算；之后的DAMAGE_APPLY只作为通知（data['applied']为True），
+    每个受击目标触发一次，伤害为本批合计。
+    """
+
+    def __init__(self,
+                 table: CombatantTable,
+                 game_state=None,
+                 rng: Optional[np.random.Generator] = None,
+                 dice_sides: int = 6):
+        """
+        Args:
+            rng: 掷骰的生成器；未指定时每批由对局的'combat_batch'随机数流派生，
+                生成器本身不需随快照保存，未绑定对局时必须指定
+        """
+        if rng is None and game_state is None:
+            raise ValueError("未绑定对局时需指定随机数生成器")
+        self.table = table
+        self.game_state = game_state
+        self.rng = rng
+        self.dice_sides = dice_sides
+
+    def _generator(self) -> np.random.Generator:
+        if self.rng is not None:
+            return self.rng
+        seed = self.game_state.rng.stream('combat_batch').getrandbits(64)
+        return np.random.default_rng(seed)
+
+    def _listening(self, event_type: GameEventType):
+        """有监听器时返回事件分发器"""
+        if self.game_state is None:
+            return None
+        dispatcher = self.game_state.event_dispatcher
+        return dispatcher if dispatcher.has_listeners(event_type) else None
+
+    async def resolve(self, attackers: Sequence[int], targets: Sequence[int]) -> np.ndarray:
+        """
+        结算一批攻击
+
+        Args:
+            attackers: 攻击方在表中的位置
+            targets: 目标在表中的位置，与attackers一一对应
+
+        Returns:
+            每组攻击实际造成的伤害
+        """
+        table = self.table
+        data = table.data
+        ids = table.player_ids
+        attackers = np.asarray(attackers, dtype=np.intp)
+        targets = np.asarray(targets, dtype=np.intp)
+        valid = (data[ALIVE, attackers] > 0) & (data[ALIVE, targets] > 0)
+
+        dispatcher = self._listening(GameEventType.PRE_ATTACK)
+        if dispatcher:
+            for i in np.flatnonzero(valid):
+                event = await dispatcher.fire_event(
+                    GameEventType.PRE_ATTACK, {'player': ids[attackers[i]], 'target': ids[targets[i]]}
+                )
+                valid[i] = not event.cancel
+
+        rolls = self._generator().integers(1, self.dice_sides + 1, size=len(attackers))
+        dispatcher = self._listening(GameEventType.DICE_ROLL)
+        if dispatcher:
+            for i in np.flatnonzero(valid):
+                event = await dispatcher.fire_event(
+                    GameEventType.DICE_ROLL, {'player': ids[attackers[i]], 'roll': int(rolls[i])}
+                )
+                rolls[i] = event.data['roll']
+
+        damage = np.maximum(data[ATTACK, attackers] * rolls - data[DEFENSE, targets], 0)
+        damage[~valid] = 0
+
+        dispatcher = self._listening(GameEventType.DAMAGE_CALC)
+        if dispatcher:
+            for i in np.flatnonzero(valid):
+                event = await dispatcher.fire_event(
+                    GameEventType.DAMAGE_CALC,
+                    {'player': ids[targets[i]], 'source': ids[attackers[i]], 'damage': int(damage[i])}
+                )
+                damage[i] = 0 if event.cancel else event.data['damage']
+
+        # 同一目标可能在一批中被多次攻击，按目标累加
+        hp = data[HP, :table.size]
+        np.subtract.at(hp, targets, damage)
+        np.maximum(hp, 0, out=hp)
+        alive = data[ALIVE, :table.size]
+        died = np.flatnonzero((hp == 0) & (alive > 0))
+        alive[died] = 0
+
+        await self._notify(targets, damage, died)
+        return damage
+
+    async def _notify(self, targets: np.ndarray, damage: np.ndarray, died: np.ndarray):
+        """标记状态变化并分发DAMAGE_APPLY/CHARACTER_DEATH通知"""
+        if self.game_state is None:
+            return
+        ids = self.table.player_ids
+        hit = np.flatnonzero(damage > 0)
+        if not len(hit):
+            return
+        totals = np.bincount(targets[hit], weights=damage[hit], minlength=self.table.size)
+        hit_slots = np.flatnonzero(totals)
+        for slot in hit_slots:
+            self.game_state.mark_player_dirty(ids[slot], 'hp', 'is_alive')
+
+        dispatcher = self._listening(GameEventType.DAMAGE_APPLY)
+        if dispatcher:
+            for slot in hit_slots:
+                await dispatcher.fire_event(
+                    GameEventType.DAMAGE_APPLY,
+                    {'player': ids[slot], 'damage': int(totals[slot]), 'applied': True}
+                )
+        dispatcher = self._listening(GameEventType.CHARACTER_DEATH)
+        if dispatcher:
+            for slot in died:
+                await dispatcher.fire_event(GameEventType.CHARACTER_DEATH, {'player': ids[slot]})
@@ -1,10 +1,14 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 from dataclasses import dataclass, field
 
 @dataclass
 class GameCore:
-    """游戏核心组件容器，用于解决循环依赖"""
-    state: Any = None  # 将在运行时设置具体类型
+    """
+    游戏核心组件容器
+    各组件由创建方填入，组件之间经容器互相访问，不必在模块间互相导入；
+    本模块不导入其他游戏模块，可被任何模块引用而不形成循环导入。
+    """
+    state: Any = None
     combat_system: Any = None
     event_dispatcher: Any = None
     session_manager: Any = None
@@ -14,25 +18,3 @@ class GameCore:
     
     # 用于存储共享数据
     shared_data: Dict[str, Any] = field(default_factory=dict)
-
-    def __init__(self):
-        self._initialize()
-    
-    def _initialize(self):
-        """初始化核心组件"""
-        from .state import GameState
-        from .combat import CombatSystem
-        from .events import EventDispatcher, GameEventType
-        from .manager import GameManager
-        from .character import Character
-        from .traits import TraitManager
-        from .cards import Card
-        
-        self.event_dispatcher = EventDispatcher()
-        self.event_type = GameEventType()
-        self.state = GameState(core=self)
-        self.combat_system = CombatSystem(core=self)
-        self.session_manager = GameManager(core=self)
-        self.character = Character(core=self)
-        self.trait = TraitManager()
-        self.card = Card(core=self)
\ No newline at end of file
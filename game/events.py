@@ -1,9 +1,16 @@
 from enum import Enum, auto
-from dataclasses import dataclass, field
-from typing import Dict, Any, Optional, List, Callable, DefaultDict
+from typing import Dict, Any, Optional, List, Callable, NamedTuple, Tuple
+from collections import defaultdict
 from datetime import datetime
+from bisect import bisect_left
+import asyncio
+import itertools
+import time
 import uuid
 
+from .metrics import METRICS
+from .profiler import PROFILER
+
 class GameEventType(Enum):
     # 系统事件
     REGISTER = auto()
@@ -57,32 +64,235 @@ class GameEventType(Enum):
 
     SKILL_USE = auto()
     SKILL_CANCEL = auto()
-    SKILl_CD_MODIFIED = auto()
+    SKILL_CD_MODIFIED = auto()
+
+    # 同步相关事件
+    STATE_RESYNC = auto()
+
+
+# 单调时钟与墙钟的对应关系，用于按需把事件时间戳换算为datetime
+_CLOCK_ANCHOR = (time.time(), time.monotonic())
+# 未经EventPool创建的事件使用的全局序号
+_global_seq = itertools.count(1)
+# 事件类型枚举值 -> 分发耗时直方图
+_dispatch_histograms = METRICS.dispatch
 
 
-@dataclass
 class GameEvent:
-    event_id: str = field(default_factory=lambda: str(uuid.uuid4()))    # 事件id
-    event_time: datetime = field(default_factory=datetime.now)          # 事件时间
-    event_type: GameEventType                                   # 事件类型
-    data: Dict[str, Any] = field(default_factory=dict)          # 事件数据
-    cancel: bool = False                                    # 是否取消事件
-    result: Dict[str, Any] = field(default_factory=dict)    # 事件结果
-    error: Optional[str] = None                             # 错误信息  
+    """
+    游戏事件
+
+    使用__slots__减少内存占用；构造时只记录序号与单调时钟，
+    event_id(UUID)、event_time(datetime)与result只在首次读取时创建。
+    """
+
+    __slots__ = ('event_type', 'data', 'cancel', 'error', 'seq', 'stamp',
+                 '_event_id', '_event_time', '_result')
+
+    def __init__(self,
+                 event_type: GameEventType,
+                 data: Optional[Dict[str, Any]] = None,
+                 seq: Optional[int] = None):
+        self.event_type = event_type                            # 事件类型
+        self.data = data if data is not None else {}            # 事件数据
+        self.cancel = False                                     # 是否取消事件
+        self.error: Optional[str] = None                        # 错误信息
+        self.seq = seq if seq is not None else next(_global_seq)    # 事件序号
+        self.stamp = time.monotonic()                           # 单调时钟时间戳
+        self._event_id: Optional[str] = None
+        self._event_time: Optional[datetime] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    @property
+    def event_id(self) -> str:
+        """事件id，首次读取时生成"""
+        if self._event_id is None:
+            self._event_id = str(uuid.uuid4())
+        return self._event_id
+
+    @property
+    def event_time(self) -> datetime:
+        """事件时间，首次读取时由单调时钟换算"""
+        if self._event_time is None:
+            wall, mono = _CLOCK_ANCHOR
+            self._event_time = datetime.fromtimestamp(wall + (self.stamp - mono))
+        return self._event_time
+
+    @property
+    def result(self) -> Dict[str, Any]:
+        """事件结果，首次读取时创建"""
+        if self._result is None:
+            self._result = {}
+        return self._result
+
+    @result.setter
+    def result(self, value: Dict[str, Any]):
+        self._result = value
 
     def set_error(self, error: str):
         """设置错误信息"""
         self.error = error
         self.cancel = True
 
+    def __repr__(self) -> str:
+        return f"GameEvent(seq={self.seq}, event_type={self.event_type.name}, cancel={self.cancel})"
+
+
+class EventPool:
+    """
+    会话级事件池
+
+    为会话内事件分配单调递增的序号，并回收高频的内部事件对象以减少分配。
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._free: List[GameEvent] = []
+        self._seq = 0
+
+    def acquire(self, event_type: GameEventType, data: Optional[Dict[str, Any]] = None) -> GameEvent:
+        """取出一个事件对象，池为空时新建"""
+        self._seq += 1
+        if not self._free:
+            return GameEvent(event_type, data, self._seq)
+        event = self._free.pop()
+        event.event_type = event_type
+        event.data = data if data is not None else {}
+        event.cancel = False
+        event.error = None
+        event.seq = self._seq
+        event.stamp = time.monotonic()
+        event._event_id = None
+        event._event_time = None
+        event._result = None
+        return event
+
+    def release(self, event: GameEvent):
+        """归还事件对象，调用方之后不得再持有该事件"""
+        if len(self._free) < self.max_size:
+            event.data = None
+            event._result = None
+            self._free.append(event)
+
+
+class ListenerHandle(NamedTuple):
+    """add_listener返回的句柄，用于O(1)移除监听器"""
+    event_type: GameEventType
+    token: int
+
 
 class EventDispatcher:
-    def __init__(self):
-        self.listeners: Dict[GameEventType, List[Callable]] = DefaultDict(list)
+    """
+    事件分发器
+
+    每种事件类型维护一条按优先级排序的监听链（优先级高者先执行，同优先级按注册顺序），
+    监听器变动时才重建该类型的链；事件被取消后立即停止分发。
+    注册时指定owner的监听器只处理data['player']为该玩家的事件。
+    """
+
+    def __init__(self, pool: Optional[EventPool] = None):
+        self.pool = pool or EventPool()
+        # event_type -> {注册序号: (priority, 注册序号, listener, is_async, owner)}
+        self.listeners: Dict[GameEventType, Dict[int, Tuple[int, int, Callable, bool, Any]]] = defaultdict(dict)
+        # event_type -> ((listener, is_async, owner), ...)，缓存的已排序监听链
+        self._chains: Dict[GameEventType, Tuple[Tuple[Callable, bool, Any], ...]] = {}
+        self._counter = 0
+
+    def add_listener(self,
+                     event_type: GameEventType,
+                     listener: Callable,
+                     priority: int = 0,
+                     owner: Any = None) -> ListenerHandle:
+        """注册监听器，同步函数在分发时直接调用而不会被await"""
+        is_async = asyncio.iscoroutinefunction(listener)
+        token = self._counter
+        self._counter += 1
+        self.listeners[event_type][token] = (priority, token, listener, is_async, owner)
+        self._chains.pop(event_type, None)
+        return ListenerHandle(event_type, token)
+
+    def remove(self, handle: ListenerHandle) -> bool:
+        """按句柄移除监听器"""
+        entries = self.listeners.get(handle.event_type)
+        if not entries or entries.pop(handle.token, None) is None:
+            return False
+        self._chains.pop(handle.event_type, None)
+        return True
+
+    def remove_listener(self, event_type: GameEventType, listener: Callable) -> bool:
+        """移除监听器"""
+        entries = self.listeners.get(event_type)
+        if not entries:
+            return False
+        for token, entry in entries.items():
+            if entry[2] == listener:
+                return self.remove(ListenerHandle(event_type, token))
+        return False
+
+    def has_listeners(self, event_type: GameEventType) -> bool:
+        """是否有监听该事件类型的监听器"""
+        return bool(self.listeners.get(event_type))
+
+    def _build_chain(self, event_type: GameEventType) -> Tuple[Tuple[Callable, bool, Any], ...]:
+        """重建并缓存某事件类型的监听链"""
+        entries = sorted(self.listeners.get(event_type, {}).values(), key=lambda e: (-e[0], e[1]))
+        chain = tuple((entry[2], entry[3], entry[4]) for entry in entries)
+        self._chains[event_type] = chain
+        return chain
+
+    async def dispatch(self, event: GameEvent) -> GameEvent:
+        """按优先级分发事件，事件被取消后不再调用后续监听器；耗时按事件类型计入运行时指标"""
+        event_type = event.event_type
+        started = time.perf_counter()
+        try:
+            chain = self._chains.get(event_type)
+            if chain is None:
+                chain = self._build_chain(event_type)
+            if PROFILER.enabled:
+                # 剖析模式：逐个计时监听器，连锁事件记为嵌套span
+                await PROFILER.dispatch(event, chain)
+            else:
+                for listener, is_async, owner in chain:
+                    if event.cancel:
+                        break
+                    if owner is not None and owner != event.data.get('player'):
+                        continue
+                    if is_async:
+                        await listener(event)
+                    else:
+                        listener(event)
+        except BaseException:
+            METRICS.dispatch_failed(event_type, time.perf_counter() - started)
+            raise
+        # 直方图计数直接内联，避免热路径上的多层方法调用
+        elapsed = time.perf_counter() - started
+        histogram = _dispatch_histograms.get(event_type._value_)
+        if histogram is None:
+            histogram = METRICS.dispatch_histogram(event_type)
+        histogram.counts[bisect_left(histogram.bounds, elapsed)] += 1
+        histogram.sum += elapsed
+        return event
 
-    def add_listener(self, event_type: GameEventType, listener: Callable):
-        self.listeners[event_type].append(listener)
+    async def fire_event(self, event_type: GameEventType, data: Optional[Dict[str, Any]] = None) -> GameEvent:
+        """创建并分发事件；没有监听器时跳过分发"""
+        event = self.pool.acquire(event_type, data)
+        chain = self._chains.get(event_type)
+        if chain is None:
+            chain = self._build_chain(event_type)
+        if chain:
+            await self.dispatch(event)
+        return event
 
-    async def dispatch(self, event: GameEvent):
-        for listener in self.listeners.get(event.event_type, []):
-            await listener(event)
\ No newline at end of file
+    async def emit(self, event_type: GameEventType, data: Optional[Dict[str, Any]] = None) -> bool:
+        """分发内部连锁事件并立即回收事件对象，返回事件是否被取消"""
+        chain = self._chains.get(event_type)
+        if chain is None:
+            chain = self._build_chain(event_type)
+        if not chain:
+            return False
+        event = self.pool.acquire(event_type, data)
+        try:
+            await self.dispatch(event)
+            return event.cancel
+        finally:
+            self.pool.release(event)
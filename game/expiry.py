@@ -0,0 +1,57 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file expiry.py
+#
+
+"""
+会话空闲超时
+以截止时间为键的最小堆。会话活跃时只更新其最后活跃时间，
+堆中条目到期时再按实际截止时间惰性重排，清理代价只与到期条目数相关。
+"""
+
+import heapq
+from typing import Callable, List, Optional, Tuple
+
+
+class SessionExpiryQueue:
+    """会话空闲超时队列，每个会话在堆中至多一个条目"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, session_id: str, deadline: float):
+        """登记会话的截止时间，会话创建时调用一次"""
+        heapq.heappush(self._heap, (deadline, session_id))
+
+    def next_deadline(self) -> Optional[float]:
+        """最近的截止时间"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: float, get_deadline: Callable[[str], Optional[float]]) -> List[str]:
+        """
+        弹出所有已超时的会话
+
+        Args:
+            now: 当前单调时钟时间
+            get_deadline: 返回会话当前实际截止时间，会话已不存在时返回None
+
+        Returns:
+            超时的会话id列表
+        """
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, session_id = heapq.heappop(heap)
+            deadline = get_deadline(session_id)
+            if deadline is None:
+                continue
+            if deadline > now:
+                # 期间有活动，按新的截止时间重新入堆
+                heapq.heappush(heap, (deadline, session_id))
+            else:
+                expired.append(session_id)
+        return expired
@@ -0,0 +1,275 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file journal.py
+#
+
+"""
+对局日志（事件溯源）
+按顺序记录会话接受的每个GameEvent与会话命令（加入、退出、选角等），
+配合对局种子即可由replay模块重建任意时刻的对局状态。
+
+每局一个只追加的文件<会话ID>-<创建时间(毫秒)>.journal，从快照恢复或迁移来的会话创建时间不变，
+继续追加到原文件；会话ID被重新使用时是新的一局，写入新文件：
+    6字节文件头(魔数b'SNSJ', 格式版本, 负载编码) + 若干记录帧
+记录帧为4字节长度 + 负载，第一帧为[会话ID, 种子, 创建时间]，之后每帧为
+[类型, 名称, 数据]。记录先缓存在内存中，由单独的线程按批追加写入。
+
+会话快照保存快照时已写入的记录数，从快照恢复时重放之后的记录（见replay.catch_up）；
+每个tick以一条TICK记录结束，其数据为该tick从事件队列取出的事件数，
+末尾没有TICK的记录属于崩溃时未完成的tick，恢复时截掉，其事件仍在快照的事件队列中。
+"""
+
+import asyncio
+import json
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:     # 可选依赖，未安装时使用JSON
+    msgpack = None
+
+MAGIC = b'SNSJ'
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct('<4sBB')    # 魔数, 格式版本, 负载编码
+FRAME = struct.Struct('<I')             # 记录长度
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+SUFFIX = '.journal'
+
+# 记录类型
+EVENT = 0       # 分发给会话的事件：[EVENT, 事件类型名, 事件数据]
+COMMAND = 1     # 会话命令：[COMMAND, 方法名, 参数列表]
+TICK = 2        # tick结束：[TICK, None, 从事件队列取出的事件数]
+
+
+class JournalError(ValueError):
+    """对局日志损坏或格式版本不受支持"""
+
+
+def _pack(obj: Any, encoding: int) -> bytes:
+    if encoding == ENCODING_MSGPACK:
+        body = msgpack.packb(obj, use_bin_type=True)
+    else:
+        body = json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return FRAME.pack(len(body)) + body
+
+
+def _unpack(body: memoryview, encoding: int) -> Any:
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    return json.loads(bytes(body))
+
+
+def iter_journal(data: bytes) -> Iterator[List[Any]]:
+    """
+    逐条解码对局日志，第一条为日志头。末尾不完整的记录（写入时进程崩溃）被忽略。
+
+    Raises:
+        JournalError: 文件头不符
+    """
+    for _, record in _iter_frames(data):
+        yield record
+
+
+def _iter_frames(data: bytes) -> Iterator[Tuple[int, List[Any]]]:
+    """逐条解码对局日志，给出 (记录结束处的字节偏移, 记录)"""
+    if len(data) < FILE_HEADER.size:
+        raise JournalError("日志长度不足")
+    magic, version, encoding = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise JournalError("不是对局日志")
+    if version != FORMAT_VERSION:
+        raise JournalError(f"不支持的日志格式版本: {version}")
+    if encoding == ENCODING_MSGPACK and msgpack is None:
+        raise JournalError("日志使用MessagePack编码，但未安装msgpack")
+    view = memoryview(data)
+    offset = FILE_HEADER.size
+    while offset + FRAME.size <= len(view):
+        (length,) = FRAME.unpack_from(view, offset)
+        offset += FRAME.size
+        if offset + length > len(view):
+            break
+        record = _unpack(view[offset:offset + length], encoding)
+        offset += length
+        yield offset, record
+
+
+def read_journal(source: Union[Path, str, bytes]) -> Tuple[List[Any], List[List[Any]]]:
+    """读取对局日志，返回 (日志头, 记录列表)"""
+    data = source if isinstance(source, bytes) else Path(source).read_bytes()
+    records = iter_journal(data)
+    header = next(records, None)
+    if header is None:
+        raise JournalError("日志缺少日志头")
+    return header, list(records)
+
+
+def scan_journal(data: bytes) -> Tuple[List[Any], List[List[Any]], List[int]]:
+    """
+    读取对局日志，返回 (日志头, 记录列表, 偏移列表)
+    偏移列表比记录多一项：offsets[i]为第i条记录开始处的字节偏移，最后一项为最后一条完整记录的结束处
+    """
+    frames = _iter_frames(data)
+    first = next(frames, None)
+    if first is None:
+        raise JournalError("日志缺少日志头")
+    offsets, header = [first[0]], first[1]
+    records = []
+    for end, record in frames:
+        records.append(record)
+        offsets.append(end)
+    return header, records, offsets
+
+
+class JournalWriter:
+    """
+    对局日志的批量写入
+
+    会话在事件循环中调用append，记录立即编码以固定当时的事件数据；
+    编码后的记录按会话缓存，到达flush_interval或max_buffer条时交给写入线程一次追加。
+    """
+
+    def __init__(self, directory: Path, flush_interval: float = 0.05, max_buffer: int = 4096):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.encoding = ENCODING_MSGPACK if msgpack is not None else ENCODING_JSON
+        self.logger = logging.getLogger('JournalWriter')
+        # 文件句柄只在写入线程中使用
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="match-journal")
+        # 以下按日志文件名（不含后缀）索引，会话ID只在_keys中映射到当前一局的文件
+        self._keys: Dict[str, str] = {}
+        self._files: Dict[str, BinaryIO] = {}
+        self._headers: Dict[str, bytes] = {}
+        self._buffers: Dict[str, List[bytes]] = {}
+        self._buffered = 0
+        self._closing: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_write: Optional[asyncio.Future] = None
+        self.records = 0        # 累计写出的记录数
+
+    @staticmethod
+    def _key(session_id: str, created_at: float) -> str:
+        if '/' in session_id or '\\' in session_id or session_id.startswith('.'):
+            raise ValueError(f"无效的会话ID: {session_id}")
+        return f"{session_id}-{round(created_at * 1000)}"
+
+    def path(self, session_id: str, created_at: float) -> Path:
+        """某一局的日志文件"""
+        return self.directory / f"{self._key(session_id, created_at)}{SUFFIX}"
+
+    def open(self, session_id: str, seed: int, created_at: float):
+        """登记会话，日志文件不存在时以此创建日志头；恢复或迁移来的会话继续追加"""
+        previous = self._keys.get(session_id)
+        if previous is not None:
+            self._closing.add(previous)
+        key = self._keys[session_id] = self._key(session_id, created_at)
+        self._headers[key] = _pack([session_id, seed, created_at], self.encoding)
+        self._closing.discard(key)
+
+    def append(self, session_id: str, kind: int, name: Optional[str] = None, data: Any = None):
+        """追加一条记录，会话已关闭日志时丢弃"""
+        key = self._keys.get(session_id)
+        if key is None:
+            return
+        frame = _pack([kind, name, data], self.encoding)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = []
+        buffer.append(frame)
+        self._buffered += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        elif self._buffered >= self.max_buffer:
+            self._flush_task.cancel()
+            self._flush_task = asyncio.create_task(self._flush_later(0))
+
+    def close_session(self, session_id: str):
+        """会话结束，写完缓存的记录后关闭其日志文件，之后该会话的记录被丢弃"""
+        key = self._keys.pop(session_id, None)
+        if key is None:
+            return
+        self._closing.add(key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later(0))
+
+    async def _flush_later(self, delay: Optional[float] = None):
+        await asyncio.sleep(self.flush_interval if delay is None else delay)
+        # 从这里开始不再被取消，写入由shield保护
+        self._flush_task = None
+        await asyncio.shield(self._write_pending())
+
+    async def _write_pending(self):
+        if not (self._buffers or self._closing):
+            # 没有新记录时等待已提交的写入完成
+            if self._last_write is not None:
+                await asyncio.shield(self._last_write)
+            return
+        buffers, self._buffers = self._buffers, {}
+        closing, self._closing = self._closing, set()
+        self._buffered = 0
+        headers = {}
+        for key in list(buffers):
+            header = self._headers.get(key)
+            if header is None:
+                # 日志已关闭的会话仍在处理中的tick写入的记录
+                self.logger.warning(f"丢弃已关闭日志{key}的{len(buffers.pop(key))}条记录")
+                continue
+            headers[key] = header
+        for key in closing:
+            self._headers.pop(key, None)
+        loop = asyncio.get_running_loop()
+        # 写入线程只有一个，各批按提交顺序追加
+        self._last_write = loop.run_in_executor(self._executor, self._write_batch, buffers, headers, closing)
+        try:
+            await self._last_write
+        except Exception as e:
+            self.logger.error(f"写入对局日志失败: {e}")
+
+    def _write_batch(self, buffers: Dict[str, List[bytes]], headers: Dict[str, bytes], closing: Set[str]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for key, frames in buffers.items():
+            f = self._files.get(key)
+            if f is None:
+                f = self._files[key] = open(self.directory / f"{key}{SUFFIX}", 'ab')
+                if f.tell() == 0:
+                    f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, self.encoding))
+                    f.write(headers[key])
+            f.write(b''.join(frames))
+            f.flush()
+            self.records += len(frames)
+        for key in closing:
+            f = self._files.pop(key, None)
+            if f is not None:
+                f.close()
+
+    async def truncate(self, session_id: str, created_at: float, size: int):
+        """把某一局的日志截断到size字节，用于从快照恢复时去掉崩溃时未写完的记录，需在追加新记录之前调用"""
+        key = self._key(session_id, created_at)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._truncate, key, size)
+
+    def _truncate(self, key: str, size: int):
+        f = self._files.pop(key, None)
+        if f is not None:
+            f.close()
+        with open(self.directory / f"{key}{SUFFIX}", 'r+b') as f:
+            f.truncate(size)
+
+    async def flush(self):
+        """立即写出全部缓存的记录"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._write_pending()
+
+    async def close(self):
+        """写出缓存的记录，关闭全部日志文件"""
+        self._closing.update(self._headers)
+        self._keys.clear()
+        await self.flush()
+        self._executor.shutdown(wait=True)
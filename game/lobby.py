@@ -0,0 +1,309 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file lobby.py
+#
+
+"""
+大厅与匹配
+玩家连接后先进入匹配队列，按期望的每队人数分队列、按分数分段索引。
+为一名玩家找对手时只从其分段向外逐段查找，代价与队列长度无关；
+每轮只为新排队的玩家和各分段等待最久的玩家查找，代价与分段数而非排队人数成正比；
+可接受的分差随等待时间放宽，双方的可接受分差都覆盖分差时才能匹配。
+凑齐一局的人数后才向GameManager申请会话，玩家按分数蛇形分入两队，分队结果写入对局状态。
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from itertools import count
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .manager import GameManager
+
+# 为一名玩家找对手时最多考察的候选人数（为所需人数的倍数）
+CANDIDATE_FACTOR = 4
+# 没有账号分数的玩家（如游客）的匹配分数
+DEFAULT_RATING = 1000
+
+
+class Match(NamedTuple):
+    """匹配结果"""
+    session_id: str
+    teams: Dict[str, int]       # 玩家 -> 队伍编号（0或1）
+    waited: float               # 该玩家的排队时长（秒）
+
+
+class Ticket:
+    """一名玩家的排队记录"""
+    __slots__ = ('player_id', 'rating', 'team_size', 'enqueued_at', 'future', 'bucket')
+
+    def __init__(self, player_id: str, rating: int, team_size: int, bucket: int):
+        self.player_id = player_id
+        self.rating = rating
+        self.team_size = team_size
+        self.enqueued_at = time.monotonic()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.bucket = bucket
+
+
+class MatchmakingQueue:
+    """某种每队人数的匹配队列，按分数分段索引"""
+
+    def __init__(self, team_size: int, bucket_width: int):
+        self.team_size = team_size
+        self.match_size = team_size * 2
+        self.bucket_width = bucket_width
+        # 分段号 -> {玩家: 排队记录}，段内按排队先后排列
+        self.buckets: Dict[int, Dict[str, Ticket]] = {}
+        # 全部排队记录，按排队先后排列
+        self.tickets: Dict[str, Ticket] = {}
+        # 排队后尚未查找过对手的玩家
+        self.arrivals: Dict[str, Ticket] = {}
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def add(self, ticket: Ticket):
+        self.tickets[ticket.player_id] = ticket
+        self.arrivals[ticket.player_id] = ticket
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is None:
+            bucket = self.buckets[ticket.bucket] = {}
+        bucket[ticket.player_id] = ticket
+
+    def remove(self, ticket: Ticket):
+        self.tickets.pop(ticket.player_id, None)
+        self.arrivals.pop(ticket.player_id, None)
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is not None:
+            bucket.pop(ticket.player_id, None)
+            if not bucket:
+                del self.buckets[ticket.bucket]
+
+    def candidates(self) -> List[Ticket]:
+        """
+        本轮需要查找对手的玩家，等待最久的在前：
+        新排队的玩家可能与附近分段的任何人成局；其余玩家只因可接受分差放宽才可能成局，
+        而同一分段中等待最久的玩家分差放得最宽，每段只需为它查找
+        """
+        found = dict(self.arrivals)
+        for bucket in self.buckets.values():
+            head = next(iter(bucket.values()))
+            found[head.player_id] = head
+        return sorted(found.values(), key=lambda t: t.enqueued_at)
+
+    def nearby(self, ticket: Ticket, window: float) -> Iterable[Tuple[int, Ticket]]:
+        """由近到远逐段给出分差不超过window的其他玩家，附带其所在分段与本段的距离"""
+        reach = int(window // self.bucket_width) + 1
+        for distance in range(reach + 1):
+            for index in {ticket.bucket - distance, ticket.bucket + distance}:
+                bucket = self.buckets.get(index)
+                if not bucket:
+                    continue
+                for other in bucket.values():
+                    if other is not ticket and abs(other.rating - ticket.rating) <= window:
+                        yield distance, other
+
+
+class Lobby:
+    """
+    匹配大厅
+
+    Args:
+        manager: 凑齐一局后在其中创建会话
+        team_sizes: 支持的每队人数
+        bucket_width: 分数分段宽度
+        window_base: 刚排队时可接受的分差
+        window_growth: 每等待一秒增加的可接受分差
+        window_max: 可接受分差的上限，None表示不设上限
+        match_interval: 定期重新匹配的间隔（秒），放宽后的分差在此时生效
+        wait_samples: 保留的排队时长样本数，用于统计分位数
+    """
+
+    def __init__(self,
+                 manager: GameManager,
+                 team_sizes: Iterable[int] = (1, 2),
+                 bucket_width: int = 50,
+                 window_base: float = 100,
+                 window_growth: float = 25,
+                 window_max: Optional[float] = 1000,
+                 match_interval: float = 0.5,
+                 wait_samples: int = 10000):
+        self.manager = manager
+        self.queues = {size: MatchmakingQueue(size, bucket_width) for size in team_sizes}
+        self.bucket_width = bucket_width
+        self.window_base = window_base
+        self.window_growth = window_growth
+        self.window_max = window_max
+        self.match_interval = match_interval
+        self.waits: Deque[float] = deque(maxlen=wait_samples)
+        self.matches = 0            # 累计成局数
+        self.allocation_failures = 0    # 因会话名额不足推迟的成局数
+        self.logger = logging.getLogger('Lobby')
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._order = count()
+
+    def start(self):
+        """启动定期匹配任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """停止匹配，仍在排队的玩家收到取消"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for queue in self.queues.values():
+            for ticket in list(queue.tickets.values()):
+                queue.remove(ticket)
+                if not ticket.future.done():
+                    ticket.future.cancel()
+
+    def window(self, ticket: Ticket, now: float) -> float:
+        """玩家当前可接受的分差"""
+        window = self.window_base + self.window_growth * (now - ticket.enqueued_at)
+        if self.window_max is not None:
+            window = min(window, self.window_max)
+        return window
+
+    def enqueue(self, player_id: str, rating: int = DEFAULT_RATING, team_size: int = 1) -> Ticket:
+        """
+        玩家开始排队
+
+        Returns:
+            排队记录，其future在成局时得到Match
+
+        Raises:
+            ValueError: 不支持该每队人数，或玩家已在排队
+        """
+        queue = self.queues.get(team_size)
+        if queue is None:
+            raise ValueError(f"不支持的每队人数: {team_size}")
+        if any(player_id in q.tickets for q in self.queues.values()):
+            raise ValueError(f"玩家{player_id}已在排队")
+        ticket = Ticket(player_id, rating, team_size, int(rating // self.bucket_width))
+        queue.add(ticket)
+        # 新玩家可能立即凑成一局，提前唤醒匹配任务
+        self._wake.set()
+        return ticket
+
+    def cancel(self, ticket: Ticket):
+        """玩家离开队列"""
+        self.queues[ticket.team_size].remove(ticket)
+        if not ticket.future.done():
+            ticket.future.cancel()
+
+    def _find_match(self, queue: MatchmakingQueue, ticket: Ticket, now: float) -> Optional[List[Ticket]]:
+        """为玩家找到分差最近、且彼此都能接受的一局，找不到时返回None"""
+        need = queue.match_size - 1
+        found: List[Tuple[float, int, Ticket]] = []
+        for _, other in queue.nearby(ticket, self.window(ticket, now)):
+            if abs(other.rating - ticket.rating) <= self.window(other, now):
+                found.append((abs(other.rating - ticket.rating), next(self._order), other))
+                # 候选来自最近的分段且段内按排队先后排列，取到固定数量即停止，
+                # 分差的精度为一个分段宽度，查找代价与队列长度无关
+                if len(found) >= need * CANDIDATE_FACTOR:
+                    break
+        if len(found) < need:
+            return None
+        found.sort()
+        return [ticket] + [other for _, _, other in found[:need]]
+
+    @staticmethod
+    def assign_teams(tickets: List[Ticket]) -> Dict[str, int]:
+        """按分数蛇形分队（0,1,1,0,0,1...），两队总分尽量接近"""
+        ranked = sorted(tickets, key=lambda t: t.rating, reverse=True)
+        return {t.player_id: (0, 1, 1, 0)[i % 4] for i, t in enumerate(ranked)}
+
+    async def _form(self, queue: MatchmakingQueue, tickets: List[Ticket]) -> bool:
+        """为凑齐的一局创建会话；名额不足时玩家回到队列等待下次匹配"""
+        for ticket in tickets:
+            queue.remove(ticket)
+        session = None
+        # create_session在名额用尽时会一直等待，匹配任务不能因此阻塞
+        if not self.manager.session_semaphore.locked():
+            session_id = str(uuid.uuid4())
+            session = await self.manager.create_session(session_id)
+        if session is None:
+            self.allocation_failures += 1
+            for ticket in tickets:
+                if not ticket.future.done():
+                    queue.add(ticket)
+            return False
+
+        teams = self.assign_teams(tickets)
+        for ticket in tickets:
+            # 创建会话期间断开的玩家不再加入
+            if not ticket.future.cancelled():
+                await session.player_join(ticket.player_id)
+        if queue.team_size > 1:
+            # 分队随命令写入对局状态与对局日志，重放与快照恢复后保持一致
+            await session.team_system_activate(teams)
+
+        now = time.monotonic()
+        self.matches += 1
+        for ticket in tickets:
+            waited = now - ticket.enqueued_at
+            self.waits.append(waited)
+            if not ticket.future.done():
+                ticket.future.set_result(Match(session_id, teams, waited))
+        self.logger.info(
+            f"成局{session_id}：{queue.team_size}v{queue.team_size}，"
+            f"分数{[t.rating for t in tickets]}"
+        )
+        return True
+
+    async def match_once(self) -> int:
+        """对全部队列做一轮匹配，等待最久的玩家优先，返回成局数"""
+        formed = 0
+        now = time.monotonic()
+        for queue in self.queues.values():
+            if len(queue) < queue.match_size:
+                continue
+            for ticket in queue.candidates():
+                if ticket.player_id not in queue.tickets:
+                    continue    # 本轮已被匹配
+                queue.arrivals.pop(ticket.player_id, None)
+                tickets = self._find_match(queue, ticket, now)
+                if tickets is None:
+                    continue
+                if not await self._form(queue, tickets):
+                    return formed
+                formed += 1
+                if len(queue) < queue.match_size:
+                    break
+        return formed
+
+    async def run(self):
+        """匹配主循环：有新玩家排队时立即匹配，否则按间隔重试以应用放宽后的分差"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.match_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.match_once()
+            except Exception as e:
+                self.logger.error(f"匹配失败: {e}", exc_info=True)
+
+    def wait_percentiles(self, percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, float]:
+        """最近成局玩家排队时长的分位数（秒）"""
+        if not self.waits:
+            return {}
+        ordered = sorted(self.waits)
+        last = len(ordered) - 1
+        return {f"p{p:g}": ordered[min(last, int(round(p / 100 * last)))] for p in percentiles}
+
+    def stats(self) -> Dict[str, Any]:
+        """排队人数、成局数与排队时长分位数"""
+        return {
+            'queued': {f"{size}v{size}": len(queue) for size, queue in self.queues.items()},
+            'matches': self.matches,
+            'allocation_failures': self.allocation_failures,
+            'wait_seconds': self.wait_percentiles(),
+        }
@@ -1,16 +1,120 @@
 import asyncio
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+import logging
+import time
+from typing import Any, Dict, List, Optional
 
+from .expiry import SessionExpiryQueue
+from .journal import JournalWriter
+from .replay import catch_up
 from .session import GameSession
+from .snapshot import SnapshotStore, capture_session, decode_snapshot, encode_payload, restore_session
+
+
+def resize_semaphore(semaphore: asyncio.Semaphore, old: int, new: int, held: List[asyncio.Task]):
+    """
+    修改名额信号量的上限
+    增加时直接释放名额；减少时由后台任务取走多出的名额并一直持有，
+    已占用名额的会话不受影响，结束后其名额被这些任务取走。
+
+    Args:
+        held: 持有名额的后台任务，增加上限时先撤销仍在等待的任务
+    """
+    delta = new - old
+    while delta > 0 and held:
+        task = held.pop()
+        if not task.done():
+            task.cancel()
+        else:
+            semaphore.release()
+        delta -= 1
+    for _ in range(delta):
+        semaphore.release()
+    for _ in range(-delta):
+        held.append(asyncio.ensure_future(semaphore.acquire()))
+
+
+class SessionExpired(Exception):
+    """会话已超时或已结束，连接需要重新加入"""
+
+
+def expired_notice(reason: str) -> Dict[str, Any]:
+    """会话结束时发给客户端的通知"""
+    return {"expired": True, "error": reason}
+
 
 class GameManager:
-    def __init__(self, max_sessions: int = 100):
+    def __init__(self,
+                 max_sessions: int = 100,
+                 session_options: Optional[Dict[str, Any]] = None,
+                 session_timeouts: Optional[Dict[str, float]] = None,
+                 cleanup_interval: float = 10,
+                 snapshots: Optional[SnapshotStore] = None,
+                 journal: Optional[JournalWriter] = None):
         self.sessions: Dict[str, GameSession] = {}
+        self.session_options = session_options or {}   # 创建会话时的参数，如batch_size、tick_interval
+        self.max_sessions = max_sessions
         self.session_semaphore = asyncio.Semaphore(max_sessions)
+        self._held_slots: List[asyncio.Task] = []     # 下调上限后持有多余名额的任务
         self.cleanup_task = None
+        # 各会话类型的空闲超时（秒），未配置的类型使用default
+        self.session_timeouts = {'default': 3600, **(session_timeouts or {})}
+        self.cleanup_interval = cleanup_interval
+        self.expiry = SessionExpiryQueue()
+        self.expired_count = 0      # 累计因空闲超时结束的会话数
+        self.snapshots = snapshots  # 会话快照存储，None表示不保存
+        self.journal = journal      # 对局日志，None表示不记录
+        self.logger = logging.getLogger('GameManager')
+
+    def start(self):
+        """启动空闲会话清理任务"""
+        if self.cleanup_task is None:
+            self.cleanup_task = asyncio.create_task(self.cleanup_inactive_sessions())
+
+    def stop(self):
+        """停止空闲会话清理任务"""
+        if self.cleanup_task is not None:
+            self.cleanup_task.cancel()
+            self.cleanup_task = None
+
+    def configure(self,
+                  max_sessions: Optional[int] = None,
+                  session_options: Optional[Dict[str, Any]] = None,
+                  session_timeouts: Optional[Dict[str, float]] = None,
+                  cleanup_interval: Optional[float] = None):
+        """运行中修改会话上限、会话参数与空闲超时，未给出的项保持不变；进行中的会话不会被结束"""
+        if max_sessions is not None and max_sessions != self.max_sessions:
+            resize_semaphore(self.session_semaphore, self.max_sessions, max_sessions, self._held_slots)
+            self.logger.info(f"会话上限 {self.max_sessions} -> {max_sessions}")
+            self.max_sessions = max_sessions
+        if session_options is not None:
+            self.session_options = dict(session_options)
+            # 会话主循环每个tick读取这些参数，已有会话立即生效
+            for session in self.sessions.values():
+                for key, value in self.session_options.items():
+                    setattr(session, key, value)
+        if session_timeouts is not None:
+            timeouts = {'default': 3600, **session_timeouts}
+            if timeouts != self.session_timeouts:
+                self.session_timeouts = timeouts
+                # 超时缩短时堆中的旧截止时间偏晚，按新超时重建
+                self.expiry = SessionExpiryQueue()
+                for session_id in self.sessions:
+                    self.expiry.schedule(session_id, self._session_deadline(session_id))
+        if cleanup_interval is not None:
+            self.cleanup_interval = cleanup_interval
+
+    def session_timeout(self, session_type: str) -> float:
+        """某会话类型的空闲超时"""
+        return self.session_timeouts.get(session_type, self.session_timeouts['default'])
+
+    def _session_deadline(self, session_id: str) -> Optional[float]:
+        """会话当前的超时截止时间，会话不存在时返回None"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        return session.last_active + self.session_timeout(session.session_type)
     
-    async def create_session(self, session_id: str) -> Optional[GameSession]:
+    async def create_session(self, session_id: str, session_type: str = "default") -> Optional[GameSession]:
         """创建新的游戏会话"""
         if not await self.session_semaphore.acquire():
             return None
@@ -20,29 +124,130 @@ class GameManager:
             return None
             
         try:
-            session = GameSession(session_id)
-            self.sessions[session_id] = session
-            asyncio.create_task(session.run())
+            session = GameSession(session_id, session_type=session_type,
+                                  snapshots=self.snapshots, journal=self.journal,
+                                  **self.session_options)
+            self._register(session)
             return session
         except Exception:
             self.session_semaphore.release()
             return None
-            
-    async def end_session(self, session_id: str):
-        """结束游戏会话"""
+
+    def _register(self, session: GameSession):
+        """登记会话并启动其主循环，调用方已取得会话名额"""
+        self.sessions[session.session_id] = session
+        self.expiry.schedule(session.session_id, self._session_deadline(session.session_id))
+        asyncio.create_task(session.run())
+
+    async def _adopt(self, record: List[Any]) -> Optional[GameSession]:
+        """由快照重建会话并重放对局日志中快照之后的记录，然后登记；名额已满或ID冲突时返回None"""
+        if record[0] in self.sessions or self.session_semaphore.locked():
+            return None
+        await self.session_semaphore.acquire()
+        try:
+            session = restore_session(record, snapshots=self.snapshots, journal=self.journal,
+                                      **self.session_options)
+            if self.journal is not None:
+                replayed = await catch_up(session, self.journal, session.journal_seq)
+                if replayed:
+                    self.logger.info(f"会话{session.session_id}由对局日志重放{replayed}条记录")
+        except Exception:
+            self.session_semaphore.release()
+            if self.journal is not None:
+                self.journal.close_session(record[0])
+            raise
+        # 空闲时间从恢复时刻起算
+        self._register(session)
+        return session
+
+    async def restore_sessions(self) -> List[str]:
+        """启动时从快照恢复会话，返回恢复的会话ID"""
+        if self.snapshots is None:
+            return []
+        started = time.perf_counter()
+        restored = []
+        for record in await self.snapshots.load_all():
+            try:
+                session = await self._adopt(record)
+            except Exception as e:
+                self.logger.error(f"会话{record[0]}恢复失败: {e}", exc_info=True)
+                continue
+            if session is None:
+                self.logger.warning(f"会话{record[0]}未恢复：会话名额已满或ID冲突")
+                continue
+            restored.append(session.session_id)
+        if restored:
+            self.logger.info(
+                f"从快照恢复会话{len(restored)}个，耗时{time.perf_counter() - started:.3f}s"
+            )
+        return restored
+
+    async def export_session(self, session_id: str) -> Optional[bytes]:
+        """把会话编码为快照并在本进程结束它，用于迁移到其他工作进程"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        async with session.lock:
+            payload = capture_session(session)
+            # 复制负载后立即结束会话，之后不再处理事件
+            await self.end_session(session_id)
+        if self.journal is not None:
+            # 对局日志写完并关闭后，目标进程才能继续追加
+            await self.journal.flush()
+        # 编码不占用会话锁与事件循环
+        return await asyncio.get_running_loop().run_in_executor(None, encode_payload, payload)
+
+    async def import_session(self, data: bytes) -> Optional[GameSession]:
+        """接收其他工作进程导出的会话快照"""
+        session = await self._adopt(decode_snapshot(data))
+        if session is not None and self.snapshots is not None:
+            self.snapshots.save(session, force=True)
+        return session
+
+    async def end_session(self, session_id: str, keep_snapshot: bool = False):
+        """
+        结束游戏会话
+
+        Args:
+            keep_snapshot: 保留会话快照，用于进程退出后恢复；否则删除快照
+        """
         if session := self.sessions.get(session_id):
             await session.cleanup()
             del self.sessions[session_id]
             self.session_semaphore.release()
+            if self.snapshots is not None:
+                if keep_snapshot:
+                    # 回合中途的变化只在回合边界保存，退出时强制保存最新状态
+                    self.snapshots.save(session, force=True)
+                else:
+                    self.snapshots.discard(session_id)
+
+    async def shutdown(self):
+        """进程退出：保存全部会话的最新快照并结束会话"""
+        self.stop()
+        for session_id in list(self.sessions):
+            await self.end_session(session_id, keep_snapshot=True)
+        if self.snapshots is not None:
+            await self.snapshots.close()
+        if self.journal is not None:
+            await self.journal.close()
             
+    async def expire_idle_sessions(self) -> int:
+        """结束所有空闲超时的会话，返回结束的会话数"""
+        expired = self.expiry.pop_expired(time.monotonic(), self._session_deadline)
+        for sid in expired:
+            session = self.sessions.get(sid)
+            if session is not None:
+                # 通知仍在连接的客户端，服务器收到后关闭其连接
+                await session.notify(expired_notice("会话空闲超时已结束"))
+            await self.end_session(sid)
+        if expired:
+            self.expired_count += len(expired)
+            self.logger.info(f"清理空闲会话{len(expired)}个，累计{self.expired_count}个")
+        return len(expired)
+
     async def cleanup_inactive_sessions(self):
         """清理不活跃的会话"""
         while True:
-            now = datetime.now()
-            expired_sessions = [
-                sid for sid, session in self.sessions.items()
-                if now - session.created_at > timedelta(hours=1)  # 1小时超时
-            ]
-            for sid in expired_sessions:
-                await self.end_session(sid)
-            await asyncio.sleep(300)  # 每5分钟检查一次
+            await self.expire_idle_sessions()
+            await asyncio.sleep(self.cleanup_interval)
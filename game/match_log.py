@@ -0,0 +1,47 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file match_log.py
+#
+
+"""
+对局日志
+客户端可见的最近日志保存在定长环形缓冲区中，完整日志交给
+'game.match' logger，由logging的异步批量输出写入文件。
+"""
+
+import logging
+from collections import deque
+from itertools import islice
+from typing import List
+
+match_logger = logging.getLogger('game.match')
+
+
+class MatchLog:
+    """定长环形日志缓冲区，记录累计条数以便按序号增量读取"""
+
+    def __init__(self, capacity: int = 200):
+        self._buffer: deque = deque(maxlen=capacity)
+        self.total = 0      # 累计写入条数
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def __iter__(self):
+        return iter(self._buffer)
+
+    def append(self, message: str):
+        self._buffer.append(message)
+        self.total += 1
+
+    def since(self, index: int) -> List[str]:
+        """序号不小于index的日志，已被覆盖的部分忽略"""
+        count = min(self.total - index, len(self._buffer))
+        if count <= 0:
+            return []
+        return list(islice(self._buffer, len(self._buffer) - count, None))
+
+    def recent(self, count: int) -> List[str]:
+        """最近count条日志"""
+        return self.since(self.total - count)
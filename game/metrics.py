@@ -0,0 +1,254 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file metrics.py
+#
+
+"""
+运行时指标
+进程内全局的METRICS在热路径上只做整数累加：事件分发与会话tick的耗时按固定分段计入直方图，
+收发消息只累加计数；队列深度、会话数等瞬时值在抓取时才计算。
+/metrics 路由以Prometheus文本格式输出。
+
+分片模式下各工作进程有各自的METRICS，前端进程抓取时经stats请求取回导出的计数后合并输出。
+"""
+
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+# 事件分发耗时的分段上界（秒）
+DISPATCH_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+# 会话tick（一批事件加锁处理并生成增量）耗时的分段上界（秒）
+TICK_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# 每秒消息数按最近RATE_WINDOW秒内的抓取样本计算
+RATE_WINDOW = 10.0
+
+# 指标样本：(标签, 数值)
+Sample = Tuple[Dict[str, str], float]
+
+
+class Histogram:
+    """
+    固定分段直方图，各段分别计数，输出时再累加
+    记录一个值只需一次二分查找与两次累加，热路径上可直接内联observe的两行。
+    """
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)      # 最后一段为+Inf
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def export(self) -> List[Any]:
+        return [list(self.counts), self.sum]
+
+    def merge(self, exported: List[Any]):
+        counts, total = exported
+        for i, value in enumerate(counts):
+            self.counts[i] += value
+        self.sum += total
+
+
+class RateWindow:
+    """由计数器在抓取时的样本计算每秒增量，热路径上没有额外开销"""
+
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self.samples: Deque[Tuple[float, int]] = deque([(time.monotonic(), 0)])
+
+    def rate(self, total: int, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        # 保留窗口内最早的一个样本作为起点
+        while len(self.samples) > 1 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+        start, base = self.samples[0]
+        self.samples.append((now, total))
+        return (total - base) / (now - start) if now > start else 0.0
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def format_metric(name: str, kind: str, description: str, samples: Iterable[Sample]) -> List[str]:
+    """一个计数器或仪表的Prometheus文本"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+def format_histogram(name: str, description: str,
+                     histograms: Iterable[Tuple[Dict[str, str], Histogram]]) -> List[str]:
+    """一组直方图的Prometheus文本，跳过没有样本的标签组合"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        if not histogram.count:
+            continue
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+class Metrics:
+    """
+    进程内指标
+
+    dispatch: 各事件类型的分发耗时直方图，嵌套分发的耗时计入外层事件
+    tick: 会话每个tick的处理耗时
+    """
+
+    def __init__(self):
+        # 以事件类型的枚举值为键：枚举成员的哈希在Python层计算，比整数慢得多
+        self.dispatch: Dict[int, Histogram] = {}
+        self.dispatch_errors: Dict[int, int] = {}
+        self.event_types: Dict[int, Any] = {}
+        self.tick = Histogram(TICK_BUCKETS)
+        self.tick_events = 0            # 各tick处理的事件总数
+        self.coalesced = 0              # 合并掉的事件数
+        self.messages_in = 0            # 收到的客户端消息帧
+        self.messages_out = 0           # 发出的回复帧
+        self.connections = 0            # 当前/game连接数
+        self.overflows: Dict[Tuple[str, str], int] = {}     # (队列, 溢出策略) -> 次数
+        self.started_at = time.time()
+        self._rates = {'in': RateWindow(), 'out': RateWindow()}
+
+    def dispatch_histogram(self, event_type) -> Histogram:
+        """事件类型的分发耗时直方图，首次使用时创建"""
+        code = event_type._value_
+        histogram = self.dispatch.get(code)
+        if histogram is None:
+            histogram = self.dispatch[code] = Histogram(DISPATCH_BUCKETS)
+            self.event_types[code] = event_type
+        return histogram
+
+    def observe_dispatch(self, event_type, seconds: float):
+        histogram = self.dispatch.get(event_type._value_)
+        if histogram is None:
+            histogram = self.dispatch_histogram(event_type)
+        histogram.observe(seconds)
+
+    def dispatch_failed(self, event_type, seconds: float):
+        """监听器抛出异常的分发"""
+        self.observe_dispatch(event_type, seconds)
+        code = event_type._value_
+        self.dispatch_errors[code] = self.dispatch_errors.get(code, 0) + 1
+
+    def observe_tick(self, seconds: float, events: int, merged: int):
+        self.tick.observe(seconds)
+        self.tick_events += events
+        self.coalesced += merged
+
+    def backpressure(self, queue: str, action: str):
+        """记录一次队列溢出或限速"""
+        key = (queue, action)
+        self.overflows[key] = self.overflows.get(key, 0) + 1
+
+    def export(self) -> Dict[str, Any]:
+        """会话处理相关的计数，供分片工作进程经管道传回前端进程"""
+        return {
+            'dispatch': {self.event_types[c]: h.export() for c, h in self.dispatch.items()},
+            'dispatch_errors': {self.event_types[c]: n for c, n in self.dispatch_errors.items()},
+            'tick': self.tick.export(),
+            'tick_events': self.tick_events,
+            'coalesced': self.coalesced,
+            'overflows': dict(self.overflows),
+        }
+
+    def merged(self, exports: Iterable[Dict[str, Any]]) -> 'Metrics':
+        """本进程的计数与各工作进程导出计数之和，不影响本进程的计数"""
+        total = Metrics()
+        total.messages_in = self.messages_in
+        total.messages_out = self.messages_out
+        total.connections = self.connections
+        total.started_at = self.started_at
+        total._rates = self._rates
+        for exported in (self.export(), *exports):
+            for event_type, histogram in exported['dispatch'].items():
+                total.dispatch_histogram(event_type).merge(histogram)
+            for event_type, count in exported['dispatch_errors'].items():
+                code = event_type._value_
+                total.dispatch_errors[code] = total.dispatch_errors.get(code, 0) + count
+            total.tick.merge(exported['tick'])
+            total.tick_events += exported['tick_events']
+            total.coalesced += exported['coalesced']
+            for key, count in exported['overflows'].items():
+                total.overflows[key] = total.overflows.get(key, 0) + count
+        return total
+
+    def render(self, gauges: Iterable[List[str]] = ()) -> str:
+        """
+        Prometheus文本格式
+
+        Args:
+            gauges: 由调用方在抓取时计算的其他指标（format_metric的输出）
+        """
+        lines: List[str] = []
+        lines += format_histogram(
+            'sns_event_dispatch_seconds', '事件分发耗时（含嵌套分发）',
+            (({'event_type': self.event_types[c].name}, self.dispatch[c]) for c in sorted(self.dispatch)),
+        )
+        lines += format_metric(
+            'sns_event_dispatch_errors_total', 'counter', '监听器抛出异常的分发次数',
+            (({'event_type': self.event_types[c].name}, self.dispatch_errors[c])
+             for c in sorted(self.dispatch_errors)),
+        )
+        lines += format_histogram('sns_session_tick_seconds', '会话每个tick的处理耗时', [({}, self.tick)])
+        lines += format_metric('sns_session_tick_events_total', 'counter', 'tick中处理的事件数',
+                               [({}, self.tick_events)])
+        lines += format_metric('sns_events_coalesced_total', 'counter', '合并掉的事件数',
+                               [({}, self.coalesced)])
+        lines += format_metric('sns_messages_in_total', 'counter', '收到的客户端消息帧',
+                               [({}, self.messages_in)])
+        lines += format_metric('sns_messages_out_total', 'counter', '发出的回复帧',
+                               [({}, self.messages_out)])
+        now = time.monotonic()
+        lines += format_metric(
+            'sns_messages_per_second', 'gauge', f'最近{RATE_WINDOW:g}秒内每秒收发的消息帧',
+            [({'direction': 'in'}, round(self._rates['in'].rate(self.messages_in, now), 3)),
+             ({'direction': 'out'}, round(self._rates['out'].rate(self.messages_out, now), 3))],
+        )
+        lines += format_metric('sns_websocket_connections', 'gauge', '当前/game连接数',
+                               [({}, self.connections)])
+        lines += format_metric(
+            'sns_backpressure_total', 'counter', '队列溢出或限速的次数，按队列与处理策略',
+            (({'queue': queue, 'action': action}, count)
+             for (queue, action), count in sorted(self.overflows.items())),
+        )
+        for block in gauges:
+            lines += block
+        lines += format_metric('sns_process_start_time_seconds', 'gauge', '进程启动时间',
+                               [({}, self.started_at)])
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内全局指标
+METRICS = Metrics()
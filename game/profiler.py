@@ -0,0 +1,266 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file profiler.py
+#
+
+"""
+监听器性能剖析
+开启后EventDispatcher逐个计时监听器调用：慢调用归属到特质类与持有玩家，
+监听器中再次分发的连锁事件（如DAMAGE_APPLY -> 自勉 -> HEAL_APPLY）记为嵌套的span，
+各调用路径的自身耗时累计为火焰图可用的折叠栈（flamegraph.pl / speedscope）：
+
+    DAMAGE_APPLY;SelfEncouragement.self_encouragement;HEAL_APPLY;CombatSystem._apply_heal 1234
+
+按顶层分发采样，被采样的分发连同其全部连锁事件一起计时，未被采样的只多一次随机数判断，
+关闭时分发热路径上只多一次属性检查。当前span保存在ContextVar中，各会话任务互不干扰。
+计时为墙钟时间，监听器中await其他IO的时间也计入该监听器。
+"""
+
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 聚合表的最大条目数，超过后新玩家的调用合并到'*'
+MAX_LISTENER_ENTRIES = 10000
+
+
+class Span:
+    """一次事件分发或一次监听器调用"""
+    __slots__ = ('path', 'children')
+
+    def __init__(self, path: Tuple[str, ...]):
+        self.path = path
+        self.children = 0.0     # 嵌套span的总耗时
+
+
+# 未被采样的顶层分发，其连锁事件也不计时
+_UNSAMPLED = Span(())
+_current: ContextVar[Optional[Span]] = ContextVar('profiler_span', default=None)
+
+
+class ListenerProfiler:
+    """
+    监听器剖析器
+
+    Args:
+        enabled: 是否开启
+        sample_rate: 顶层分发的采样比例
+        slow_ms: 单次监听器调用超过该耗时（毫秒）时记为慢调用
+        slow_samples: 保留的最近慢调用条数
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.01,
+                 slow_ms: float = 5.0, slow_samples: int = 200):
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_ms / 1000
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=slow_samples)
+        self.rng = random.Random()
+        self._labels: Dict[Any, Tuple[str, Optional[str]]] = {}
+        self.reset()
+        self.configure(enabled=enabled)
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+                  slow_ms: Optional[float] = None, slow_samples: Optional[int] = None):
+        """修改设置，未给出的项保持不变"""
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if slow_ms is not None:
+            self.slow_threshold = float(slow_ms) / 1000
+        if slow_samples is not None:
+            self.slow = deque(self.slow, maxlen=int(slow_samples))
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def reset(self):
+        """清空已收集的数据"""
+        self.stacks: Dict[str, float] = {}
+        # (监听器, 特质类, 玩家) -> [调用次数, 总耗时, 最大耗时, 慢调用次数]
+        self.listeners: Dict[Tuple[str, Optional[str], Optional[str]], List[float]] = {}
+        self.slow.clear()
+        self.sampled = 0
+        self.started_at = time.time()
+
+    def settings(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_threshold * 1000,
+            'slow_samples': self.slow.maxlen,
+        }
+
+    def _describe(self, listener: Callable, owner: Any) -> Tuple[str, Optional[str], Optional[str]]:
+        """监听器的名称、所属特质类与持有玩家"""
+        bound = getattr(listener, '__self__', None)
+        name = getattr(listener, '__name__', None)
+        # 按类与函数缓存名称，不持有监听器实例，会话结束后特质可正常回收；
+        # 内置类型的绑定方法没有__func__，以方法名代替
+        if bound is not None:
+            key = (type(bound), getattr(listener, '__func__', name))
+        else:
+            key = listener
+        described = self._labels.get(key)
+        if described is None:
+            if bound is not None and name is not None:
+                label = f"{type(bound).__name__}.{name}"
+            else:
+                # functools.partial等可调用对象没有__name__
+                label = getattr(listener, '__qualname__', repr(listener))
+            # 特质的监听器以LISTENS声明
+            trait = type(bound).__name__ if bound is not None and hasattr(bound, 'LISTENS') else None
+            described = self._labels[key] = (label, trait)
+        label, trait = described
+        # 特质的持有玩家即其player_id，其他监听器只在注册时指定了owner才归属玩家
+        player = getattr(bound, 'player_id', owner) if trait is not None else owner
+        return label, trait, player
+
+    async def dispatch(self, event, chain) -> None:
+        """计时执行一条监听链，由EventDispatcher.dispatch在开启时调用"""
+        parent = _current.get()
+        if parent is None:
+            if self.rng.random() >= self.sample_rate:
+                token = _current.set(_UNSAMPLED)
+                try:
+                    await _call_chain(event, chain)
+                finally:
+                    _current.reset(token)
+                return
+            self.sampled += 1
+        elif parent is _UNSAMPLED:
+            await _call_chain(event, chain)
+            return
+
+        event_type = event.event_type.name
+        span = Span((parent.path if parent is not None else ()) + (event_type,))
+        token = _current.set(span)
+        started = time.perf_counter()
+        try:
+            for listener, is_async, owner in chain:
+                if event.cancel:
+                    break
+                if owner is not None and owner != event.data.get('player'):
+                    continue
+                label, trait, player = self._describe(listener, owner)
+                call = Span(span.path + (label,))
+                _current.set(call)
+                called = time.perf_counter()
+                try:
+                    if is_async:
+                        await listener(event)
+                    else:
+                        listener(event)
+                finally:
+                    elapsed = time.perf_counter() - called
+                    _current.set(span)
+                    span.children += elapsed
+                    self._record_call(call, elapsed, event_type, label, trait, player)
+        finally:
+            total = time.perf_counter() - started
+            _current.reset(token)
+            self._add_stack(span.path, total - span.children)
+            if parent is not None:
+                parent.children += total
+
+    def _add_stack(self, path: Tuple[str, ...], seconds: float):
+        key = ';'.join(path)
+        self.stacks[key] = self.stacks.get(key, 0.0) + seconds
+
+    def _record_call(self, call: Span, elapsed: float, event_type: str,
+                     label: str, trait: Optional[str], player: Optional[str]):
+        self._add_stack(call.path, elapsed - call.children)
+        key = (label, trait, player)
+        entry = self.listeners.get(key)
+        if entry is None:
+            if len(self.listeners) >= MAX_LISTENER_ENTRIES:
+                key = (label, trait, '*')
+                entry = self.listeners.get(key)
+            if entry is None:
+                entry = self.listeners[key] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        if elapsed >= self.slow_threshold:
+            entry[3] += 1
+            self.slow.append({
+                'time': time.time(),
+                'event_type': event_type,
+                'listener': label,
+                'trait': trait,
+                'player': player,
+                'ms': round(elapsed * 1000, 3),
+                'self_ms': round((elapsed - call.children) * 1000, 3),
+                'stack': ';'.join(call.path),
+            })
+
+    def collapsed(self) -> str:
+        """折叠栈文本，数值为自身耗时（微秒）"""
+        return ''.join(
+            f"{path} {round(seconds * 1e6)}\n"
+            for path, seconds in sorted(self.stacks.items()) if seconds > 0
+        )
+
+    def export(self) -> Dict[str, Any]:
+        """可经管道传输的原始数据，供分片模式合并"""
+        return {
+            'stacks': dict(self.stacks),
+            'listeners': {key: list(entry) for key, entry in self.listeners.items()},
+            'slow': list(self.slow),
+            'sampled': self.sampled,
+        }
+
+    def merge(self, exported: Dict[str, Any]):
+        """并入另一进程导出的数据"""
+        for path, seconds in exported['stacks'].items():
+            self.stacks[path] = self.stacks.get(path, 0.0) + seconds
+        for key, (calls, total, peak, slow) in exported['listeners'].items():
+            entry = self.listeners.setdefault(key, [0, 0.0, 0.0, 0])
+            entry[0] += calls
+            entry[1] += total
+            entry[2] = max(entry[2], peak)
+            entry[3] += slow
+        self.slow.extend(exported['slow'])
+        self.sampled += exported['sampled']
+
+    def report(self, top: int = 50) -> Dict[str, Any]:
+        """设置、按总耗时排序的监听器与最近的慢调用"""
+        ranked = sorted(self.listeners.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            **self.settings(),
+            'since': self.started_at,
+            'sampled_dispatches': self.sampled,
+            'listeners': [
+                {
+                    'listener': label,
+                    'trait': trait,
+                    'player': player,
+                    'calls': calls,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total / calls * 1000, 4) if calls else 0.0,
+                    'max_ms': round(peak * 1000, 3),
+                    'slow_calls': slow,
+                }
+                for (label, trait, player), (calls, total, peak, slow) in ranked
+            ],
+            'slow': sorted(self.slow, key=lambda record: record['time'], reverse=True),
+        }
+
+
+async def _call_chain(event, chain):
+    """不计时地执行监听链，与EventDispatcher.dispatch的循环相同"""
+    for listener, is_async, owner in chain:
+        if event.cancel:
+            break
+        if owner is not None and owner != event.data.get('player'):
+            continue
+        if is_async:
+            await listener(event)
+        else:
+            listener(event)
+
+
+# 进程内全局剖析器，默认关闭
+PROFILER = ListenerProfiler()
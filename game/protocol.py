@@ -0,0 +1,156 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file protocol.py
+#
+
+"""
+/game WebSocket 消息编解码
+握手时通过子协议协商编码：
+    sns.json        文本帧JSON（默认/回退）
+    sns.msgpack.v1  二进制帧，2字节头(协议版本, 事件类型编码) + MessagePack负载，需安装msgpack
+
+事件类型编码即GameEventType的值，新增事件类型只能追加在枚举末尾。
+客户端只能发送CLIENT_EVENT_TYPES中的事件，伤害、治疗等结算流程内部的事件由服务器触发。
+"""
+
+import json
+import struct
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:     # 可选依赖，未安装时只提供JSON
+    msgpack = None
+
+from .events import GameEvent, GameEventType
+
+JSON_PROTOCOL = 'sns.json'
+MSGPACK_PROTOCOL = 'sns.msgpack.v1'
+
+HEADER = struct.Struct('<BB')   # 协议版本, 事件类型编码
+VERSION = 1
+REPLY_CODE = 0                  # 服务器回复使用的事件类型编码
+
+# 客户端可以发送的事件类型，其余事件（如DAMAGE_APPLY、HEAL_APPLY）只在结算流程内部触发
+CLIENT_EVENT_TYPES = frozenset({
+    GameEventType.PLAYER_JOIN, GameEventType.PLAYER_LEAVE,
+    GameEventType.PLAYER_READY, GameEventType.PLAYER_UNREADY,
+    GameEventType.CHARACTER_SELECT, GameEventType.CHARACTER_UNSELECT, GameEventType.CHARACTER_UPDATE,
+    GameEventType.TURN_END,
+    GameEventType.DRAW_CARD, GameEventType.PLAY_CARD,
+    GameEventType.SKILL_USE, GameEventType.SKILL_CANCEL,
+    GameEventType.STATE_RESYNC,
+})
+
+# 事件类型编码 -> GameEventType，按下标直接查找
+_EVENT_BY_CODE = [None] * (max(t.value for t in GameEventType) + 1)
+for _event_type in GameEventType:
+    _EVENT_BY_CODE[_event_type.value] = _event_type
+
+
+class ProtocolError(ValueError):
+    """客户端消息格式错误，只回复错误，不影响连接与会话"""
+
+
+def check_data(data: Any) -> Dict[str, Any]:
+    """校验事件数据：必须为对象，player字段（如有）必须为字符串"""
+    if not isinstance(data, dict):
+        raise ProtocolError(f"事件数据必须为对象，收到{type(data).__name__}")
+    player = data.get("player")
+    if player is not None and not isinstance(player, str):
+        raise ProtocolError(f"player必须为字符串，收到{type(player).__name__}")
+    return data
+
+
+def check_event_type(event_type: GameEventType) -> GameEventType:
+    """校验事件类型：客户端不能发送结算流程内部的事件"""
+    if event_type not in CLIENT_EVENT_TYPES:
+        raise ProtocolError(f"客户端不能发送事件: {event_type.name}")
+    return event_type
+
+
+def event_from_message(message: Any) -> GameEvent:
+    """从JSON消息创建游戏事件"""
+    if not isinstance(message, dict):
+        raise ProtocolError(f"消息必须为对象，收到{type(message).__name__}")
+    name = message.get("event_type")
+    event_type = GameEventType.__members__.get(name) if isinstance(name, str) else None
+    if event_type is None:
+        raise ProtocolError(f"未知的事件类型: {name!r}")
+    data = check_data(message.get("data", {}))
+    return GameEvent(event_type=check_event_type(event_type), data=data)
+
+
+class JsonCodec:
+    """文本帧JSON编码"""
+    name = JSON_PROTOCOL
+
+    def decode(self, frame: Union[str, bytes]) -> GameEvent:
+        try:
+            message = json.loads(frame)
+        except ValueError as e:
+            raise ProtocolError(f"JSON解码失败: {e}") from e
+        return event_from_message(message)
+
+    def encode(self, obj: Dict[str, Any]) -> str:
+        return json.dumps(obj)
+
+    async def send(self, ws, obj: Dict[str, Any]):
+        await ws.send_str(self.encode(obj))
+
+
+class MsgpackCodec:
+    """二进制帧编码：定长头 + MessagePack负载"""
+    name = MSGPACK_PROTOCOL
+
+    def decode(self, frame: Union[bytes, memoryview]) -> GameEvent:
+        # 通过memoryview切片解析，不复制负载
+        view = memoryview(frame)
+        if len(view) < HEADER.size:
+            raise ProtocolError("帧长度不足")
+        version, code = HEADER.unpack_from(view)
+        if version != VERSION:
+            raise ProtocolError(f"不支持的协议版本: {version}")
+        event_type = _EVENT_BY_CODE[code] if code < len(_EVENT_BY_CODE) else None
+        if event_type is None:
+            raise ProtocolError(f"未知的事件类型编码: {code}")
+        check_event_type(event_type)
+        try:
+            data = msgpack.unpackb(view[HEADER.size:]) if len(view) > HEADER.size else {}
+        except Exception as e:
+            raise ProtocolError(f"MessagePack解码失败: {e}") from e
+        return GameEvent(event_type, check_data(data))
+
+    def encode(self, obj: Dict[str, Any], code: int = REPLY_CODE) -> bytes:
+        return HEADER.pack(VERSION, code) + msgpack.packb(obj)
+
+    def encode_event(self, event_type: GameEventType, data: Dict[str, Any]) -> bytes:
+        """编码客户端事件帧"""
+        return self.encode(data, event_type.value)
+
+    async def send(self, ws, obj: Dict[str, Any]):
+        await ws.send_bytes(self.encode(obj))
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec() if msgpack else None
+
+# 服务器支持的子协议，按优先顺序
+SUBPROTOCOLS = (MSGPACK_PROTOCOL, JSON_PROTOCOL) if msgpack else (JSON_PROTOCOL,)
+
+
+def get_codec(protocol: Optional[str]):
+    """按协商结果返回编解码器，未协商时使用JSON"""
+    if protocol == MSGPACK_PROTOCOL and MSGPACK_CODEC:
+        return MSGPACK_CODEC
+    return JSON_CODEC
+
+
+def frame_codec(binary: bool):
+    """按帧类型返回解码器：文本帧总是JSON，二进制帧为MessagePack"""
+    if binary:
+        if MSGPACK_CODEC is None:
+            raise ProtocolError("服务器未启用二进制协议")
+        return MSGPACK_CODEC
+    return JSON_CODEC
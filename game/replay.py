@@ -0,0 +1,150 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file replay.py
+#
+
+"""
+对局重放
+按对局日志在一个不连接客户端的会话上依次重新分发事件、执行会话命令，
+用同一种子的随机数流得到与线上完全相同的对局状态。重放不经过事件队列，
+没有tick等待与结果推送，速度只取决于事件处理本身。
+从快照恢复的会话由catch_up重放快照之后的记录，追上崩溃前的状态。
+
+    python -m game.replay journals/<session_id>-<创建时间>.journal [--until N]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+from .events import GameEvent, GameEventType
+from .journal import COMMAND, EVENT, TICK, JournalError, JournalWriter, read_journal, scan_journal
+from .session import GameSession
+from .state import GameState
+
+# 允许由对局日志调用的会话命令
+COMMANDS = frozenset({
+    'player_join', 'player_exit', 'player_character_select',
+    'team_system_activate', 'team_system_deactivate',
+})
+
+
+async def replay_records(session: GameSession, records: List[List[Any]]) -> int:
+    """在会话上依次执行记录，返回执行的记录数"""
+    state = session.game_state
+    for kind, name, data in records:
+        if kind == EVENT:
+            event = GameEvent(GameEventType[name], data)
+            try:
+                await session.handle_event(event)
+            except Exception as e:
+                # 线上处理失败的事件在重放时同样失败，与线上一致地继续
+                event.set_error(str(e))
+        elif kind == TICK:
+            state.collect_delta()
+        elif kind == COMMAND:
+            if name not in COMMANDS:
+                raise JournalError(f"未知的会话命令: {name}")
+            await getattr(session, name)(*data)
+        else:
+            raise JournalError(f"未知的记录类型: {kind}")
+    return len(records)
+
+
+async def catch_up(session: GameSession, journal: JournalWriter, seq: Optional[int]) -> int:
+    """
+    把从快照恢复、尚未启动的会话追到对局日志末尾
+
+    重放快照之后的记录，移除快照事件队列中已由这些记录处理过的事件；
+    末尾没有TICK的记录属于崩溃时未完成的tick，不重放并从日志中截掉，其事件仍在队列中。
+
+    Args:
+        seq: 快照时已写入日志的记录数，None表示旧版快照，只接着日志末尾续写
+
+    Returns:
+        重放的记录数
+    """
+    path = journal.path(session.session_id, session.created_at.timestamp())
+    loop = asyncio.get_running_loop()
+    try:
+        data = await loop.run_in_executor(None, path.read_bytes)
+    except FileNotFoundError:
+        session.journal_seq = 0
+        return 0
+    _, records, offsets = scan_journal(data)
+    if seq is None:
+        session.journal_seq = len(records)
+        return 0
+    if seq > len(records):
+        # 快照已写出而日志的缓存还没有，之间的记录已丢失
+        logger = logging.getLogger('Replay')
+        logger.warning(f"会话{session.session_id}的对局日志只有{len(records)}条记录，少于快照时的{seq}条")
+        seq = len(records)
+    cut = len(records)
+    for index in range(len(records) - 1, seq - 1, -1):
+        kind = records[index][0]
+        if kind == TICK:
+            break
+        if kind == EVENT:
+            cut = index
+    tail = records[seq:cut]
+    # 重放的命令已在日志中，不再写入
+    writer, session.journal = session.journal, None
+    try:
+        await replay_records(session, tail)
+    finally:
+        session.journal = writer
+    consumed = sum(count or 0 for kind, _, count in tail if kind == TICK)
+    for _ in range(min(consumed, session.event_queue.qsize())):
+        session.event_queue.get_nowait()
+    session.journal_seq = cut
+    if offsets[cut] < len(data):
+        await journal.truncate(session.session_id, session.created_at.timestamp(), offsets[cut])
+    return len(tail)
+
+
+async def replay(source: Union[Path, str, bytes], until: Optional[int] = None) -> GameSession:
+    """
+    由对局日志重建会话
+
+    Args:
+        source: 日志文件路径或日志内容
+        until: 只重放前until条记录，用于查看对局中途的状态
+
+    Returns:
+        重放后的会话，未启动主循环
+    """
+    header, records = read_journal(source)
+    session_id, seed, created_at = header[:3]
+    session = GameSession(
+        session_id,
+        created_at=datetime.fromtimestamp(created_at),
+        game_state=GameState(seed=seed),
+    )
+    await replay_records(session, records[:until] if until is not None else records)
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由对局日志重放对局并输出最终状态")
+    parser.add_argument('journal', type=Path, help='对局日志文件')
+    parser.add_argument('--until', type=int, default=None, help='只重放前N条记录')
+    args = parser.parse_args()
+    # 耗时写到stderr，stdout只输出最终状态的JSON
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    started = time.perf_counter()
+    session = asyncio.run(replay(args.journal, args.until))
+    elapsed = time.perf_counter() - started
+    print(json.dumps(session.game_state.snapshot(), ensure_ascii=False, indent=2, default=list))
+    logging.getLogger('Replay').info(f"重放完成，用时{elapsed:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file rng.py
+#
+
+"""
+对局随机数
+每个对局有一个种子，按用途（掷骰、发牌等）派生出互不干扰的随机数流。
+同一种子下各流的序列只取决于该流自身的调用次序，新增一种用途不会改变已有流，
+因此按对局日志重放时可以得到完全相同的结果。
+"""
+
+import random
+import secrets
+from typing import Any, Dict, Optional
+
+
+class RandomStreams:
+    """由对局种子派生的具名随机数流"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.seed = seed if seed is not None else secrets.randbits(63)
+        self._streams: Dict[str, random.Random] = {}
+
+    def stream(self, name: str) -> random.Random:
+        """取得某用途的随机数流，首次使用时由种子与名称派生"""
+        rng = self._streams.get(name)
+        if rng is None:
+            # 字符串种子经SHA-512展开，与进程的哈希随机化无关
+            rng = self._streams[name] = random.Random(f"{self.seed}:{name}")
+        return rng
+
+    def getstate(self) -> Dict[str, Any]:
+        """已使用的各流的内部状态，用于会话快照"""
+        return {
+            name: [version, list(internal), gauss]
+            for name, (version, internal, gauss) in
+            ((name, rng.getstate()) for name, rng in self._streams.items())
+        }
+
+    def setstate(self, states: Dict[str, Any]):
+        """从会话快照恢复各流的状态"""
+        for name, (version, internal, gauss) in states.items():
+            self.stream(name).setstate((version, tuple(internal), gauss))
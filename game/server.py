@@ -1,75 +1,572 @@
+import asyncio
 import logging
-import json
+import time
 import uuid
-from aiohttp import web
-from typing import Optional, Dict, Any
+from pathlib import Path
+from aiohttp import WSCloseCode, web
+from typing import Optional, Dict, Any, Union
 
-from .manager import GameManager
+from config.settings import GameSettings
+from .backpressure import DISCONNECT, DROP, TRY_AGAIN_LATER, ConnectionWriter, QueueOverflow, TokenBucket
+from .manager import GameManager, SessionExpired, expired_notice
 from .events import GameEvent, GameEventType
+from .metrics import METRICS, format_metric
+from .profiler import PROFILER, ListenerProfiler
+from .protocol import SUBPROTOCOLS, ProtocolError, event_from_message, frame_codec, get_codec
 from .session import GameSession
+from .shard import ShardRouter
+from .journal import JournalWriter
+from .lobby import DEFAULT_RATING, Lobby, Match
+from .snapshot import SnapshotStore
 
 class GameServer:
-    def __init__(self, config: dict = None):
-        self.config = config or {}
+    def __init__(self, config: Union[GameSettings, Dict[str, Any], None] = None, accounts=None):
+        """
+        Args:
+            config: 游戏配置
+            accounts: 账号管理器，用其verify_token校验/game连接的登录令牌；
+                未提供时只能以游客身份连接（需allow_guests）
+        """
+        if not isinstance(config, GameSettings):
+            config = GameSettings.from_dict(config)
+        self.config = config
+        self.accounts = accounts
+        # shards > 1 时会话运行在多个工作进程中，本进程只负责转发
+        shards = config.shards
+        # 背压：会话事件队列与每连接发送队列的上限、溢出策略以及每连接限速
+        self.backpressure = config.backpressure
         self.manager = GameManager(
-            max_sessions=self.config.get('max_sessions', 100)
+            max_sessions=config.max_sessions,
+            session_options=self._session_options(config),
+            session_timeouts=config.session_timeouts,
+            cleanup_interval=config.cleanup_interval,
+            snapshots=SnapshotStore(Path(config.snapshot_dir)) if config.snapshot_dir and shards == 1 else None,
+            journal=JournalWriter(
+                Path(config.journal_dir), config.journal_flush_interval
+            ) if config.journal_dir and shards == 1 else None,
         )
+        self.router = ShardRouter(shards, config) if shards > 1 else None
+        # 启用大厅时玩家先排队匹配，凑齐一局才创建会话；否则每个连接一个会话
+        self.lobby = None
+        if config.lobby.enabled and not self.router:
+            lobby = config.lobby
+            self.lobby = Lobby(
+                self.manager, team_sizes=lobby.team_sizes, bucket_width=lobby.bucket_width,
+                window_base=lobby.window_base, window_growth=lobby.window_growth,
+                window_max=lobby.window_max, match_interval=lobby.match_interval,
+            )
+        # 监听器剖析，默认关闭，可经/debug/profile在运行时开启
+        self._configure_profiler(config)
+        # 排空：不再接受新连接，等待已有会话结束后再退出
+        self.draining = False
+        # 打开的/game连接 -> 其发送端
+        self.connections: Dict[web.WebSocketResponse, ConnectionWriter] = {}
         self.logger = logging.getLogger('GameServer')
-    
+
+    @staticmethod
+    def _session_options(config: GameSettings) -> Dict[str, Any]:
+        """创建会话时的参数"""
+        return {
+            'batch_size': config.event_batch_size,
+            'tick_interval': config.event_tick_interval,
+            'max_queue': config.backpressure.session_queue,
+            'overflow': config.backpressure.session_overflow,
+        }
+
+    def _configure_profiler(self, config: GameSettings):
+        profiler = config.profiler
+        self.debug_remote = profiler.allow_remote
+        PROFILER.configure(enabled=profiler.enabled, sample_rate=profiler.sample_rate,
+                           slow_ms=profiler.slow_ms, slow_samples=profiler.slow_samples)
+
+    def apply_settings(self, config: GameSettings, previous: Optional[GameSettings] = None):
+        """
+        配置重新加载后应用可在运行中修改的项，进行中的对局不受影响
+        会话上限、空闲超时、批处理参数与背压对已有会话和连接立即生效；
+        分片数、快照与日志目录、大厅开关等需重启
+        """
+        previous = previous or self.config
+        self.config = config
+        if config.backpressure != previous.backpressure:
+            self.backpressure = backpressure = config.backpressure
+            for writer in self.connections.values():
+                writer.high_water = max(backpressure.send_queue, 1)
+                writer.overflow = backpressure.send_overflow
+        if config.profiler != previous.profiler:
+            self._configure_profiler(config)
+        if self.lobby and config.lobby != previous.lobby:
+            self.lobby.window_base = config.lobby.window_base
+            self.lobby.window_growth = config.lobby.window_growth
+            self.lobby.window_max = config.lobby.window_max
+            self.lobby.match_interval = config.lobby.match_interval
+        if self.router:
+            # 会话在工作进程中，设置转发给各分片
+            self.router.configure(config)
+            return
+        self.manager.configure(
+            max_sessions=config.max_sessions,
+            session_options=self._session_options(config),
+            session_timeouts=config.session_timeouts,
+            cleanup_interval=config.cleanup_interval,
+        )
+
+    async def start(self):
+        """启动分片工作进程，单进程模式下从快照恢复会话并启动本地会话清理"""
+        if self.router:
+            await self.router.start()
+        else:
+            await self.manager.restore_sessions()
+            self.manager.start()
+            if self.lobby:
+                self.lobby.start()
+
+    async def stop(self):
+        """停止分片工作进程，单进程模式下保存会话快照并结束全部会话，最后关闭仍打开的连接"""
+        if self.router:
+            await self.router.stop()
+        else:
+            if self.lobby:
+                self.lobby.stop()
+            await self.manager.shutdown()
+        for ws in list(self.connections):
+            await ws.close(code=WSCloseCode.GOING_AWAY, message=b'server shutdown')
+
+    def active_sessions(self) -> int:
+        """有客户端连接的会话数，从快照恢复后尚无人重连的会话不计入"""
+        if self.router:
+            return self.router.active_sessions
+        return sum(1 for session in self.manager.sessions.values() if session.subscribers)
+
+    async def drain(self, timeout: float, force: Optional[asyncio.Event] = None) -> int:
+        """
+        停止接受新连接与新会话，等待有连接的会话结束
+
+        Args:
+            timeout: 最长等待时间（秒）
+            force: 被设置时立即停止等待
+
+        Returns:
+            停止等待时仍未结束的会话数
+        """
+        self.draining = True
+        if self.lobby:
+            # 仍在排队的玩家收到取消，连接随之关闭
+            self.lobby.stop()
+        deadline = time.monotonic() + timeout
+        while (active := self.active_sessions()) and time.monotonic() < deadline:
+            if force is not None and force.is_set():
+                break
+            await asyncio.sleep(0.2)
+        return active
+
+    async def shard_stats_handler(self, request):
+        """各分片负载统计"""
+        if self.router:
+            stats = await self.router.stats()
+        else:
+            sessions = self.manager.sessions
+            stats = [{
+                'shard': 0,
+                'sessions': len(sessions),
+                'queued_events': sum(s.event_queue.qsize() for s in sessions.values()),
+                'expired_sessions': self.manager.expired_count,
+                'alive': True,
+            }]
+        return web.json_response(stats)
+
+    async def shard_migrate_handler(self, request):
+        """
+        把会话迁移到指定分片，用于分片间的负载均衡或在维护某个分片前移走会话
+        参数：session、shard
+        """
+        if not self._debug_allowed(request):
+            raise web.HTTPForbidden()
+        if not self.router:
+            raise web.HTTPConflict(text="未启用分片")
+        session_id = request.query.get('session')
+        try:
+            target = int(request.query.get('shard', ''))
+        except ValueError:
+            raise web.HTTPBadRequest(text="shard须为整数")
+        if not session_id or not 0 <= target < self.router.shards:
+            raise web.HTTPBadRequest(text="缺少session或shard超出范围")
+        source = self.router.shard_for(session_id)
+        migrated = await self.router.migrate(session_id, target)
+        return web.json_response({'session': session_id, 'from': source, 'to': target, 'migrated': migrated})
+
+    async def lobby_stats_handler(self, request):
+        """匹配队列统计：排队人数、成局数与排队时长分位数"""
+        if not self.lobby:
+            return web.json_response({'enabled': False})
+        return web.json_response({'enabled': True, **self.lobby.stats()})
+
+    async def metrics_handler(self, request):
+        """Prometheus格式的运行时指标"""
+        metrics = METRICS
+        if self.router:
+            stats = [s for s in await self.router.stats(include_metrics=True) if 'error' not in s]
+            metrics = METRICS.merged(s['metrics'] for s in stats)
+            active = sum(s['sessions'] for s in stats)
+            queued = sum(s['queued_events'] for s in stats)
+            deepest = max((s['max_queue_depth'] for s in stats), default=0)
+            limit = self.router.max_sessions
+        else:
+            depths = [s.event_queue.qsize() for s in self.manager.sessions.values()]
+            active, queued, deepest = len(depths), sum(depths), max(depths, default=0)
+            limit = self.manager.max_sessions
+        gauges = [
+            format_metric('sns_sessions_active', 'gauge', '活动会话数', [({}, active)]),
+            format_metric('sns_sessions_limit', 'gauge', '会话数上限', [({}, limit)]),
+            format_metric('sns_event_queue_depth', 'gauge', '全部会话事件队列中待处理的事件数', [({}, queued)]),
+            format_metric('sns_event_queue_depth_max', 'gauge', '单个会话事件队列的最大深度', [({}, deepest)]),
+        ]
+        if self.lobby:
+            gauges.append(format_metric(
+                'sns_lobby_queued_players', 'gauge', '匹配队列中的玩家数',
+                (({'team_size': str(size)}, len(queue)) for size, queue in self.lobby.queues.items()),
+            ))
+        return web.Response(
+            body=metrics.render(gauges).encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+    def _debug_allowed(self, request) -> bool:
+        """调试路由默认只接受本机请求"""
+        return self.debug_remote or request.remote in ('127.0.0.1', '::1')
+
+    async def _collect_profile(self, request) -> ListenerProfiler:
+        """
+        按POST参数修改剖析设置并返回收集的数据
+        参数：enabled=0/1、sample_rate、slow_ms、reset=1
+        """
+        options = {}
+        reset = False
+        if request.method == 'POST':
+            query = request.query
+            if 'enabled' in query:
+                options['enabled'] = query['enabled'] in ('1', 'true', 'on')
+            for key in ('sample_rate', 'slow_ms'):
+                if key in query:
+                    options[key] = float(query[key])
+            reset = query.get('reset') in ('1', 'true')
+        if not self.router:
+            if reset:
+                PROFILER.reset()
+            PROFILER.configure(**options)
+            return PROFILER
+        # 分片模式：设置下发到各工作进程，数据合并后输出
+        results = await self.router.profile(options, reset)
+        merged = ListenerProfiler()
+        if results:
+            settings = results[0]
+            merged.configure(enabled=settings['enabled'], sample_rate=settings['sample_rate'],
+                             slow_ms=settings['slow_ms'], slow_samples=settings['slow_samples'])
+        for result in results:
+            merged.merge(result['data'])
+        return merged
+
+    async def profile_handler(self, request):
+        """监听器剖析报告：设置、按总耗时排序的监听器与最近的慢调用"""
+        if not self._debug_allowed(request):
+            raise web.HTTPForbidden()
+        try:
+            top = int(request.query.get('top', 50))
+        except ValueError:
+            raise web.HTTPBadRequest(text="top须为整数")
+        try:
+            profiler = await self._collect_profile(request)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        return web.json_response(profiler.report(top))
+
+    async def profile_collapsed_handler(self, request):
+        """折叠栈文本，可直接交给flamegraph.pl或speedscope"""
+        if not self._debug_allowed(request):
+            raise web.HTTPForbidden()
+        profiler = await self._collect_profile(request)
+        return web.Response(text=profiler.collapsed())
+
     async def websocket_handler(self, request):
         """WebSocket处理器"""
-        ws = web.WebSocketResponse()
+        if self.draining:
+            # 进程排空中，客户端应重新连接到其他工作进程
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'})
+        player_id = self.authenticate(request)
+        if player_id is None:
+            raise web.HTTPUnauthorized(text="需要有效的登录令牌")
+        backpressure = self.backpressure
+        ws = web.WebSocketResponse(protocols=SUBPROTOCOLS, max_msg_size=backpressure.max_message_size)
         await ws.prepare(request)
-        
-        session_id = str(uuid.uuid4())
-        session = await self.manager.create_session(session_id)
+        # 回复使用握手时协商的编码，经有上限的发送队列由独立任务写出
+        writer = ConnectionWriter(
+            ws, get_codec(ws.ws_protocol),
+            high_water=backpressure.send_queue,
+            overflow=backpressure.send_overflow,
+        )
+
+        METRICS.connections += 1
+        self.connections[ws] = writer
+        try:
+            if self.router:
+                return await self._forward_websocket(ws, writer, player_id, request.query.get('session'))
+            return await self._serve_websocket(request, ws, writer, player_id)
+        finally:
+            METRICS.connections -= 1
+            self.connections.pop(ws, None)
+            await writer.close()
+
+    def authenticate(self, request) -> Optional[str]:
+        """
+        连接的玩家身份：取自账号登录签发的令牌（查询参数token或Authorization: Bearer），
+        未带令牌且允许游客时分配随机的游客身份；认证失败返回None
+        """
+        token = request.query.get('token')
+        if token is None:
+            header = request.headers.get('Authorization', '')
+            if header.startswith('Bearer '):
+                token = header[len('Bearer '):]
+        if token:
+            return self.accounts.verify_token(token) if self.accounts else None
+        if self.config.allow_guests:
+            # 用户名不含'-'，游客身份不会与账号冲突
+            return f"guest-{uuid.uuid4().hex}"
+        return None
+
+    async def _frames(self, ws: web.WebSocketResponse, writer: ConnectionWriter):
+        """
+        连接上收到的消息帧(数据, 是否二进制)，超过令牌桶限速的帧按策略丢弃或断开连接
+        重新加载配置后限速立即对已有连接生效
+        """
+        backpressure = self.backpressure
+        bucket = TokenBucket(backpressure.rate, backpressure.burst)
+        limited = False
+        async for msg in ws:
+            if msg.type in (web.WSMsgType.TEXT, web.WSMsgType.BINARY):
+                METRICS.messages_in += 1
+                if backpressure is not self.backpressure:
+                    backpressure = self.backpressure
+                    bucket.rate = backpressure.rate
+                    bucket.capacity = max(backpressure.burst, 1)
+                if backpressure.rate > 0 and not bucket.take():
+                    if backpressure.rate_overflow == DISCONNECT:
+                        METRICS.backpressure('rate_limit', DISCONNECT)
+                        await ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b'rate limited')
+                        break
+                    METRICS.backpressure('rate_limit', DROP)
+                    if not limited:
+                        # 每次进入限速只提示一次，避免回复随洪泛放大
+                        writer.send({"error": "rate limited"})
+                        limited = True
+                    continue
+                limited = False
+                yield msg.data, msg.type == web.WSMsgType.BINARY
+            elif msg.type == web.WSMsgType.ERROR:
+                self.logger.error("WebSocket连接错误")
+
+    async def _serve_websocket(self, request, ws: web.WebSocketResponse, writer: ConnectionWriter,
+                               player_id: str):
+        """单进程模式：以认证的玩家身份加入会话并处理连接上的消息"""
+        # 客户端可带上会话ID重新连接从快照恢复的会话
+        session_id = request.query.get('session')
+        session = self.manager.sessions.get(session_id) if session_id else None
+        if session is not None and not self._can_rejoin(session, player_id):
+            session = None
+        if session is None:
+            if self.lobby:
+                match = await self._matchmake(request, ws, writer, player_id)
+                session_id = match.session_id if match else None
+                session = self.manager.sessions.get(session_id) if match else None
+            else:
+                session_id = str(uuid.uuid4())
+                session = await self.manager.create_session(session_id)
+                if session is not None:
+                    # 记录会话所属的玩家，从快照恢复后只有该玩家能重连
+                    await session.player_join(player_id)
         
         if not session:
+            # 写完排队失败等错误回复后再关闭
+            await writer.close()
             await ws.close()
             return ws
+
+        # 会话每个tick推送一次合并后的处理结果，发送队列溢出时合并为全量快照
+        writer.resync = session.resync
+
+        async def send_result(result: Dict[str, Any]):
+            writer.send(result)
+            if result.get("expired"):
+                # 会话已超时结束，写完通知后关闭连接，客户端需重新加入
+                writer.finish(WSCloseCode.GOING_AWAY, b'session expired')
+
+        session.subscribe(send_result)
+        # 加入时发送一次全量快照，之后只推送增量
+        writer.send(session.resync())
         
         try:
-            async for msg in ws:
-                if msg.type == web.WSMsgType.TEXT:
-                    message = json.loads(msg.data)
-                    response = await self.handle_client_message(session_id, message)
-                    await ws.send_str(json.dumps(response))
-                elif msg.type == web.WSMsgType.ERROR:
-                    self.logger.error("WebSocket连接错误")
+            async for frame, binary in self._frames(ws, writer):
+                try:
+                    response = await self.handle_client_frame(session_id, frame, binary, player_id)
+                except QueueOverflow:
+                    await ws.close(code=TRY_AGAIN_LATER, message=b'session queue full')
+                    break
+                except SessionExpired as e:
+                    writer.send(expired_notice(str(e)))
+                    writer.finish(WSCloseCode.GOING_AWAY, b'session expired')
+                    break
+                if response:
+                    writer.send(response)
                     
         finally:
-            await self.manager.end_session(session_id)
+            session.unsubscribe(send_result)
+            if self.lobby:
+                # 多人会话在最后一名玩家断开后结束
+                await session.player_exit(player_id)
+                if not session.subscribers:
+                    await self.manager.end_session(session_id)
+            else:
+                await self.manager.end_session(session_id)
+            await writer.close()
             await ws.close()
             
         return ws
+
+    def _can_rejoin(self, session: GameSession, player_id: str) -> bool:
+        """
+        只有会话中的玩家（连接令牌认证的身份）可重连；
+        大厅模式下同局的其他玩家可能仍在连接，单人会话模式下只能接管无连接的会话
+        """
+        if player_id not in session.game_state.player_in_order:
+            return False
+        return bool(self.lobby) or not session.subscribers
+
+    async def _matchmake(self, request, ws: web.WebSocketResponse, writer: ConnectionWriter,
+                         player_id: str) -> Optional[Match]:
+        """排队等待成局，连接在排队期间断开时离开队列并返回None"""
+        try:
+            team_size = int(request.query.get('team_size', 1))
+            # 匹配分数取自账号存储，不由客户端提供
+            rating = await self.accounts.rating(player_id) if self.accounts else DEFAULT_RATING
+            ticket = self.lobby.enqueue(player_id, rating, team_size)
+        except ValueError as e:
+            writer.send({"error": str(e)})
+            return None
+        writer.send({"lobby": {"queued": True, "player": player_id, "team_size": team_size}})
+
+        async def watch_connection():
+            # 排队期间忽略客户端消息，只需发现连接断开
+            async for _ in ws:
+                pass
+
+        watcher = asyncio.create_task(watch_connection())
+        try:
+            await asyncio.wait({ticket.future, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # 等待取消完成，之后主循环才能再次读取连接
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        if not ticket.future.done() or ticket.future.cancelled():
+            self.lobby.cancel(ticket)
+            return None
+        match = ticket.future.result()
+        writer.send({"lobby": {"matched": match.session_id, "teams": match.teams}})
+        return match
+
+    async def _forward_websocket(self, ws: web.WebSocketResponse, writer: ConnectionWriter,
+                                 player_id: str, resume_id: Optional[str] = None):
+        """
+        分片模式：把连接上的原始帧转发到会话所在的工作进程解码
+        会话状态在工作进程中，发送队列溢出时合并为重新同步通知
+        """
+        if resume_id and self.router.can_resume(resume_id, player_id):
+            session_id = resume_id
+        else:
+            session_id = str(uuid.uuid4())
+
+        async def close(code: int, reason: bytes):
+            # 会话事件队列已满且策略为断开、会话已超时结束，或分片进程退出；
+            # 先写完已排队的回复（如会话结束通知）再关闭
+            writer.finish(code, reason)
+
+        if not await self.router.create_session(session_id, writer.send_result, close, player_id):
+            await ws.close()
+            return ws
+
+        try:
+            async for frame, binary in self._frames(ws, writer):
+                self.router.forward(session_id, frame, binary)
+
+        finally:
+            await self.router.end_session(session_id)
+            await writer.close()
+            await ws.close()
+
+        return ws
         
     async def handle_client_message(self, 
                                   session_id: str, 
-                                  message: dict) -> Dict[str, Any]:
-        """处理客户端消息"""
+                                  message: dict) -> Optional[Dict[str, Any]]:
+        """处理客户端消息，事件入队后由会话按tick合并回复，仅在出错时立即回复"""
         try:
-            session = await self._get_or_create_session(session_id)
-            if not session:
-                return {"error": "会话创建失败"}
-                
             event = self._create_event_from_message(message)
-            await session.process_event(event)
+        except ProtocolError as e:
+            return self._protocol_error(e)
+        except Exception as e:
+            self.logger.error(f"消息处理失败: {e}", exc_info=True)
+            return {"error": str(e)}
+        return await self._submit_event(session_id, event)
+
+    async def handle_client_frame(self,
+                                  session_id: str,
+                                  frame: Union[str, bytes],
+                                  binary: bool = False,
+                                  player_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        解码WebSocket帧并处理，文本帧为JSON，二进制帧为MessagePack
+        解码时只接受客户端事件类型（protocol.CLIENT_EVENT_TYPES）；
+        给出player_id时，事件数据中的player须为连接认证的玩家
+        """
+        try:
+            event = frame_codec(binary).decode(frame)
+            player = event.data.get("player")
+            if player_id is not None and player is not None and player != player_id:
+                raise ProtocolError("不能以其他玩家的身份发送事件")
+        except ProtocolError as e:
+            return self._protocol_error(e)
+        except Exception as e:
+            self.logger.error(f"消息解码失败: {e}", exc_info=True)
+            return {"error": str(e)}
+        return await self._submit_event(session_id, event)
+
+    def _protocol_error(self, error: ProtocolError) -> Dict[str, Any]:
+        """格式错误的消息只回复给发送方，不进入会话"""
+        self.logger.warning(f"消息格式错误: {error}")
+        return {"error": str(error), "protocol_error": True}
+
+    async def _submit_event(self, session_id: str, event: GameEvent) -> Optional[Dict[str, Any]]:
+        """把事件交给会话处理，会话已超时结束时抛出SessionExpired，不再重新创建"""
+        session = self.manager.sessions.get(session_id)
+        if session is None:
+            raise SessionExpired("会话已结束，请重新加入")
+        try:
+            if event.event_type is GameEventType.STATE_RESYNC:
+                # 重新同步只回复给请求的客户端，不进入事件队列
+                return session.resync(event.data.get("version"))
+                
+            if not await session.process_event(event):
+                # 会话事件队列已满，事件被丢弃
+                reply = {"error": "事件队列已满", "dropped": event.event_type.name}
+                if event.data.get("ref") is not None:
+                    reply["ref"] = event.data["ref"]
+                return reply
             
-            return {"success": True}
+            return None
             
+        except QueueOverflow:
+            raise
         except Exception as e:
             self.logger.error(f"消息处理失败: {e}", exc_info=True)
             return {"error": str(e)}
     
-    async def _get_or_create_session(self, session_id: str) -> Optional[GameSession]:
-        """获取或创建游戏会话"""
-        session = self.manager.sessions.get(session_id)
-        if not session:
-            session = await self.manager.create_session(session_id)
-        return session
-    
     def _create_event_from_message(self, message: dict) -> GameEvent:
         """从消息创建游戏事件"""
-        event_type = GameEventType[message.get("event_type", "UNKNOWN")]
-        data = message.get("data", {})
-        return GameEvent(event_type=event_type, data=data)
\ No newline at end of file
+        return event_from_message(message)
\ No newline at end of file
@@ -1,57 +1,307 @@
 import asyncio
 import logging
+import time
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from .core import GameCore
+from .cards import CardSystem
+from .character import CHARACTERS, Character
+from .combat import CombatSystem
+from .events import EventDispatcher, GameEvent, GameEventType
+from .journal import COMMAND, EVENT, TICK
+from .backpressure import COALESCE, DISCONNECT, DROP, QueueOverflow, check_policy
+from .metrics import METRICS
+from .state import GameState
 
-state = GameCore.state
+# 快照只在处理了这些事件的tick结束时保存，即回合边界与对局设置（加入、选角）的变化；
+# 快照记录保存时已写入对局日志的记录数，回合中途崩溃后恢复时由replay.catch_up重放之后的记录
+SNAPSHOT_EVENTS = frozenset({
+    GameEventType.TURN_START, GameEventType.TURN_END, GameEventType.ROUND_CHANGE,
+    GameEventType.PLAYER_JOIN, GameEventType.PLAYER_LEAVE,
+    GameEventType.CHARACTER_SELECT, GameEventType.CHARACTER_UNSELECT,
+})
 
 @dataclass
 class GameSession:
     session_id: str
     created_at: datetime = field(default_factory=datetime.now)
-    game_state: state = field(default_factory=state)
+    game_state: GameState = field(default_factory=GameState)
     event_queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    batch_size: int = 64            # 每个tick最多处理的事件数，1即逐条处理
+    tick_interval: float = 0.0      # 每个tick收集事件的时长（秒），0表示不等待
+    session_type: str = "default"   # 会话类型，决定空闲超时时长
+    snapshots: Optional[Any] = None # SnapshotStore，回合边界的tick结束时保存快照
+    journal: Optional[Any] = None   # JournalWriter，记录会话接受的事件与命令以便重放
+    max_queue: int = 1024           # 事件队列上限，0表示不限
+    overflow: str = COALESCE        # 事件队列满时的策略：drop、coalesce或disconnect
     
     def __post_init__(self):
+        check_policy(self.overflow)
         self.lock = asyncio.Lock()
         self.is_active = True
+        self.last_active = time.monotonic()     # 最后活跃时间（单调时钟）
         self.logger = logging.getLogger(f"Session_{self.session_id}")
+        self.dispatcher: EventDispatcher = self.game_state.event_dispatcher
+        self.game_state.id = self.session_id
+        self.subscribers: List[Callable[[Dict[str, Any]], Awaitable]] = []
+        self._snapshot_due = True       # 下一个tick结束时保存快照，新会话先保存一次
+        self.journal_seq = 0            # 本局已写入对局日志的记录数，随快照保存
+        # 伤害与治疗结算，掷骰使用对局的随机数流
+        self.combat = CombatSystem(self.game_state)
+        # 抽牌与出牌结算，洗牌使用对局的随机数流
+        self.cards = CardSystem(self.game_state)
+        if self.journal is not None:
+            self.journal.open(self.session_id, self.game_state.rng.seed, self.created_at.timestamp())
+
+    def _record(self, kind: int, name: Optional[str] = None, data: Any = None):
+        """写入对局日志，调用方需持有会话锁以保证记录顺序与处理顺序一致"""
+        if self.journal is not None:
+            self.journal.append(self.session_id, kind, name, data)
+            self.journal_seq += 1
+        if kind == COMMAND:
+            # 命令只用于对局设置，视同回合边界
+            self._snapshot_due = True
+
+    async def run(self):
+        """会话主循环"""
+        await self.process_events()
+
+    async def cleanup(self):
+        """停止会话主循环"""
+        self.is_active = False
+        self.subscribers.clear()
+        self.event_queue.put_nowait(None)
+        if self.journal is not None:
+            self.journal.close_session(self.session_id)
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], Awaitable]):
+        """订阅每个tick的合并处理结果"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Any]], Awaitable]):
+        """取消订阅"""
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    async def process_event(self, event: GameEvent) -> bool:
+        """
+        将客户端事件放入队列，由会话主循环批量处理
+
+        Returns:
+            事件是否已入队或并入排队中的事件，队列已满被丢弃时为False
+
+        Raises:
+            QueueOverflow: 队列已满且策略为disconnect
+        """
+        self.last_active = time.monotonic()
+        if self.max_queue and self.event_queue.qsize() >= self.max_queue:
+            return self._overflow(event)
+        self.event_queue.put_nowait(event)
+        return True
+
+    def _overflow(self, event: GameEvent) -> bool:
+        """事件队列已满时按策略处理新事件"""
+        if self.overflow == DISCONNECT:
+            METRICS.backpressure('session_queue', DISCONNECT)
+            raise QueueOverflow(f"会话{self.session_id}事件队列已满")
+        if self.overflow == COALESCE:
+            # 只能并入队尾的事件，且二者属于同一玩家、可以合并，合并不改变任何事件的先后
+            queue = self.event_queue._queue
+            key = self._coalesce_key(event)
+            if key is not None and queue and queue[-1] is not None and self._coalesce_key(queue[-1]) == key:
+                self._merge_into(queue[-1], event)
+                METRICS.backpressure('session_queue', COALESCE)
+                return True
+        METRICS.backpressure('session_queue', DROP)
+        return False
+
+    def resync(self, version: Optional[int] = None) -> Dict[str, Any]:
+        """客户端加入或请求重新同步时的状态回复"""
+        return self.game_state.resync(version)
+
+    async def handle_event(self, event: GameEvent) -> GameEvent:
+        """处理单个事件，调用方需持有会话锁"""
+        return await self.dispatcher.dispatch(event)
 
     async def process_events(self):
+        """按tick批量取出队列中的事件，在一次加锁内顺序处理并合并回复"""
         while self.is_active:
             event = await self.event_queue.get()
-            await self.handle_event(event)
+            if event is None:
+                break
+            if self.tick_interval > 0:
+                await asyncio.sleep(self.tick_interval)
+            batch = [event]
+            while len(batch) < self.batch_size and not self.event_queue.empty():
+                event = self.event_queue.get_nowait()
+                if event is None:
+                    break
+                batch.append(event)
+
+            try:
+                events, merged = self._coalesce(batch)
+            except Exception as e:
+                self.logger.error(f"事件合并失败，本tick不合并: {e}", exc_info=True)
+                events, merged = batch, 0
+            delta = None
+            async with self.lock:
+                started = time.perf_counter()
+                for event in events:
+                    try:
+                        self._record(EVENT, event.event_type.name, event.data)
+                        await self.handle_event(event)
+                    except Exception as e:
+                        self.logger.error(f"事件处理失败: {e}", exc_info=True)
+                        event.set_error(str(e))
+                # tick结束，记录取出的事件数；恢复时据此移除快照事件队列中已处理的事件
+                self._record(TICK, None, len(batch))
+                try:
+                    delta = self.game_state.collect_delta()
+                    if self.snapshots is not None and (
+                            self._snapshot_due or any(e.event_type in SNAPSHOT_EVENTS for e in events)):
+                        # 快照负载只在锁内复制，编码与写入在存储的线程中完成
+                        self._snapshot_due = False
+                        self.snapshots.save(self)
+                except Exception as e:
+                    # 本tick的事件已处理，客户端可请求重新同步
+                    self.logger.error(f"状态增量或快照失败: {e}", exc_info=True)
+            METRICS.observe_tick(time.perf_counter() - started, len(events), merged)
+            await self._publish(events, merged, delta)
+
+    @staticmethod
+    def _coalesce_key(event: GameEvent) -> Optional[Tuple[Any, str]]:
+        """可合并事件的键，同一玩家的同类事件可合并"""
+        data = event.data
+        player = data.get("player") if isinstance(data, dict) else None
+        if not isinstance(player, str):
+            return None
+        if event.event_type is GameEventType.CHARACTER_UPDATE:
+            return player, "update"
+        if event.event_type in (GameEventType.PLAYER_READY, GameEventType.PLAYER_UNREADY):
+            return player, "ready"
+        return None
+
+    def _coalesce(self, batch: List[GameEvent]) -> Tuple[List[GameEvent], int]:
+        """
+        合并一批事件中相邻的、同一玩家的CHARACTER_UPDATE或准备状态切换。
+        只合并相邻的事件，其他玩家的事件不会被越过，任何两个事件的先后不变。
+        """
+        if len(batch) == 1:
+            return batch, 0
+        events: List[GameEvent] = []
+        last_key = None
+        merged = 0
+        for event in batch:
+            key = self._coalesce_key(event)
+            if key is not None and key == last_key:
+                self._merge_into(events[-1], event)
+                merged += 1
+                continue
+            events.append(event)
+            last_key = key
+        return events, merged
+
+    @staticmethod
+    def _merge_into(target: GameEvent, event: GameEvent):
+        """把event并入键相同的target：更新合并字段，准备状态只保留最后一次切换"""
+        if target.event_type is GameEventType.CHARACTER_UPDATE:
+            target.data.update(event.data)
+        else:
+            target.event_type = event.event_type
+            target.data = event.data
+
+    @staticmethod
+    def _event_result(event: GameEvent) -> Dict[str, Any]:
+        result = {
+            "seq": event.seq,
+            "event_type": event.event_type.name,
+            "cancel": event.cancel,
+            "error": event.error,
+        }
+        # 客户端在事件数据中带上ref时原样返回，用于确认自己的哪条消息已处理
+        ref = event.data.get("ref") if isinstance(event.data, dict) else None
+        if ref is not None:
+            result["ref"] = ref
+        return result
+
+    async def _publish(self, events: List[GameEvent], merged: int, delta: Optional[Dict[str, Any]] = None):
+        """向订阅者发送一个tick的合并结果，附带本tick的状态增量"""
+        if not self.subscribers:
+            return
+        result = {
+            "success": all(event.error is None for event in events),
+            "merged": merged,
+            "events": [self._event_result(event) for event in events],
+        }
+        if delta is not None:
+            result["delta"] = delta
+        await self.notify(result)
+
+    async def notify(self, message: Dict[str, Any]):
+        """向全部订阅者推送一条消息"""
+        for callback in list(self.subscribers):
+            try:
+                await callback(message)
+            except Exception as e:
+                self.logger.warning(f"结果推送失败: {e}")
 
     async def player_join(self, player_id: str):
         async with self.lock:
-            if player_id not in self.game_state.players:
+            self._record(COMMAND, 'player_join', [player_id])
+            if player_id not in self.game_state.player_in_order:
                 self.game_state.player_in_order.append(player_id)
+                self.game_state.mark_dirty('player_in_order')
                 self.logger.info(f"Player joined: {player_id}")
             else:
                 self.logger.warning(f"Player {player_id} is already in the game.")
 
     async def player_exit(self, player_id: str):
         async with self.lock:
-            if player_id in self.game_state.players:
-                del self.game_state.players[player_id]
+            self._record(COMMAND, 'player_exit', [player_id])
+            if player_id in self.game_state.player_in_order:
+                self.game_state.traits.detach(player_id)
+                character = self.game_state.players.pop(player_id, None)
+                if character is not None:
+                    self.game_state.character_selected.remove(type(character).__name__)
+                    self.game_state.mark_dirty('character_selected')
                 self.game_state.player_in_order.remove(player_id)
+                self.game_state.mark_dirty('player_in_order')
+                self.game_state.mark_player_removed(player_id)
                 self.logger.info(f"Player exited: {player_id}")
             else:
                 self.logger.warning(f"Player {player_id} not found.")
 
-    async def team_system_activate(self):
+    async def team_system_activate(self, teams: Optional[Dict[str, int]] = None):
+        """
+        启用队伍系统
+
+        Args:
+            teams: 玩家 -> 队伍编号，随命令写入对局日志，已选择和之后选择的角色按此分队
+        """
         async with self.lock:
-            if not self.game_state.is_team_system_active:
-                self.game_state.is_team_system_active = True
+            self._record(COMMAND, 'team_system_activate', [] if teams is None else [dict(teams)])
+            state = self.game_state
+            if teams is not None:
+                state.teams = dict(teams)
+                for player_id, character in state.players.items():
+                    self._assign_team(player_id, character)
+            if not state.is_team_system_active:
+                state.is_team_system_active = True
                 self.logger.info("Team system activated.")
             else:
                 self.logger.warning("Team system is already active.")
 
+    def _assign_team(self, player_id: str, character: Character):
+        """按分队结果设置角色的队伍编号"""
+        team = self.game_state.teams.get(player_id)
+        if team is not None and character.team != team:
+            character.team = team
+            self.game_state.mark_player_dirty(player_id, 'team')
+
     async def team_system_deactivate(self):
         async with self.lock:
+            self._record(COMMAND, 'team_system_deactivate', [])
             if self.game_state.is_team_system_active:
                 self.game_state.is_team_system_active = False
                 self.logger.info("Team system deactivated.")
@@ -60,13 +310,25 @@ class GameSession:
 
     async def player_character_select(self, player_id: str, character_name: str):
         async with self.lock:
-            if character_name in self.game_state.character_selected:
+            self._record(COMMAND, 'player_character_select', [player_id, character_name])
+            if character_name not in CHARACTERS:
+                self.logger.warning(f"Character {character_name} does not exist.")
+                return
+            elif character_name in self.game_state.character_selected:
                 self.logger.warning(f"Character {character_name} is already selected.")
                 return
-            elif player_id in self.game_state.players:
-                if self.game_state.players[player_id].name:
-                    self.game_state.character_selected.remove(self.game_state.players[player_id].name)
-                self.game_state.players[player_id] = GameCore.character
+            elif player_id in self.game_state.player_in_order:
+                previous = self.game_state.players.get(player_id)
+                if previous is not None:
+                    self.game_state.character_selected.remove(type(previous).__name__)
+                character = CHARACTERS[character_name]()
+                self.game_state.players[player_id] = character
+                self._assign_team(player_id, character)
+                self.game_state.character_selected.append(character_name)
+                self.game_state.mark_dirty('character_selected')
+                # 只为对局中实际存在的角色注册特质监听器
+                self.game_state.traits.attach(player_id, character)
+                self.game_state.mark_player_dirty(player_id)
                 self.logger.info(f"Player {player_id} selected character: {character_name}")
             else:
                 self.logger.warning(f"Player {player_id} not found.")
\ No newline at end of file
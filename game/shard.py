@@ -0,0 +1,625 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file shard.py
+#
+
+"""
+多进程会话分片
+前端进程按session_id一致性哈希把会话分配到N个工作进程，
+每个工作进程有独立的事件循环与GameManager，消息经multiprocessing管道转发。
+工作进程从各自的快照目录恢复的会话，以及迁移到其他分片的会话，在前端按会话固定路由。
+"""
+
+import asyncio
+import bisect
+import dataclasses
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from config.settings import GameSettings
+from .backpressure import GOING_AWAY, TRY_AGAIN_LATER, QueueOverflow
+from .manager import SessionExpired, expired_notice, resize_semaphore
+from .metrics import METRICS
+from .profiler import PROFILER
+
+
+class ConsistentHashRing:
+    """带虚拟节点的一致性哈希环"""
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted(
+            (self._hash(f"shard-{node}:{i}"), node)
+            for node in range(nodes)
+            for i in range(replicas)
+        )
+        self._keys = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def get_node(self, key: str) -> int:
+        """返回key所在的节点编号"""
+        index = bisect.bisect(self._keys, self._hash(key))
+        if index == len(self._keys):
+            index = 0
+        return self._nodes[index]
+
+
+REQUEST_TIMEOUT = 5.0       # 等待分片回复的默认时长（秒）
+RESTART_DELAY = 1.0         # 分片进程异常退出后重启前的等待（秒），连续崩溃时加倍
+RESTART_DELAY_MAX = 30.0
+STABLE_AFTER = 10.0         # 运行超过该时长后退出，重启等待恢复为RESTART_DELAY
+
+
+def _drain_connection(conn, inbox: asyncio.Queue):
+    """管道可读时把已到达的消息全部放入队列"""
+    try:
+        while conn.poll():
+            inbox.put_nowait(conn.recv())
+    except (EOFError, OSError):
+        inbox.put_nowait(('stop',))
+
+
+class PipeSender:
+    """
+    管道的发送端：消息由专用线程按顺序写入管道
+    对端处理不及时、管道缓冲区写满时只阻塞该线程，不阻塞事件循环，
+    两端同时写满缓冲区也不会互相等待
+    """
+
+    def __init__(self, conn, name: str):
+        self.conn = conn
+        self.closed = False
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self.logger = logging.getLogger('PipeSender')
+
+    def send(self, message: tuple) -> bool:
+        """放入发送队列，管道已关闭时返回False"""
+        if self.closed:
+            return False
+        self._queue.put(message)
+        return True
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            try:
+                self.conn.send(message)
+            except (BrokenPipeError, EOFError, OSError):
+                self.closed = True
+                break
+            except Exception as e:
+                # 无法序列化的消息只丢弃这一条，等待回复的一方按超时处理
+                self.logger.error(f"管道消息发送失败: {e}", exc_info=True)
+
+    def close(self):
+        """发送完已排队的消息后结束发送线程，不等待"""
+        self.closed = True
+        self._queue.put(None)
+
+    def join(self, timeout: Optional[float] = None):
+        """等待发送线程结束"""
+        self._thread.join(timeout)
+
+
+def _shard_settings(config: GameSettings, shard_id: int) -> GameSettings:
+    """分片进程的配置：单进程运行，每个分片使用独立的快照目录"""
+    snapshot_dir = config.snapshot_dir
+    if snapshot_dir:
+        snapshot_dir = os.path.join(snapshot_dir, f"shard-{shard_id}")
+    return dataclasses.replace(config, shards=1, snapshot_dir=snapshot_dir)
+
+
+def shard_main(shard_id: int, conn, config: GameSettings):
+    """工作进程入口"""
+    asyncio.run(_shard_loop(shard_id, conn, config))
+
+
+async def _shard_loop(shard_id: int, conn, config: GameSettings):
+    """
+    工作进程主循环：运行本分片的GameServer并处理前端转发的消息
+
+    前端的请求为(类型, 请求ID, 参数...)，以('reply', 请求ID, 结果)回复；
+    其余消息不回复
+    """
+    from .server import GameServer
+
+    logger = logging.getLogger(f"Shard_{shard_id}")
+    sender = PipeSender(conn, f"sns-shard-{shard_id}-send")
+    server = GameServer(_shard_settings(config, shard_id))
+    await server.start()
+    if server.manager.sessions:
+        # 附带各会话中的玩家，前端只让这些玩家重连
+        sender.send(('restored', shard_id, {
+            sid: list(session.game_state.player_in_order) for sid, session in server.manager.sessions.items()
+        }))
+    started_at = time.monotonic()
+    messages = 0
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+    loop.add_reader(conn.fileno(), _drain_connection, conn, inbox)
+
+    def make_sender(session_id: str):
+        async def send_result(result: Dict[str, Any]):
+            sender.send(('result', session_id, result))
+        return send_result
+
+    # 会话 -> 连接认证的玩家，该连接的事件只能以此玩家身份发送
+    players: Dict[str, str] = {}
+
+    async def create(session_id: str, player_id: Optional[str] = None) -> bool:
+        # 从快照恢复、尚无连接的会话由其中的玩家接管
+        session = server.manager.sessions.get(session_id)
+        if session is None:
+            session = await server.manager.create_session(session_id)
+            if session is not None and player_id is not None:
+                await session.player_join(player_id)
+        elif session.subscribers or (player_id is not None
+                                     and player_id not in session.game_state.player_in_order):
+            session = None
+        if session is None:
+            return False
+        if player_id is not None:
+            players[session_id] = player_id
+        session.subscribe(make_sender(session_id))
+        return True
+
+    async def import_session(session_id: str, data: bytes, player_id: Optional[str] = None) -> bool:
+        try:
+            session = await server.manager.import_session(data)
+        except Exception as e:
+            logger.error(f"会话{session_id}导入失败: {e}", exc_info=True)
+            return False
+        if session is None:
+            return False
+        if player_id is not None:
+            players[session_id] = player_id
+        session.subscribe(make_sender(session_id))
+        return True
+
+    async def stats(include_metrics: bool = False) -> Dict[str, Any]:
+        sessions = server.manager.sessions
+        depths = [s.event_queue.qsize() for s in sessions.values()]
+        result = {
+            'shard': shard_id,
+            'sessions': len(sessions),
+            'queued_events': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'messages': messages,
+            'expired_sessions': server.manager.expired_count,
+            'uptime': time.monotonic() - started_at,
+        }
+        if include_metrics:
+            # 前端抓取/metrics时附带本进程的事件分发与tick计数
+            result['metrics'] = METRICS.export()
+        return result
+
+    async def profile(options: Optional[Dict[str, Any]], reset: bool) -> Dict[str, Any]:
+        # 修改监听器剖析设置（可选）并返回本进程收集的数据
+        if reset:
+            PROFILER.reset()
+        if options:
+            PROFILER.configure(**options)
+        return {**PROFILER.settings(), 'data': PROFILER.export()}
+
+    async def export_session(session_id: str) -> Optional[bytes]:
+        players.pop(session_id, None)
+        return await server.manager.export_session(session_id)
+
+    requests = {
+        'create': create,
+        'export': export_session,
+        'import': import_session,
+        'stats': stats,
+        'profile': profile,
+    }
+
+    try:
+        while True:
+            message = await inbox.get()
+            kind = message[0]
+            if kind == 'stop':
+                break
+            try:
+                if kind == 'message':
+                    _, session_id, frame, binary = message
+                    messages += 1
+                    try:
+                        response = await server.handle_client_frame(
+                            session_id, frame, binary, players.get(session_id))
+                    except QueueOverflow as e:
+                        # 会话事件队列已满且策略为断开，由前端关闭连接
+                        sender.send(('close', session_id, str(e), TRY_AGAIN_LATER, b'session queue full'))
+                        continue
+                    except SessionExpired as e:
+                        # 会话已超时结束，前端转发通知后关闭连接
+                        sender.send(('result', session_id, expired_notice(str(e))))
+                        continue
+                    if response:
+                        sender.send(('result', session_id, response))
+                elif kind == 'end':
+                    players.pop(message[1], None)
+                    await server.manager.end_session(message[1])
+                elif kind == 'settings':
+                    # 前端重新加载了配置
+                    server.apply_settings(_shard_settings(message[1], shard_id))
+                elif kind in requests:
+                    _, request_id, *args = message
+                    try:
+                        result = await requests[kind](*args)
+                    except Exception as e:
+                        logger.error(f"请求{kind}处理失败: {e}", exc_info=True)
+                        result = None
+                    sender.send(('reply', request_id, result))
+                    if kind == 'create' and result:
+                        # 回复创建结果之后紧接着发送全量快照，前端按此顺序处理
+                        session_id = args[0]
+                        sender.send(('result', session_id, server.manager.sessions[session_id].resync()))
+            except Exception as e:
+                logger.error(f"消息{kind}处理失败: {e}", exc_info=True)
+    except Exception as e:
+        logger.error(f"分片进程异常退出: {e}", exc_info=True)
+    finally:
+        loop.remove_reader(conn.fileno())
+        await server.stop()
+        sender.close()
+        await loop.run_in_executor(None, sender.join, 5)
+        conn.close()
+
+
+class ShardRouter:
+    """
+    前端进程的分片路由
+
+    负责启动工作进程、按一致性哈希转发消息、在全部分片上限制会话总数，
+    并把工作进程返回的结果交给各会话注册的回调。
+    工作进程异常退出时，等待中的请求立即失败，该分片上会话的连接被断开，
+    进程按退避间隔重启，重启后从快照恢复的会话可由客户端重连接管。
+    """
+
+    def __init__(self, shards: int, config: GameSettings, request_timeout: float = REQUEST_TIMEOUT):
+        self.shards = shards
+        self.config = config
+        self.ring = ConsistentHashRing(shards)
+        self.max_sessions = config.max_sessions
+        self.session_semaphore = asyncio.Semaphore(self.max_sessions)
+        self._held_slots: List[asyncio.Task] = []     # 下调上限后持有多余名额的任务
+        self.request_timeout = request_timeout
+        self.logger = logging.getLogger('ShardRouter')
+
+        self._context = multiprocessing.get_context('spawn')
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * shards
+        self._connections: List[Any] = [None] * shards
+        self._senders: List[Optional[PipeSender]] = [None] * shards
+        self._pumps: List[Optional[asyncio.Task]] = [None] * shards
+        self._started_at = [0.0] * shards
+        self._restart_delay = [0.0] * shards
+        self.restarts = [0] * shards
+        self._stopping = False
+        # 会话持有全局名额当且仅当登记了回调
+        self._callbacks: Dict[str, Callable[[Dict[str, Any]], Awaitable]] = {}
+        self._closers: Dict[str, Callable[[int, bytes], Awaitable]] = {}   # 需要断开连接时的回调
+        self._players: Dict[str, str] = {}          # 会话 -> 连接认证的玩家，迁移时随会话转交
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}     # 请求ID -> (分片, 等待回复的future)
+        self._request_ids = itertools.count()
+        self.pinned: Dict[str, int] = {}            # 不按哈希环路由的会话 -> 分片
+        self._resumable: Dict[str, List[str]] = {}  # 已从快照恢复、等待客户端重连的会话 -> 其中的玩家
+        self._migrating: Dict[str, List[tuple]] = {}    # 迁移中的会话暂存的消息
+
+    def _spawn(self, shard_id: int):
+        """启动一个分片的工作进程及其消息处理任务"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=shard_main,
+            args=(shard_id, child_conn, self.config),
+            name=f"sns-shard-{shard_id}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        inbox: asyncio.Queue = asyncio.Queue()
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), _drain_connection, parent_conn, inbox)
+        self._processes[shard_id] = process
+        self._connections[shard_id] = parent_conn
+        self._senders[shard_id] = PipeSender(parent_conn, f"sns-shard-{shard_id}-send")
+        self._started_at[shard_id] = time.monotonic()
+        self._pumps[shard_id] = asyncio.create_task(self._pump(shard_id, inbox))
+
+    async def start(self):
+        """启动全部工作进程"""
+        for shard_id in range(self.shards):
+            self._spawn(shard_id)
+        self.logger.info(f"已启动{self.shards}个分片进程")
+
+    async def stop(self):
+        """通知工作进程退出并回收资源"""
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+        for task in self._pumps:
+            if task is not None:
+                task.cancel()
+        for conn, sender in zip(self._connections, self._senders):
+            if conn is not None:
+                loop.remove_reader(conn.fileno())
+            if sender is not None:
+                sender.send(('stop',))
+                sender.close()
+        for sender in self._senders:
+            if sender is not None:
+                await loop.run_in_executor(None, sender.join, 5)
+        for process in self._processes:
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._connections:
+            if conn is not None:
+                conn.close()
+        self._fail_pending(None, ConnectionError("分片路由已停止"))
+
+    def configure(self, config: GameSettings):
+        """应用重新加载的配置：调整全局会话上限，其余设置转发给各分片，重启的分片使用新配置"""
+        if config.max_sessions != self.max_sessions:
+            resize_semaphore(self.session_semaphore, self.max_sessions, config.max_sessions, self._held_slots)
+            self.max_sessions = config.max_sessions
+        self.config = config
+        for sender in self._senders:
+            if sender is not None:
+                sender.send(('settings', config))
+
+    @property
+    def active_sessions(self) -> int:
+        """有连接的会话数"""
+        return len(self._callbacks)
+
+    def shard_for(self, session_id: str) -> int:
+        """会话所在的分片编号"""
+        shard_id = self.pinned.get(session_id)
+        if shard_id is None:
+            shard_id = self.ring.get_node(session_id)
+        return shard_id
+
+    def can_resume(self, session_id: str, player_id: str) -> bool:
+        """会话是否已从快照恢复、尚无连接，且玩家在会话中"""
+        return player_id in self._resumable.get(session_id, ()) and session_id not in self._callbacks
+
+    async def _pump(self, shard_id: int, inbox: asyncio.Queue):
+        """按到达顺序处理某个分片返回的消息，连接断开后重启该分片"""
+        while True:
+            message = await inbox.get()
+            kind = message[0]
+            if kind == 'result':
+                callback = self._callbacks.get(message[1])
+                if callback:
+                    try:
+                        await callback(message[2])
+                    except Exception as e:
+                        self.logger.warning(f"结果推送失败: {e}")
+                    if message[2].get('expired'):
+                        # 会话已在分片中超时结束，通知之后断开连接
+                        await self._drop(message[1], GOING_AWAY, b'session expired')
+            elif kind == 'reply':
+                pending = self._pending.pop(message[1], None)
+                if pending and not pending[1].done():
+                    pending[1].set_result(message[2])
+            elif kind == 'close':
+                _, session_id, detail, code, reason = message
+                self.logger.warning(f"会话{session_id}: {detail}")
+                await self._drop(session_id, code, reason)
+            elif kind == 'restored':
+                for session_id, players in message[2].items():
+                    self.pinned[session_id] = shard_id
+                    self._resumable[session_id] = players
+                self.logger.info(f"分片{shard_id}从快照恢复会话{len(message[2])}个")
+            elif kind == 'stop':
+                break
+        await self._on_shard_exit(shard_id)
+
+    async def _on_shard_exit(self, shard_id: int):
+        """分片连接断开：回收进程，断开该分片上会话的连接，按退避间隔重启"""
+        loop = asyncio.get_running_loop()
+        conn, sender, process = self._connections[shard_id], self._senders[shard_id], self._processes[shard_id]
+        self._connections[shard_id] = self._senders[shard_id] = None
+        loop.remove_reader(conn.fileno())
+        sender.close()
+        await loop.run_in_executor(None, process.join, 5)
+        if process.is_alive():
+            process.kill()
+        conn.close()
+        if self._stopping:
+            return
+
+        self._fail_pending(shard_id, ConnectionError(f"分片{shard_id}进程已退出"))
+        for session_id in [sid for sid in self._callbacks if self.shard_for(sid) == shard_id]:
+            await self._drop(session_id, TRY_AGAIN_LATER, b'shard restarting')
+
+        now = time.monotonic()
+        if now - self._started_at[shard_id] >= STABLE_AFTER:
+            delay = RESTART_DELAY
+        else:
+            delay = min(max(self._restart_delay[shard_id] * 2, RESTART_DELAY), RESTART_DELAY_MAX)
+        self._restart_delay[shard_id] = delay
+        self.restarts[shard_id] += 1
+        self.logger.error(f"分片{shard_id}进程已退出（exitcode {process.exitcode}），"
+                          f"{delay:g}秒后重启，累计重启{self.restarts[shard_id]}次")
+        await asyncio.sleep(delay)
+        if not self._stopping:
+            self._spawn(shard_id)
+
+    def _fail_pending(self, shard_id: Optional[int], error: Exception):
+        """让发往某分片（None为全部分片）的等待中请求立即失败"""
+        for request_id, (target, future) in list(self._pending.items()):
+            if shard_id is None or target == shard_id:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _drop(self, session_id: str, code: int, reason: bytes):
+        """释放会话的全局名额并断开其连接，会话不再转发结果"""
+        self._players.pop(session_id, None)
+        closer = self._closers.pop(session_id, None)
+        if self._callbacks.pop(session_id, None) is None:
+            return
+        self.session_semaphore.release()
+        if closer is not None:
+            try:
+                await closer(code, reason)
+            except Exception as e:
+                self.logger.warning(f"会话{session_id}断开连接失败: {e}")
+
+    async def _request(self, shard_id: int, kind: str, *args, timeout: Optional[float] = None) -> Any:
+        """
+        向分片发送请求并等待回复
+
+        Raises:
+            ConnectionError: 分片进程不可用或在回复前退出
+            asyncio.TimeoutError: 超时未回复
+        """
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (shard_id, future)
+        try:
+            sender = self._senders[shard_id]
+            if sender is None or not sender.send((kind, request_id, *args)):
+                raise ConnectionError(f"分片{shard_id}不可用")
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def create_session(self, session_id: str,
+                             callback: Callable[[Dict[str, Any]], Awaitable],
+                             on_close: Optional[Callable[[int, bytes], Awaitable]] = None,
+                             player_id: Optional[str] = None) -> bool:
+        """
+        在所属分片上创建会话，会话总数受max_sessions限制
+
+        Args:
+            callback: 接收会话回复
+            on_close: 会话因背压、超时结束或分片进程退出需要断开连接时调用，参数为关闭码与原因
+            player_id: 连接认证的玩家，分片拒绝以其他玩家身份发送的事件
+        """
+        await self.session_semaphore.acquire()
+        # 回调先于请求登记：分片回复创建结果后紧接着发送全量快照
+        self._callbacks[session_id] = callback
+        if on_close is not None:
+            self._closers[session_id] = on_close
+        try:
+            created = await self._request(self.shard_for(session_id), 'create', session_id, player_id)
+        except Exception as e:
+            self.logger.error(f"分片会话创建失败: {e!r}")
+            created = False
+        if created and player_id is not None:
+            self._players[session_id] = player_id
+        if not created:
+            self._closers.pop(session_id, None)
+            # 分片进程退出时名额可能已被释放
+            if self._callbacks.pop(session_id, None) is not None:
+                self.session_semaphore.release()
+        else:
+            self._resumable.pop(session_id, None)
+        return bool(created)
+
+    def forward(self, session_id: str, frame: Union[str, bytes], binary: bool = False):
+        """把客户端的原始帧转发到会话所在分片，由分片进程解码；分片不可用时丢弃"""
+        message = ('message', session_id, frame, binary)
+        held = self._migrating.get(session_id)
+        if held is not None:
+            held.append(message)
+            return
+        sender = self._senders[self.shard_for(session_id)]
+        if sender is not None:
+            sender.send(message)
+
+    async def migrate(self, session_id: str, target: int, timeout: Optional[float] = None) -> bool:
+        """
+        把会话迁移到另一个分片：源分片导出快照并结束会话，目标分片导入后接管，
+        迁移期间到达的消息暂存，完成后按顺序转发到新分片
+
+        Returns:
+            是否迁移成功，失败时会话留在原分片或已结束
+        """
+        source = self.shard_for(session_id)
+        if (session_id not in self._callbacks or source == target or session_id in self._migrating
+                or not 0 <= target < self.shards):
+            return False
+        held = self._migrating[session_id] = []
+        shard_id = source
+        try:
+            data = await self._request(source, 'export', session_id, timeout=timeout)
+            if data is None:
+                return False
+            player_id = self._players.get(session_id)
+            imported = await self._request(target, 'import', session_id, data, player_id, timeout=timeout)
+            if not imported:
+                # 目标分片无法接管，导回源分片
+                await self._request(source, 'import', session_id, data, player_id, timeout=timeout)
+                return False
+            shard_id = target
+            self.pinned[session_id] = target
+            self.logger.info(f"会话{session_id}已从分片{source}迁移到分片{target}")
+            return True
+        except Exception as e:
+            self.logger.error(f"会话{session_id}迁移失败: {e!r}")
+            return False
+        finally:
+            del self._migrating[session_id]
+            sender = self._senders[shard_id]
+            if sender is not None:
+                for message in held:
+                    sender.send(message)
+
+    async def end_session(self, session_id: str):
+        """结束会话并释放全局名额"""
+        self._players.pop(session_id, None)
+        self._closers.pop(session_id, None)
+        if self._callbacks.pop(session_id, None) is None:
+            return
+        shard_id = self.shard_for(session_id)
+        self.pinned.pop(session_id, None)
+        self.session_semaphore.release()
+        sender = self._senders[shard_id]
+        if sender is not None:
+            sender.send(('end', session_id))
+
+    async def _gather(self, kind: str, *args, timeout: float) -> List[Any]:
+        """向全部分片发送同一请求，失败或超时的分片结果为异常对象"""
+        return await asyncio.gather(
+            *(self._request(shard_id, kind, *args, timeout=timeout) for shard_id in range(self.shards)),
+            return_exceptions=True,
+        )
+
+    async def profile(self, options: Optional[Dict[str, Any]] = None, reset: bool = False,
+                      timeout: float = 1.0) -> List[Dict[str, Any]]:
+        """修改各分片的监听器剖析设置（可选）并取回各分片收集的数据，超时的分片被跳过"""
+        results = await self._gather('profile', options, reset, timeout=timeout)
+        return [result for result in results if isinstance(result, dict)]
+
+    async def stats(self, timeout: float = 1.0, include_metrics: bool = False) -> List[Dict[str, Any]]:
+        """收集各分片的负载统计，include_metrics时附带各分片导出的运行时指标"""
+        results = await self._gather('stats', include_metrics, timeout=timeout)
+        stats = []
+        for shard_id, result in enumerate(results):
+            if not isinstance(result, dict):
+                error = 'timeout' if isinstance(result, asyncio.TimeoutError) else 'unavailable'
+                result = {'shard': shard_id, 'error': error}
+            process = self._processes[shard_id]
+            result['alive'] = process is not None and process.is_alive()
+            result['restarts'] = self.restarts[shard_id]
+            stats.append(result)
+        return stats
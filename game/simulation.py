@@ -0,0 +1,331 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file simulation.py
+#
+
+"""
+无界面对局模拟，用于数值平衡测试
+直接使用GameState、CombatSystem与EventDispatcher运行完整对局（不经过WebSocket），
+对局使用带种子的随机数，按进程池分块并行，边运行边汇总各角色/模块组合的胜率与伤害分布。
+--engine vector 使用NumPy批量结算，一块内的全部对局同时推进，不触发特质，用于快速扫描数值表。
+
+    python -m game.simulation --matches 100000 --workers 8
+    python -m game.simulation --matches 1000000 --engine vector
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .character import CHARACTERS, Module
+from .combat import CombatSystem
+from .state import GameState
+
+DAMAGE_BUCKET = 50      # 伤害分布的分桶宽度
+
+Fighter = Tuple[str, str]   # (角色名, 模块名)
+
+
+def _policy_random(state: GameState, player_id: str, rng: random.Random) -> Optional[str]:
+    """随机选择一个存活的敌人"""
+    targets = [pid for pid in state.player_in_order
+               if pid != player_id and state.players[pid].is_alive]
+    return rng.choice(targets) if targets else None
+
+
+def _policy_lowest_hp(state: GameState, player_id: str, rng: random.Random) -> Optional[str]:
+    """集火生命值最低的敌人"""
+    targets = [pid for pid in state.player_in_order
+               if pid != player_id and state.players[pid].is_alive]
+    return min(targets, key=lambda pid: state.players[pid].hp) if targets else None
+
+
+POLICIES: Dict[str, Callable] = {
+    'random': _policy_random,
+    'lowest_hp': _policy_lowest_hp,
+}
+
+
+def make_fighter(fighter: Fighter):
+    """按角色名与模块创建角色"""
+    name, module = fighter
+    return CHARACTERS[name](Module[module])
+
+
+async def run_match(fighters: List[Fighter], seed: int, policy: str = 'random', max_rounds: int = 50):
+    """
+    运行一局对局
+
+    Returns:
+        (胜者下标或None, 回合数, 每名玩家造成的各次伤害)
+    """
+    # 掷骰与选择目标使用对局种子派生的两个独立随机数流
+    state = GameState(seed=seed)
+    combat = CombatSystem(state)
+    rng = state.rng.stream('policy')
+    choose_target = POLICIES[policy]
+
+    player_ids = [f"p{i}" for i in range(len(fighters))]
+    for player_id, fighter in zip(player_ids, fighters):
+        character = make_fighter(fighter)
+        state.players[player_id] = character
+        state.player_in_order.append(player_id)
+        state.traits.attach(player_id, character)
+
+    damage: List[List[int]] = [[] for _ in fighters]
+    for state.current_round in range(1, max_rounds + 1):
+        for index, player_id in enumerate(player_ids):
+            if not state.players[player_id].is_alive:
+                continue
+            target = choose_target(state, player_id, rng)
+            if target is None:
+                break
+            damage[index].append(await combat.attack(player_id, target))
+        alive = [i for i, pid in enumerate(player_ids) if state.players[pid].is_alive]
+        if len(alive) <= 1:
+            return (alive[0] if alive else None), state.current_round, damage
+    return None, max_rounds, damage
+
+
+def _new_stats() -> Dict:
+    return {'matches': 0, 'wins': [0, 0], 'draws': 0, 'rounds': 0,
+            'damage': [{}, {}], 'hits': [0, 0]}
+
+
+def _merge(total: Dict, part: Dict):
+    for key, stats in part.items():
+        into = total.setdefault(key, _new_stats())
+        into['matches'] += stats['matches']
+        into['draws'] += stats['draws']
+        into['rounds'] += stats['rounds']
+        for side in (0, 1):
+            into['wins'][side] += stats['wins'][side]
+            into['hits'][side] += stats['hits'][side]
+            for bucket, count in stats['damage'][side].items():
+                into['damage'][side][bucket] = into['damage'][side].get(bucket, 0) + count
+
+
+async def _run_chunk_async(matchups: List[Tuple[Fighter, Fighter]], seeds: range, policy: str) -> Dict:
+    stats: Dict = {}
+    for seed in seeds:
+        pair = matchups[seed % len(matchups)]
+        winner, rounds, damage = await run_match(list(pair), seed, policy)
+        entry = stats.setdefault(pair, _new_stats())
+        entry['matches'] += 1
+        entry['rounds'] += rounds
+        if winner is None:
+            entry['draws'] += 1
+        else:
+            entry['wins'][winner] += 1
+        for side in (0, 1):
+            histogram = entry['damage'][side]
+            entry['hits'][side] += len(damage[side])
+            for value in damage[side]:
+                bucket = value // DAMAGE_BUCKET * DAMAGE_BUCKET
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+    return stats
+
+
+def run_chunk(matchups: List[Tuple[Fighter, Fighter]], start: int, stop: int, policy: str) -> Dict:
+    """工作进程入口：运行种子为[start, stop)的对局并返回汇总"""
+    return asyncio.run(_run_chunk_async(matchups, range(start, stop), policy))
+
+
+def run_vector_chunk(matchups: List[Tuple[Fighter, Fighter]], start: int, stop: int,
+                     policy: str, max_rounds: int = 50) -> Dict:
+    """
+    工作进程入口（向量化）：种子为[start, stop)的对局在同一张CombatantTable中同时推进。
+    每回合先由A方全体攻击、再由存活的B方反击，与逐局模拟的出手顺序一致；不触发特质。
+    """
+    import numpy as np
+    from .combat_batch import ALIVE, BatchCombat, CombatantTable
+
+    count = stop - start
+    pair_index = np.arange(start, stop) % len(matchups)
+    table = CombatantTable(capacity=2 * count)
+    for seed in range(start, stop):
+        pair = matchups[seed % len(matchups)]
+        table.add(make_fighter(pair[0]))
+        table.add(make_fighter(pair[1]))
+    combat = BatchCombat(table, rng=np.random.default_rng(start))
+    side_a = np.arange(0, 2 * count, 2)
+    side_b = side_a + 1
+
+    async def play():
+        damage_a, damage_b = [], []
+        rounds = np.full(count, max_rounds)
+        for current in range(1, max_rounds + 1):
+            alive = table.data[ALIVE]
+            ongoing = np.flatnonzero(alive[side_a] & alive[side_b])
+            if not len(ongoing):
+                break
+            hits = await combat.resolve(side_a[ongoing], side_b[ongoing])
+            damage_a.append((ongoing, hits))
+            ongoing = ongoing[(alive[side_a[ongoing]] & alive[side_b[ongoing]]) > 0]
+            hits = await combat.resolve(side_b[ongoing], side_a[ongoing])
+            damage_b.append((ongoing, hits))
+            finished = (alive[side_a] == 0) | (alive[side_b] == 0)
+            rounds[finished & (rounds == max_rounds)] = current
+        return damage_a, damage_b, rounds
+
+    damage_a, damage_b, rounds = asyncio.run(play())
+    alive = table.data[ALIVE]
+    wins_a = (alive[side_a] > 0) & (alive[side_b] == 0)
+    wins_b = (alive[side_b] > 0) & (alive[side_a] == 0)
+
+    stats: Dict = {}
+    for index, pair in enumerate(matchups):
+        mask = pair_index == index
+        n = int(mask.sum())
+        if not n:
+            continue
+        entry = stats.setdefault(pair, _new_stats())
+        entry['matches'] = n
+        entry['wins'] = [int(wins_a[mask].sum()), int(wins_b[mask].sum())]
+        entry['draws'] = n - entry['wins'][0] - entry['wins'][1]
+        entry['rounds'] = int(rounds[mask].sum())
+        for side, batches in ((0, damage_a), (1, damage_b)):
+            values = [hits[mask[ongoing]] for ongoing, hits in batches]
+            values = np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+            entry['hits'][side] = len(values)
+            buckets, counts = np.unique(values // DAMAGE_BUCKET * DAMAGE_BUCKET, return_counts=True)
+            entry['damage'][side] = {int(b): int(c) for b, c in zip(buckets, counts)}
+    return stats
+
+
+ENGINES = {
+    'event': run_chunk,
+    'vector': run_vector_chunk,
+}
+
+
+def all_matchups(characters: List[str], modules: Optional[List[str]] = None) -> List[Tuple[Fighter, Fighter]]:
+    """
+    全部对阵组合；未指定模块时使用各角色自带的模块
+    """
+    fighters: List[Fighter] = []
+    for name in characters:
+        for module in (modules or [CHARACTERS[name].MODULE.name]):
+            fighters.append((name, module))
+    return list(itertools.combinations_with_replacement(fighters, 2))
+
+
+def _percentile(histogram: Dict[int, int], q: float) -> int:
+    total = sum(histogram.values())
+    if not total:
+        return 0
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= total * q:
+            return bucket
+    return max(histogram)
+
+
+def format_report(stats: Dict) -> str:
+    """按对阵输出胜率与伤害分布"""
+    lines = [f"{'fighter A':<26}{'fighter B':<26}{'matches':>9}{'A win%':>8}{'B win%':>8}"
+             f"{'draw%':>7}{'rounds':>7}{'A dmg p50/p90':>15}{'B dmg p50/p90':>15}"]
+    for (a, b), entry in sorted(stats.items()):
+        n = entry['matches']
+        dmg = [f"{_percentile(h, 0.5)}/{_percentile(h, 0.9)}" for h in entry['damage']]
+        lines.append(
+            f"{'/'.join(a):<26}{'/'.join(b):<26}{n:>9}"
+            f"{entry['wins'][0] / n:>8.1%}{entry['wins'][1] / n:>8.1%}{entry['draws'] / n:>7.1%}"
+            f"{entry['rounds'] / n:>7.1f}{dmg[0]:>15}{dmg[1]:>15}"
+        )
+    return "\n".join(lines)
+
+
+def progress_reporter(matches: int, logger: logging.Logger, interval: float = 10.0) -> Callable[[int, Dict, float], None]:
+    """
+    simulate的进度回调：每块记录进度与速度，每隔interval秒输出一次当前的各对阵统计，
+    最终报告由调用方输出
+
+    Args:
+        interval: 输出中间统计的最短间隔（秒），为0时只记录进度
+    """
+    last = 0.0
+
+    def progress(done: int, stats: Dict, elapsed: float):
+        nonlocal last
+        logger.info(f"[{done}/{matches}] {done / elapsed:,.0f} matches/s")
+        if interval > 0 and stats and elapsed - last >= interval and done < matches:
+            last = elapsed
+            logger.info(format_report(stats))
+
+    return progress
+
+
+def simulate(matches: int,
+             workers: int,
+             matchups: List[Tuple[Fighter, Fighter]],
+             policy: str = 'random',
+             seed: int = 0,
+             chunk_size: int = 2000,
+             progress: Optional[Callable[[int, Dict, float], None]] = None,
+             engine: str = 'event') -> Dict:
+    """
+    在进程池中运行matches局对局，每完成一块即合并统计并回调progress
+    """
+    total: Dict = {}
+    done = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        futures = {
+            pool.submit(ENGINES[engine], matchups, lo, min(lo + chunk_size, seed + matches), policy):
+                min(chunk_size, seed + matches - lo)
+            for lo in range(seed, seed + matches, chunk_size)
+        }
+        for future in as_completed(futures):
+            _merge(total, future.result())
+            done += futures[future]
+            if progress:
+                progress(done, total, time.perf_counter() - start)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SnS headless match simulator")
+    parser.add_argument('--matches', type=int, default=10000, help='对局总数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='工作进程数')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random', help='选择目标的策略')
+    parser.add_argument('--characters', nargs='+', default=sorted(CHARACTERS), help='参与的角色')
+    parser.add_argument('--modules', nargs='*', choices=[m.name for m in Module],
+                        help='为每个角色尝试的模块，缺省为角色自带模块')
+    parser.add_argument('--seed', type=int, default=0, help='起始种子')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='每个任务的对局数')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='event',
+                        help='event: 逐局事件驱动（含特质）；vector: NumPy批量结算（不含特质）')
+    parser.add_argument('--report-interval', type=float, default=10.0,
+                        help='输出中间统计的间隔（秒），0为不输出')
+    args = parser.parse_args()
+    # 进度与耗时写到stderr，stdout只输出统计报告
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('Simulation')
+
+    matchups = all_matchups(args.characters, args.modules)
+
+    progress = progress_reporter(args.matches, logger, args.report_interval)
+
+    start = time.perf_counter()
+    stats = simulate(args.matches, args.workers, matchups, args.policy, args.seed,
+                     args.chunk_size, progress, args.engine)
+    elapsed = time.perf_counter() - start
+
+    print(format_report(stats))
+    logger.info(f"{args.matches} matches in {elapsed:.2f}s with {args.workers} workers: "
+                f"{args.matches / elapsed:,.0f} matches/s, "
+                f"{args.matches / elapsed / args.workers:,.0f} matches/s per core")
+
+
+if __name__ == '__main__':
+    main()
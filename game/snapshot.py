@@ -0,0 +1,339 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file snapshot.py
+#
+
+"""
+会话快照
+把GameSession（对局状态、角色、牌堆、状态效果与未处理的事件队列）编码为
+带版本号的紧凑二进制快照，用于进程重启后恢复对局，以及在工作进程之间迁移会话。
+
+快照格式：
+    10字节头(魔数b'SNSS', 格式版本, 负载编码, 负载CRC32) + 负载
+负载为按固定字段顺序排列的列表，安装msgpack时使用MessagePack，否则使用JSON。
+字段只能追加在各列表末尾，删除或调整顺序时需提升FORMAT_VERSION。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:     # 可选依赖，未安装时使用JSON
+    msgpack = None
+
+from .cards import CardPile
+from .character import CHARACTERS, Character
+from .events import GameEvent, GameEventType
+from .session import GameSession
+from .state import GameState
+
+MAGIC = b'SNSS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBI')    # 魔数, 格式版本, 负载编码, 负载CRC32
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+
+# 角色快照的字段顺序，名称与特质由角色类的原型给出
+CHARACTER_FIELDS = (
+    'team', 'hp', 'hp_max', 'attack', 'defense', 'is_alive',
+    'mp', 'mp_max', 'mp_restore', 'mp_restore_cd',
+    'hand', 'skill_max', 'skills', '_cooldowns', '_statuses',
+)
+# 可能存放在CombatantTable中的数值，读出时需转为Python类型
+_TABLE_FIELDS = frozenset({'hp', 'hp_max', 'attack', 'defense'})
+
+SUFFIX = '.snap'
+
+
+class SnapshotError(ValueError):
+    """快照损坏或格式版本不受支持"""
+
+
+def _plain(value: Any) -> Any:
+    """转为可编码的值；容器一律复制，快照在线程中编码时不受之后状态修改的影响"""
+    if isinstance(value, (set, frozenset, tuple, list, CardPile)):
+        return list(value)
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+def _encode_character(character: Character) -> List[Any]:
+    row: List[Any] = [type(character).__name__]
+    for name in CHARACTER_FIELDS:
+        value = getattr(character, name)
+        if name in _TABLE_FIELDS:
+            value = int(value)
+        elif name == 'is_alive':
+            value = bool(value)
+        row.append(_plain(value))
+    return row
+
+
+def _decode_character(row: List[Any]) -> Character:
+    character = CHARACTERS[row[0]]()
+    for name, value in zip(CHARACTER_FIELDS, row[1:]):
+        if name == 'skills':
+            value = set(value)
+        elif name == 'hand':
+            value = CardPile(value)
+        setattr(character, name, value)
+    return character
+
+
+def _encode_state(state: GameState) -> List[Any]:
+    return [
+        state.version,
+        state.current_round,
+        state.current_turn_index,
+        state.current_turn,
+        list(state.character_selected),
+        list(state.deck),
+        list(state.skill_deck),
+        list(state.player_in_order),
+        state.is_team_system_active,
+        state.logs.total,
+        list(state.logs),
+        {pid: _encode_character(c) for pid, c in state.players.items()},
+        state.rng.seed,
+        state.rng.getstate(),
+        list(state.discard),
+        dict(state.teams),
+    ]
+
+
+def _decode_state(row: List[Any], session_id: str) -> GameState:
+    (version, current_round, current_turn_index, current_turn, character_selected,
+     deck, skill_deck, player_in_order, is_team_system_active, logs_total, logs,
+     players) = row[:12]
+    # 随机数流是后追加的字段
+    seed, rng_state = row[12:14] if len(row) >= 14 else (None, {})
+    state = GameState(seed=seed)
+    state.rng.setstate(rng_state)
+    state.discard.extend(row[14] if len(row) > 14 else ())
+    state.teams = dict(row[15]) if len(row) > 15 else {}
+    state.id = session_id
+    state.current_round = current_round
+    state.current_turn_index = current_turn_index
+    state.current_turn = current_turn
+    state.character_selected = character_selected
+    state.deck.extend(deck)
+    state.skill_deck.extend(skill_deck)
+    state.player_in_order = player_in_order
+    state.is_team_system_active = is_team_system_active
+    for message in logs:
+        state.logs.append(message)
+    state.logs.total = logs_total
+    for pid, character_row in players.items():
+        character = _decode_character(character_row)
+        state.players[pid] = character
+        state.traits.attach(pid, character)
+    # 恢复出的状态即当前版本，客户端重连时收到全量快照
+    state.version = version
+    state._logs_synced = logs_total
+    state._dirty.clear()
+    return state
+
+
+def _pending_events(session: GameSession) -> List[List[Any]]:
+    """会话队列中尚未处理的事件，按入队顺序"""
+    # asyncio.Queue没有公开的遍历接口，直接读取其内部deque
+    return [
+        [event.event_type.name, dict(event.data)]
+        for event in list(session.event_queue._queue)
+        if event is not None
+    ]
+
+
+def capture_session(session: GameSession) -> List[Any]:
+    """
+    复制会话的快照负载，需在会话所在的事件循环中持有会话锁调用
+    只复制数据不编码，编码可交给encode_payload在线程中完成
+    """
+    return [
+        session.session_id,
+        session.session_type,
+        session.created_at.timestamp(),
+        _encode_state(session.game_state),
+        _pending_events(session),
+        session.journal_seq,
+    ]
+
+
+def encode_session(session: GameSession) -> bytes:
+    """把会话编码为二进制快照，需在会话所在的事件循环中调用"""
+    return encode_payload(capture_session(session))
+
+
+def encode_payload(payload: List[Any]) -> bytes:
+    """把capture_session的结果编码为二进制快照，可在线程中执行"""
+    if msgpack is not None:
+        body = msgpack.packb(payload, use_bin_type=True)
+        encoding = ENCODING_MSGPACK
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        encoding = ENCODING_JSON
+    return HEADER.pack(MAGIC, FORMAT_VERSION, encoding, zlib.crc32(body)) + body
+
+
+def decode_snapshot(data: bytes) -> List[Any]:
+    """
+    校验并解码快照负载，不创建任何对象，可在线程池中执行
+
+    Raises:
+        SnapshotError: 魔数、格式版本、编码或校验和不符
+    """
+    if len(data) < HEADER.size:
+        raise SnapshotError("快照长度不足")
+    magic, version, encoding, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("不是会话快照")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"不支持的快照格式版本: {version}")
+    body = memoryview(data)[HEADER.size:]
+    if zlib.crc32(body) != checksum:
+        raise SnapshotError("快照校验失败")
+    if encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise SnapshotError("快照使用MessagePack编码，但未安装msgpack")
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    if encoding == ENCODING_JSON:
+        return json.loads(bytes(body))
+    raise SnapshotError(f"未知的快照编码: {encoding}")
+
+
+def restore_session(record: List[Any], **session_options) -> GameSession:
+    """
+    由解码后的快照重建会话，未处理的事件重新入队；
+    journal_seq为快照时已写入对局日志的记录数，旧版快照没有该字段时为None
+
+    Args:
+        record: decode_snapshot的结果
+        session_options: 传给GameSession的其他参数，如batch_size、snapshots
+    """
+    session_id, session_type, created_at, state_row, pending = record[:5]
+    session = GameSession(
+        session_id,
+        created_at=datetime.fromtimestamp(created_at),
+        game_state=_decode_state(state_row, session_id),
+        session_type=session_type,
+        **session_options,
+    )
+    for event_type, data in pending:
+        session.event_queue.put_nowait(GameEvent(GameEventType[event_type], data))
+    # 对局日志中快照之后的记录由replay.catch_up重放
+    session.journal_seq = record[5] if len(record) > 5 else None
+    return session
+
+
+class SnapshotStore:
+    """
+    会话快照的磁盘存储
+
+    每个会话一个文件。会话在回合边界的tick结束时调用save，只在事件循环中复制快照负载，
+    编码与文件写入交给单独的线程；同一会话尚未写出的旧快照直接被新快照覆盖。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.logger = logging.getLogger('SnapshotStore')
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-snapshot")
+        self._saved: Dict[str, int] = {}                    # 会话 -> 已快照的状态版本
+        self._pending: Dict[str, Optional[List[Any]]] = {}  # 待编码写出的快照负载，None表示删除
+        self._flush_task: Optional[asyncio.Task] = None
+        self.written = 0        # 累计写出的快照数
+
+    def _path(self, session_id: str) -> Path:
+        if os.sep in session_id or session_id.startswith('.'):
+            raise ValueError(f"无效的会话ID: {session_id}")
+        return self.directory / f"{session_id}{SUFFIX}"
+
+    def save(self, session: GameSession, force: bool = False) -> bool:
+        """
+        快照会话，状态版本与上次快照相同时跳过
+
+        Returns:
+            是否生成了新快照
+        """
+        version = session.game_state.version
+        if not force and self._saved.get(session.session_id) == version:
+            return False
+        self._saved[session.session_id] = version
+        self._schedule(session.session_id, capture_session(session))
+        return True
+
+    def discard(self, session_id: str):
+        """会话正常结束，删除其快照"""
+        self._saved.pop(session_id, None)
+        self._schedule(session_id, None)
+
+    def _schedule(self, session_id: str, payload: Optional[List[Any]]):
+        self._pending[session_id] = payload
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, {}
+                try:
+                    await loop.run_in_executor(self._executor, self._write_batch, batch)
+                except Exception as e:
+                    self.logger.error(f"写入会话快照失败: {e}")
+        finally:
+            self._flush_task = None
+
+    def _write_batch(self, batch: Dict[str, Optional[List[Any]]]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for session_id, payload in batch.items():
+            path = self._path(session_id)
+            if payload is None:
+                path.unlink(missing_ok=True)
+                continue
+            data = encode_payload(payload)
+            # 先写临时文件再原子替换，进程崩溃时不会留下半个快照
+            tmp = path.with_suffix(SUFFIX + '.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.written += 1
+
+    def _read_all(self) -> List[List[Any]]:
+        records = []
+        if not self.directory.is_dir():
+            return records
+        for path in self.directory.glob(f"*{SUFFIX}"):
+            try:
+                records.append(decode_snapshot(path.read_bytes()))
+            except Exception as e:
+                self.logger.warning(f"跳过无法读取的快照{path.name}: {e}")
+        return records
+
+    async def load_all(self) -> List[List[Any]]:
+        """在线程中读取并解码目录中的全部快照"""
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(self._executor, self._read_all)
+        for record in records:
+            self._saved[record[0]] = record[3][0]
+        return records
+
+    async def flush(self):
+        """等待已提交的快照全部写出"""
+        while self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+
+    async def close(self):
+        """写完待写出的快照并停止写入线程"""
+        await self.flush()
+        self._executor.shutdown(wait=True)
@@ -1,9 +1,45 @@
 from dataclasses import dataclass, field
-from typing import Dict, Optional, List, Set
+from typing import TYPE_CHECKING, Any, Dict, Optional, List, Set
+from array import array
 from collections import deque
 
-from .core import GameCore
+from .cards import CardPile
 from .character import Character
+from .events import EventDispatcher, GameEventType
+from .match_log import MatchLog, match_logger
+from .rng import RandomStreams
+from .traits import TraitLifecycle
+
+if TYPE_CHECKING:   # 仅用于类型标注，GameCore的组件在运行时由创建方填入
+    from .core import GameCore
+
+# 需要同步给客户端的状态字段，赋值时自动标记为脏
+SYNC_SECTIONS = frozenset({
+    'current_round', 'current_turn_index', 'current_turn',
+    'character_selected', 'player_in_order', 'is_team_system_active', 'teams',
+})
+# 同步给客户端的角色字段
+PLAYER_FIELDS = (
+    'name', 'team', 'is_alive', 'hp', 'hp_max', 'attack', 'defense',
+    'mp', 'mp_max', 'hand', 'skills', 'cooldowns', 'statuses',
+)
+DELTA_HISTORY = 64          # 保留的增量数，更早的版本只能全量同步
+SNAPSHOT_LOG_LIMIT = 50     # 全量快照中附带的最近日志条数
+
+
+def _plain(value: Any) -> Any:
+    """把集合等容器转为可序列化的形式"""
+    if isinstance(value, (set, frozenset, tuple, deque, array)):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def player_view(character: Character, fields=PLAYER_FIELDS) -> Dict[str, Any]:
+    """角色的客户端视图"""
+    return {name: _plain(getattr(character, name, None)) for name in fields}
+
 
 @dataclass
 class GameState:
@@ -11,29 +47,157 @@ class GameState:
     current_round: int = 0
     current_turn_index: int = 0
     current_turn: Optional[str] = None
-    logs: List[Dict] = field(default_factory=list)
+    logs: MatchLog = field(default_factory=MatchLog)
 
     character_selected: List[str] = field(default_factory=list)
-    deck: deque = field(default_factory=deque)
-    skill_deck: deque = field(default_factory=deque)
+    deck: CardPile = field(default_factory=CardPile)
+    skill_deck: CardPile = field(default_factory=CardPile)
+    discard: CardPile = field(default_factory=CardPile)
 
     players: Dict[str, Character] = field(default_factory=dict)
     player_in_order: List[str] = field(default_factory=list)
     is_team_system_active: bool = False
-    if is_team_system_active:
-        teams: Set[Dict[str, int]] = field(default_factory=dict)
-    
+    teams: Dict[str, int] = field(default_factory=dict)     # 玩家 -> 队伍编号，由大厅成局时分配
+
 
     async def log(self, message: str):
-        """日志"""
+        """日志：写入最近日志缓冲区，完整日志交给异步输出"""
         self.logs.append(message)
-        print(f"[GameState Log]: {message}")
+        match_logger.info("[%s] %s", self.id, message)
+
+    def __init__(self,
+                 core: Optional['GameCore'] = None,
+                 log_capacity: int = 200,
+                 event_dispatcher: Optional[EventDispatcher] = None,
+                 seed: Optional[int] = None):
+        # 脏标记需在其他字段赋值前建立
+        object.__setattr__(self, '_dirty', set())
+        self._dirty_players: Dict[str, Optional[Set[str]]] = {}
+        self._removed_players: Set[str] = set()
+        self._logs_synced = 0
+        self.version = 0
+        self.history: deque = deque(maxlen=DELTA_HISTORY)
 
-    def __init__(self, core: GameCore):
         self.core = core
-        self.players = {}
+        self.event_dispatcher = event_dispatcher or EventDispatcher()
+        self.event_type = GameEventType
+        self.traits = TraitLifecycle(self)      # 对局中角色特质的注册与移除
+        self.rng = RandomStreams(seed)          # 对局的随机数流，种子随对局日志保存
+        self.id = None
+        self.current_round = 0
+        self.current_turn_index = 0
         self.current_turn = None
+        self.logs = MatchLog(log_capacity)
+        self.character_selected = []
+        # 牌堆只保存卡牌编号，卡牌定义见cards.CARDS
+        self.deck = CardPile()
+        self.skill_deck = CardPile()
+        self.discard = CardPile()
+        self.players = {}
+        self.player_in_order = []
+        self.is_team_system_active = False
+        self.teams = {}
+        self._dirty.clear()
+
+    def __setattr__(self, name: str, value: Any):
+        if name in SYNC_SECTIONS:
+            self._dirty.add(name)
+        object.__setattr__(self, name, value)
+
+    def mark_dirty(self, *sections: str):
+        """标记原地修改过的状态字段，如对player_in_order的append"""
+        self._dirty.update(sections)
+
+    def mark_player_dirty(self, player_id: str, *fields: str):
+        """标记玩家角色的字段有变化，不指定字段时同步整个角色"""
+        self._removed_players.discard(player_id)
+        if not fields:
+            self._dirty_players[player_id] = None
+            return
+        dirty = self._dirty_players.get(player_id, set())
+        if dirty is not None:
+            dirty.update(fields)
+            self._dirty_players[player_id] = dirty
+
+    def mark_player_removed(self, player_id: str):
+        """标记玩家已离开"""
+        self._dirty_players.pop(player_id, None)
+        self._removed_players.add(player_id)
+
+    def _sections_view(self, names) -> Dict[str, Any]:
+        view = {name: _plain(getattr(self, name)) for name in names}
+        return view
+
+    def snapshot(self) -> Dict[str, Any]:
+        """全量快照，仅在客户端加入或无法增量同步时发送"""
+        return {
+            'version': self.version,
+            'sections': self._sections_view(SYNC_SECTIONS),
+            'deck_count': len(self.deck),
+            'skill_deck_count': len(self.skill_deck),
+            'discard_count': len(self.discard),
+            'players': {pid: player_view(c) for pid, c in self.players.items()},
+            'logs': self.logs.recent(SNAPSHOT_LOG_LIMIT),
+        }
+
+    def collect_delta(self) -> Optional[Dict[str, Any]]:
+        """
+        收集自上一版本以来的变化，生成新版本的增量并清空脏标记
+
+        Returns:
+            增量，没有变化时返回None
+        """
+        new_logs = self.logs.total - self._logs_synced
+        if not (self._dirty or self._dirty_players or self._removed_players or new_logs):
+            return None
+
+        players: Dict[str, Optional[Dict[str, Any]]] = {}
+        for pid, fields in self._dirty_players.items():
+            character = self.players.get(pid)
+            if character is not None:
+                players[pid] = player_view(character, fields or PLAYER_FIELDS)
+        for pid in self._removed_players:
+            players[pid] = None
+
+        self.version += 1
+        delta = {
+            'version': self.version,
+            'base': self.version - 1,
+            'sections': self._sections_view(self._dirty),
+            'deck_count': len(self.deck),
+            'skill_deck_count': len(self.skill_deck),
+            'discard_count': len(self.discard),
+            'players': players,
+            'logs': self.logs.since(self._logs_synced) if new_logs else [],
+        }
+        self._dirty.clear()
+        self._dirty_players.clear()
+        self._removed_players.clear()
+        self._logs_synced = self.logs.total
+        self.history.append(delta)
+        return delta
+
+    def deltas_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        客户端从version重新同步所需的增量
+
+        Returns:
+            增量列表；version过旧或无效时返回None，此时应发送全量快照
+        """
+        if version == self.version:
+            return []
+        if not self.history or version < self.history[0]['base'] or version > self.version:
+            return None
+        return [delta for delta in self.history if delta['version'] > version]
+
+    def resync(self, version: Optional[int] = None) -> Dict[str, Any]:
+        """生成重新同步的回复：能增量时返回增量，否则返回全量快照"""
+        if version is not None:
+            deltas = self.deltas_since(version)
+            if deltas is not None:
+                return {'resync': {'version': self.version, 'deltas': deltas}}
+        return {'snapshot': self.snapshot()}
     
     async def process_turn(self):
         # 通过core访问其他组件
-        await self.core.combat_system.process_combat()
\ No newline at end of file
+        await self.core.combat_system.process_combat()
@@ -1,50 +1,76 @@
 from enum import Enum
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from .state import GameState
+from .events import GameEventType, ListenerHandle
+
+if TYPE_CHECKING:   # 仅用于类型标注，避免 state -> character -> traits -> state 循环导入
+    from .state import GameState
 
 class Trait:
-    def __init__(self, name: str, game_state: GameState = None):
+    # (事件类型, 处理方法名, 优先级, 是否只处理持有者的事件)
+    LISTENS: Tuple[Tuple[GameEventType, str, int, bool], ...] = ()
+
+    def __init__(self, name: str, game_state: 'GameState' = None, player_id: Optional[str] = None):
         self.name = name
         self.game_state = game_state
+        self.player_id = player_id      # 持有该特质的玩家
+        self.handles: List[ListenerHandle] = []
+
+    @property
+    def owner(self):
+        """持有该特质的角色"""
+        return self.game_state.players.get(self.player_id)
+
+    def activate(self):
+        """在对局的事件分发器上注册监听器"""
+        dispatcher = self.game_state.event_dispatcher
+        for event_type, handler, priority, owner_only in self.LISTENS:
+            self.handles.append(dispatcher.add_listener(
+                event_type,
+                getattr(self, handler),
+                priority=priority,
+                owner=self.player_id if owner_only else None,
+            ))
+
+    def deactivate(self):
+        """移除注册的全部监听器"""
+        dispatcher = self.game_state.event_dispatcher
+        for handle in self.handles:
+            dispatcher.remove(handle)
+        self.handles.clear()
 
 
 class SelfEncouragement(Trait):
-    def __init__(self, game_state: GameState = None):
-        super().__init__("SelfEncouragement", game_state=game_state)
-        game_state.event_dispatcher.add_listener(
-            game_state.event_type.DAMAGE_APPLY,
-            self.self_encouragement,
-            priority=50
-        )
+    LISTENS = ((GameEventType.DAMAGE_APPLY, 'self_encouragement', 50, True),)
+
+    def __init__(self, game_state: 'GameState' = None, player_id: Optional[str] = None):
+        super().__init__("SelfEncouragement", game_state=game_state, player_id=player_id)
 
     async def self_encouragement(self, event):
         """自勉特质的事件处理"""
-        player = self.game_state.players.get(event.data.get("player"))
+        player = self.owner
         if player.hp <= player.hp_max * 0.5 and player.hp > 0:
             await self.game_state.event_dispatcher.fire_event(
                 self.game_state.event_type.HEAL_APPLY, {
-                    'player': player,
+                    'player': self.player_id,
                     'hp': player.hp_max * 0.8 - player.hp
                 })
             await self.game_state.log(f"{player.name}的自勉触发，生命值恢复至{player.hp_max * 0.8}")
         return event
 
 class TirelessObserver(Trait):
-    def __init__(self, game_state: GameState = None):
-        super().__init__("TirelessObserver", game_state=game_state)
-        game_state.event_dispatcher.add_listener(
-            game_state.event_type.SKILL_USE,
-            self.tireless_observer,
-            priority=50
-        )
+    LISTENS = ((GameEventType.SKILL_USE, 'tireless_observer', 50, True),)
+
+    def __init__(self, game_state: 'GameState' = None, player_id: Optional[str] = None):
+        super().__init__("TirelessObserver", game_state=game_state, player_id=player_id)
 
     async def tireless_observer(self, event):
         """勤勉观察者的事件处理"""
-        player = self.game_state.players.get(event.data.get("player"))
+        player = self.owner
         if player:
             await self.game_state.event_dispatcher.fire_event(
                 self.game_state.event_type.SKILL_CD_MODIFIED, {
-                    'player': player,
+                    'player': self.player_id,
                     'skill': event.data.get("skill"),
                     'cd': -1
                 })
@@ -52,21 +78,19 @@ class TirelessObserver(Trait):
         return event
 
 class ClearPathToCome(Trait):
-    def __init__(self, game_state: GameState = None):
-        super().__init__("ClearPathToCome", game_state=game_state)
-        game_state.event_dispatcher.add_listener(
-            game_state.event_type.GAME_START,
-            self.clear_path_to_come,
-            priority=50
-        )
+    # GAME_START不针对某个玩家，由处理方法直接作用于持有者
+    LISTENS = ((GameEventType.GAME_START, 'clear_path_to_come', 50, False),)
+
+    def __init__(self, game_state: 'GameState' = None, player_id: Optional[str] = None):
+        super().__init__("ClearPathToCome", game_state=game_state, player_id=player_id)
 
     async def clear_path_to_come(self, event):
         """开路先锋的事件处理"""
-        player = self.game_state.players.get(event.data.get("player"))
+        player = self.owner
         if player:
             await self.game_state.event_dispatcher.fire_event(
                 self.game_state.event_type.SKILL_APPEND, {
-                    'player': player,
+                    'player': self.player_id,
                     'skill': event.data.get("skill")
                 })
             await self.game_state.log(f"{player.name}的开路先锋特质触发")
@@ -76,4 +100,31 @@ class ClearPathToCome(Trait):
 class TraitManager(Enum):
     SELF_ENCOURAGEMENT = SelfEncouragement
     TIRELESS_OBSERVER = TirelessObserver
-    CLEAR_PATH_TO_COME = ClearPathToCome
\ No newline at end of file
+    CLEAR_PATH_TO_COME = ClearPathToCome
+
+
+class TraitLifecycle:
+    """
+    对局内特质的生命周期
+    只在持有该特质的角色进入对局时注册监听器，玩家离开或更换角色时按句柄移除。
+    """
+
+    def __init__(self, game_state: 'GameState'):
+        self.game_state = game_state
+        self.active: Dict[str, List[Trait]] = {}
+
+    def attach(self, player_id: str, character) -> List[Trait]:
+        """激活角色的全部特质，玩家已有的特质先被移除"""
+        self.detach(player_id)
+        traits = []
+        for kind in character.traits:
+            trait = kind.value(self.game_state, player_id)
+            trait.activate()
+            traits.append(trait)
+        self.active[player_id] = traits
+        return traits
+
+    def detach(self, player_id: str):
+        """移除玩家的全部特质监听器"""
+        for trait in self.active.pop(player_id, ()):
+            trait.deactivate()
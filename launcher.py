@@ -0,0 +1,268 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file launcher.py
+#
+
+"""
+生产环境启动器
+server.workers > 1 时由监督进程fork出N个工作进程，各自以SO_REUSEPORT监听同一地址，
+由内核把新连接分配到各进程；工作进程崩溃后监督进程按退避间隔重启它。
+已安装uvloop时工作进程使用uvloop事件循环，否则使用asyncio默认循环。
+
+收到SIGTERM（或SIGINT）时工作进程先关闭监听套接字并拒绝新的/game连接，
+等待有连接的会话结束（最长drain_timeout秒），再保存剩余会话的快照并退出；
+再次收到信号时不再等待。监督进程收到信号时通知全部工作进程排空后退出，
+单独向某个工作进程发送SIGTERM则只排空该进程，监督进程随后启动新的进程替代它。
+
+各工作进程的会话、匹配大厅与/metrics相互独立：会话快照保存在snapshot_dir下各自的子目录，
+重连、匹配只在同一工作进程内有效。
+"""
+
+import asyncio
+import copy
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional
+
+from aiohttp import web
+
+from config.log_setup import setup_logging
+from config.settings import AppSettings, Settings
+
+try:
+    import uvloop
+except ImportError:     # 可选依赖，未安装时使用asyncio默认事件循环
+    uvloop = None
+
+AppFactory = Callable[[Settings], web.Application]
+GAME_SERVER = web.AppKey('game_server', object)
+
+
+def run(coro, use_uvloop: bool = True):
+    """运行协程直至结束，已安装uvloop且use_uvloop时使用uvloop事件循环"""
+    loop_factory = uvloop.new_event_loop if use_uvloop and uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
+
+def worker_settings(settings: AppSettings, worker_id: int, token_secret: str) -> AppSettings:
+    """
+    工作进程的配置：快照目录与日志文件按进程区分，未配置令牌签名密钥时使用监督进程生成的密钥
+
+    多个进程从同一目录恢复会话会重复恢复同一局，同时轮转同一个日志文件会互相覆盖；
+    各进程随机生成密钥时，在一个进程登录取得的令牌在其他进程无效
+    """
+    game = settings.game
+    if game.snapshot_dir:
+        game = dataclasses.replace(game, snapshot_dir=os.path.join(game.snapshot_dir, f"worker-{worker_id}"))
+    log_config = copy.deepcopy(settings.logging)
+    for handler in log_config.get('handlers', {}).values():
+        if handler.get('filename'):
+            root, ext = os.path.splitext(handler['filename'])
+            handler['filename'] = f"{root}.worker-{worker_id}{ext}"
+    account = settings.account
+    if not account.token_secret:
+        account = dataclasses.replace(account, token_secret=token_secret)
+    return dataclasses.replace(settings, game=game, account=account, logging=log_config)
+
+
+async def serve(settings: Settings, app_factory: AppFactory, reuse_port: bool = False):
+    """
+    运行一个服务器进程直至收到SIGTERM或SIGINT，之后排空并退出
+
+    Args:
+        settings: 本进程的配置
+        app_factory: 由配置创建aiohttp应用的函数，应用中以GAME_SERVER登记游戏服务器
+        reuse_port: 以SO_REUSEPORT监听，多个进程共用同一端口
+    """
+    logger = logging.getLogger('Launcher')
+    options = settings.current.server
+    app = app_factory(settings)
+    game_server = app[GAME_SERVER]
+
+    # 第一次信号开始排空，第二次信号不再等待会话结束
+    stopping = asyncio.Event()
+    force = asyncio.Event()
+
+    def on_signal():
+        if stopping.is_set():
+            force.set()
+        stopping.set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, on_signal)
+
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, options.host, options.port, reuse_port=reuse_port or None)
+    try:
+        await site.start()
+        logger.info(f"进程{os.getpid()}开始监听 {site.name}"
+                    f"（事件循环: {type(loop).__module__}.{type(loop).__name__}）")
+        await stopping.wait()
+
+        # 先关闭监听套接字，新连接由仍在监听的其他工作进程接受
+        await site.stop()
+        # 排空时长可在运行中修改，此时再读取
+        drain_timeout = settings.current.server.drain_timeout
+        active = game_server.active_sessions()
+        if active:
+            logger.info(f"排空中：等待{active}个会话结束，最长{drain_timeout:g}秒")
+        remaining = await game_server.drain(drain_timeout, force)
+        if remaining:
+            logger.warning(f"排空超时，{remaining}个会话保存快照后结束")
+    finally:
+        # on_shutdown中保存剩余会话的快照并关闭连接
+        await runner.cleanup()
+    logger.info(f"进程{os.getpid()}已退出")
+
+
+def _worker_main(worker_id: int, settings: Settings, token_secret: str, app_factory: AppFactory):
+    """工作进程入口"""
+    # fork继承了监督进程的信号处理函数，恢复默认后由事件循环重新注册
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # 重新加载配置后同样按本进程调整
+    settings = settings.derive(functools.partial(
+        worker_settings, worker_id=worker_id, token_secret=token_secret))
+    log_listener = setup_logging(settings.current.logging)
+    try:
+        run(serve(settings, app_factory, reuse_port=True), settings.current.server.uvloop)
+    finally:
+        log_listener.stop()
+
+
+class Worker:
+    """监督进程中一个工作进程槽位的状态"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_at = 0.0       # 计划重启的时刻，0表示无需重启
+        self.delay = 0.0            # 下一次崩溃后的重启等待
+        self.restarts = 0
+
+
+class Supervisor:
+    """
+    监督进程：启动工作进程、重启崩溃的工作进程、收到信号后通知全部工作进程排空
+
+    Args:
+        settings: 配置，各工作进程在其基础上调整目录与密钥
+        app_factory: 由配置创建aiohttp应用的函数，须可被子进程调用
+    """
+
+    def __init__(self, settings: Settings, app_factory: AppFactory):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError("当前平台不支持SO_REUSEPORT，无法启动多个工作进程")
+        self.settings = settings
+        self.options = settings.current.server
+        # 未配置令牌签名密钥时各工作进程共用此密钥
+        self.token_secret = secrets.token_hex(32)
+        self.app_factory = app_factory
+        self.workers = [Worker(i) for i in range(max(1, self.options.workers))]
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self.stopping = False
+        self.logger = logging.getLogger('Supervisor')
+
+    def _start(self, worker: Worker):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, self.settings, self.token_secret, self.app_factory),
+            name=f"sns-worker-{worker.worker_id}",
+        )
+        process.start()
+        worker.process = process
+        worker.started_at = time.monotonic()
+        worker.restart_at = 0.0
+        self.logger.info(f"工作进程{worker.worker_id}已启动，pid {process.pid}")
+
+    def _on_exit(self, worker: Worker):
+        """工作进程退出：排空后正常退出的立即替换，崩溃的按退避间隔重启"""
+        code = worker.process.exitcode
+        worker.process = None
+        if self.stopping:
+            return
+        now = time.monotonic()
+        if code == 0:
+            self.logger.info(f"工作进程{worker.worker_id}已排空退出，启动新进程替代")
+            worker.restart_at = now
+            return
+        if now - worker.started_at >= self.options.stable_after:
+            worker.delay = self.options.restart_delay
+        else:
+            worker.delay = min(max(worker.delay * 2, self.options.restart_delay),
+                               self.options.restart_delay_max)
+        worker.restart_at = now + worker.delay
+        worker.restarts += 1
+        self.logger.error(f"工作进程{worker.worker_id}异常退出（exitcode {code}），"
+                          f"{worker.delay:g}秒后重启，累计重启{worker.restarts}次")
+
+    def _signal(self, signum, frame):
+        if self.stopping:
+            # 再次收到信号：工作进程不再等待会话结束
+            self._broadcast(signal.SIGTERM)
+            return
+        self.stopping = True
+        self.logger.info(f"收到信号{signal.Signals(signum).name}，通知工作进程排空")
+        self._broadcast(signal.SIGTERM)
+
+    def _broadcast(self, signum: int):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signum)
+
+    def _alive(self) -> List[Worker]:
+        return [worker for worker in self.workers if worker.process is not None]
+
+    def run(self) -> int:
+        """运行直至收到SIGTERM或SIGINT且全部工作进程退出，返回进程退出码"""
+        previous = {sig: signal.signal(sig, self._signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for worker in self.workers:
+                self._start(worker)
+            self.logger.info(f"已启动{len(self.workers)}个工作进程，监听 "
+                             f"{self.options.host}:{self.options.port}"
+                             f"（uvloop: {'是' if self.options.uvloop and uvloop else '否'}）")
+            deadline = None
+            while True:
+                now = time.monotonic()
+                if self.stopping:
+                    if not self._alive():
+                        break
+                    if deadline is None:
+                        # 留出保存快照与关闭连接的时间
+                        deadline = now + self.options.drain_timeout + 10
+                    elif now > deadline:
+                        self.logger.error("工作进程未能按时退出，强制结束")
+                        self._broadcast(signal.SIGKILL)
+                        deadline = float('inf')
+                else:
+                    for worker in self.workers:
+                        if worker.process is None and worker.restart_at and now >= worker.restart_at:
+                            self._start(worker)
+                sentinels = {worker.process.sentinel: worker for worker in self._alive()}
+                if not sentinels:
+                    time.sleep(0.5)
+                    continue
+                for ready in wait(list(sentinels), timeout=0.5):
+                    worker = sentinels[ready]
+                    worker.process.join()
+                    self._on_exit(worker)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        self.logger.info("全部工作进程已退出")
+        return 0
@@ -8,39 +8,89 @@
 The main progress of SnS Game, including server, game precess, etc.
 """
 
-import asyncio
+import argparse
+import functools
+from typing import Union
+
 from aiohttp import web
 from websocket.server import WSServer
-from config.settings import Settings
+from config.settings import Settings, get_settings, with_server
+from config.log_setup import apply_levels, setup_logging
+from launcher import GAME_SERVER, Supervisor, run, serve
+
+# 应用中登记的账号管理器，应用清理时关闭
+ACCOUNT_MANAGER = web.AppKey('account_manager', object)
+
 
+def create_app(settings: Union[Settings, dict]) -> web.Application:
+    """创建服务器应用：注册路由，随应用启动、关闭游戏服务器，并在配置文件修改后应用新配置"""
+    if not isinstance(settings, Settings):
+        settings = Settings(None, data=settings)
+    ws_server = WSServer(settings.current)
+    game_server = ws_server.game_server
 
-async def main():
-    # 加载配置
-    settings = Settings()
-    
-    # 创建服务器
-    ws_server = WSServer()
-    
-    # 设置路由
     app = web.Application()
-    app.router.add_get('/game', ws_server.game_server.websocket_handler)
+    app[GAME_SERVER] = game_server
+    app[ACCOUNT_MANAGER] = ws_server.account_manager
+    app.router.add_get('/game', game_server.websocket_handler)
     app.router.add_get('/account', ws_server.handle_account)
-    
-    # 启动服务器
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(
-        runner, 
-        settings.config.get('host', 'localhost'),
-        settings.config.get('port', 8080)
-    )
-    await site.start()
-    
+    app.router.add_get('/shards', game_server.shard_stats_handler)
+    app.router.add_post('/shards/migrate', game_server.shard_migrate_handler)
+    app.router.add_get('/lobby', game_server.lobby_stats_handler)
+    app.router.add_get('/metrics', game_server.metrics_handler)
+    app.router.add_route('*', '/debug/profile', game_server.profile_handler)
+    app.router.add_get('/debug/profile/collapsed', game_server.profile_collapsed_handler)
+
+    # 会话上限、超时、背压与剖析设置随配置文件修改生效，日志级别同样
+    unsubscribe = [
+        settings.subscribe('game', game_server.apply_settings),
+        settings.subscribe('logging.level', apply_levels),
+    ]
+
+    async def start_game_server(app):
+        # 启动分片工作进程（单进程模式下恢复快照中的会话）
+        await game_server.start()
+        settings.start_watching()
+
+    async def stop_game_server(app):
+        await settings.stop_watching()
+        for cancel in unsubscribe:
+            cancel()
+        # 先保存会话快照并结束会话，再关闭连接，避免断开的连接删除快照
+        await game_server.stop()
+
+    async def close_accounts(app):
+        # 连接全部关闭后写完待提交的注册并释放数据库与哈希线程池
+        await app[ACCOUNT_MANAGER].close()
+
+    app.on_startup.append(start_game_server)
+    app.on_shutdown.append(stop_game_server)
+    app.on_cleanup.append(close_accounts)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SnS游戏服务器")
+    parser.add_argument('--config', help="配置文件路径，默认为config/config.yaml")
+    parser.add_argument('--workers', type=int, help="工作进程数，覆盖config.yaml中的server.workers")
+    parser.add_argument('--host', help="监听地址")
+    parser.add_argument('--port', type=int, help="监听端口")
+    args = parser.parse_args()
+
+    # 加载配置，命令行参数在之后的重新加载中同样优先
+    settings = get_settings(args.config)
+    overrides = {key: getattr(args, key) for key in ('workers', 'host', 'port') if getattr(args, key) is not None}
+    if overrides:
+        settings.add_transform(functools.partial(with_server, **overrides))
+    log_listener = setup_logging(settings.current.logging)
+
     try:
-        while True:
-            await asyncio.sleep(3600)
+        if settings.current.server.workers > 1:
+            # 监督进程启动多个工作进程，各自以SO_REUSEPORT监听同一端口
+            return Supervisor(settings, create_app).run()
+        run(serve(settings, create_app), settings.current.server.uvloop)
     finally:
-        await runner.cleanup()
+        log_listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
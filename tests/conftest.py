@@ -0,0 +1,19 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file conftest.py
+#
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 以仓库根目录为导入起点，与python main.py的运行方式一致
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """每个测试在临时目录中运行，账号数据等相对路径不会写入仓库"""
+    monkeypatch.chdir(tmp_path)
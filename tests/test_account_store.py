@@ -0,0 +1,33 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_account_store.py
+#
+
+"""账号存储：LRU缓存上限与关闭"""
+
+import asyncio
+
+from websocket.account_store import AccountStore
+
+
+def test_cache_is_bounded_lru(tmp_path):
+    async def scenario():
+        store = AccountStore(tmp_path / 'accounts.db', batch_delay=0, cache_size=2)
+        try:
+            for name in ('a', 'b', 'c'):
+                assert await store.add(name, f'hash-{name}')
+            # 最早写入的账号被淘汰，但仍可从数据库读取
+            assert list(store._cache) == ['b', 'c']
+            assert await store.get('a') == 'hash-a'
+            assert list(store._cache) == ['c', 'a']
+            # 命中缓存的账号移到最近使用一端
+            assert await store.get('c') == 'hash-c'
+            assert list(store._cache) == ['a', 'c']
+            assert await store.update('b', 'hash-b2')
+            assert list(store._cache) == ['c', 'b']
+        finally:
+            await store.close()
+        assert store._conn is None
+
+    asyncio.run(scenario())
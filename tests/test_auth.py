@@ -0,0 +1,28 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_auth.py
+#
+
+"""会话令牌的签发与校验"""
+
+import base64
+
+import pytest
+
+from websocket.auth import TokenSigner
+
+
+def test_issued_token_verifies():
+    signer = TokenSigner(secret=b'secret')
+    assert signer.verify(signer.issue('alice')) == 'alice'
+    assert TokenSigner(secret=b'other').verify(signer.issue('alice')) is None
+    assert TokenSigner(secret=b'secret', ttl=-1).verify(TokenSigner(b'secret', ttl=-1).issue('alice')) is None
+
+
+@pytest.mark.parametrize('token', [
+    None, 7, ['a.b'], b'YQ==.00', '', 'no-dot', '!!!.00', 'YQ==.签名',
+    base64.urlsafe_b64encode(b'\xff\xfe|1').decode() + '.00',
+])
+def test_malformed_token_is_rejected(token):
+    assert TokenSigner(secret=b'secret').verify(token) is None
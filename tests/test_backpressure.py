@@ -0,0 +1,171 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_backpressure.py
+#
+
+"""背压：会话事件队列与发送队列的溢出策略、入站限速"""
+
+import asyncio
+
+import pytest
+from aiohttp import WSCloseCode
+
+from game.backpressure import (COALESCE, DISCONNECT, DROP, TRY_AGAIN_LATER, ConnectionWriter,
+                               QueueOverflow, TokenBucket)
+from game.events import GameEvent, GameEventType
+from game.protocol import JSON_CODEC
+from game.session import GameSession
+
+from test_server import connect, receive_until_closed, start_client
+
+
+def update(player: str, **data) -> GameEvent:
+    return GameEvent(GameEventType.CHARACTER_UPDATE, {'player': player, **data})
+
+
+def test_session_queue_drop():
+    async def scenario():
+        session = GameSession('s1', max_queue=2, overflow=DROP)
+        assert await session.process_event(update('p1', hp=1))
+        assert await session.process_event(update('p1', hp=2))
+        assert not await session.process_event(update('p1', hp=3))
+        assert session.event_queue.qsize() == 2
+
+    asyncio.run(scenario())
+
+
+def test_session_queue_coalesce_merges_into_tail_only():
+    async def scenario():
+        session = GameSession('s1', max_queue=1, overflow=COALESCE)
+        assert await session.process_event(update('p1', hp=1))
+        # 队尾为同一玩家的同类事件：并入
+        assert await session.process_event(update('p1', mp=2))
+        assert session.event_queue.qsize() == 1
+        assert session.event_queue.get_nowait().data == {'player': 'p1', 'hp': 1, 'mp': 2}
+
+        assert await session.process_event(update('p1', hp=1))
+        # 其他玩家或不可合并的事件被丢弃
+        assert not await session.process_event(update('p2', hp=1))
+        assert not await session.process_event(GameEvent(GameEventType.SKILL_USE, {'player': 'p1'}))
+        assert session.event_queue.qsize() == 1
+
+    asyncio.run(scenario())
+
+
+def test_session_queue_disconnect():
+    async def scenario():
+        session = GameSession('s1', max_queue=1, overflow=DISCONNECT)
+        assert await session.process_event(update('p1', hp=1))
+        with pytest.raises(QueueOverflow):
+            await session.process_event(update('p1', hp=2))
+
+    asyncio.run(scenario())
+
+
+class StalledSocket:
+    """不读取数据的对端：写出一直等待，记录关闭"""
+
+    def __init__(self):
+        self.closed_with = None
+
+    async def send_str(self, data: str):
+        await asyncio.Event().wait()
+
+    async def close(self, code: int, message: bytes):
+        self.closed_with = (code, message)
+
+
+def test_send_queue_drop():
+    async def scenario():
+        writer = ConnectionWriter(StalledSocket(), JSON_CODEC, high_water=2, overflow=DROP)
+        assert writer.send({'n': 1})
+        assert writer.send({'n': 2})
+        assert not writer.send({'n': 3})
+        assert list(writer.queue) == [{'n': 1}, {'n': 2}]
+        assert writer.dropped == 1
+        await writer.close(timeout=0)
+
+    asyncio.run(scenario())
+
+
+def test_send_queue_coalesce_replaces_backlog():
+    async def scenario():
+        writer = ConnectionWriter(StalledSocket(), JSON_CODEC, high_water=2, overflow=COALESCE,
+                                  resync=lambda: {'snapshot': {'version': 7}})
+        for n in range(3):
+            assert writer.send({'n': n})
+        # 积压的回复与触发溢出的回复换成一次全量快照
+        assert list(writer.queue) == [{'snapshot': {'version': 7}, 'coalesced': 3}]
+        await writer.close(timeout=0)
+
+        # 没有resync时换成重新同步通知
+        writer = ConnectionWriter(StalledSocket(), JSON_CODEC, high_water=1, overflow=COALESCE)
+        writer.send({'n': 1})
+        writer.send({'n': 2})
+        assert list(writer.queue) == [{'resync_required': True, 'coalesced': 2}]
+        await writer.close(timeout=0)
+
+    asyncio.run(scenario())
+
+
+def test_send_queue_disconnect():
+    async def scenario():
+        ws = StalledSocket()
+        writer = ConnectionWriter(ws, JSON_CODEC, high_water=1, overflow=DISCONNECT)
+        assert writer.send({'n': 1})
+        assert not writer.send({'n': 2})
+        assert writer.closed and not writer.queue
+        await asyncio.sleep(0)
+        assert ws.closed_with == (TRY_AGAIN_LATER, b'slow reader')
+        # 断开后的回复不再放入队列
+        assert not writer.send({'n': 3})
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=0.001, burst=2)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+
+
+def test_rate_limit_drop_replies_once():
+    async def scenario():
+        client = await start_client({'backpressure': {'rate': 0.001, 'burst': 2}})
+        try:
+            ws = await connect(client)
+            await ws.receive_json(timeout=5)
+            for ref in range(5):
+                await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'p1', 'ref': ref}})
+            refs, errors = [], []
+            while len(refs) < 2 or not errors:
+                reply = await ws.receive_json(timeout=5)
+                if 'error' in reply:
+                    errors.append(reply['error'])
+                refs.extend(event['ref'] for event in reply.get('events', ()))
+            # 只处理桶内的两条，超限只提示一次
+            assert refs == [0, 1]
+            assert errors == ['rate limited']
+            await ws.close()
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_disconnect():
+    async def scenario():
+        client = await start_client({'backpressure': {'rate': 0.001, 'burst': 1, 'rate_overflow': 'disconnect'}})
+        try:
+            ws = await connect(client)
+            await ws.receive_json(timeout=5)
+            for ref in range(3):
+                await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'p1', 'ref': ref}})
+            await asyncio.wait_for(receive_until_closed(ws), timeout=5)
+            assert ws.close_code == WSCloseCode.POLICY_VIOLATION
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
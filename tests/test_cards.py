@@ -0,0 +1,30 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_cards.py
+#
+
+"""牌堆：洗牌结果与随机数流一致、抽牌顺序"""
+
+import random
+
+from game.cards import CardPile
+
+
+def test_shuffle_matches_list_shuffle():
+    # 对局日志重放依赖同一种子得到同一排列
+    pile = CardPile(range(60))
+    expected = list(range(60))
+    pile.shuffle(random.Random(7))
+    random.Random(7).shuffle(expected)
+    assert pile.tolist() == expected
+    assert pile.typecode == CardPile().typecode
+
+
+def test_draw_many_takes_from_top_in_order():
+    pile = CardPile(range(10))
+    assert pile.draw_many(3) == [9, 8, 7]
+    assert pile.tolist() == list(range(7))
+    assert pile.draw_many(20) == [6, 5, 4, 3, 2, 1, 0]
+    assert pile.draw_many(1) == []
+    assert pile.draw() is None
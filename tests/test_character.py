@@ -0,0 +1,60 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_character.py
+#
+
+"""角色：按原型初始化的数值、实例间不共享的容器、按需创建的冷却与状态"""
+
+from game.character import CHARACTERS, Character, Module, NekaoHewish, YinZhu, get_prototype
+from game.traits import TraitManager
+
+
+def fields(character: Character):
+    return {name: getattr(character, name) for name in (
+        'team', 'name', 'traits', 'is_alive', 'hp_max', 'hp', 'attack', 'defense',
+        'mp_max', 'mp', 'mp_restore', 'mp_restore_cd', 'skill_max', 'skills', 'cooldowns', 'statuses',
+    )}
+
+
+def test_values_come_from_module_and_mp_module():
+    yin = YinZhu()
+    assert (yin.name, yin.hp_max, yin.hp, yin.attack, yin.defense) == ("茵竹", 1250, 1250, 75, 45)
+    assert (yin.mp_max, yin.mp, yin.mp_restore, yin.mp_restore_cd) == (2, 0, 1, 5)
+    assert yin.traits == {TraitManager.SELF_ENCOURAGEMENT}
+    assert yin.is_alive and list(yin.hand) == []
+
+    # 指定模块时按该模块取值，模块名与枚举等价
+    assert fields(YinZhu('BEAST')) == fields(YinZhu(Module.BEAST))
+    assert (YinZhu(Module.BEAST).hp_max, YinZhu(Module.BEAST).attack) == (900, 125)
+    assert fields(CHARACTERS['NekaoHewish']()) == fields(NekaoHewish(Module.BALANCE))
+    # 原型按(角色, 模块)缓存
+    assert get_prototype(YinZhu) is get_prototype(YinZhu, Module.HP)
+
+
+def test_instances_do_not_share_mutable_containers():
+    first, second = YinZhu(), YinZhu()
+    first.hand.append(3)
+    first.skills.add('slash')
+    first.cooldowns['slash'] = 2
+    first.statuses['burn'] = {'layer': 1}
+    first.hp -= 100
+    assert list(second.hand) == [] and second.skills == set()
+    assert second.cooldowns == {} and second.statuses == {}
+    assert second.hp == 1250
+    # 特质集合不可变，同一原型的实例共享
+    assert first.traits is second.traits
+
+
+def test_cooldowns_and_statuses_are_created_on_first_use():
+    character = YinZhu()
+    assert character._cooldowns is None and character._statuses is None
+    cooldowns = character.cooldowns
+    assert cooldowns == {} and character.cooldowns is cooldowns
+    character.statuses['stun'] = {'layer': 1, 'decay': True}
+    assert character._statuses == {'stun': {'layer': 1, 'decay': True}}
+
+    # 赋值替换容器
+    character.cooldowns = {'slash': 1}
+    character.statuses = {}
+    assert character.cooldowns == {'slash': 1} and character.statuses == {}
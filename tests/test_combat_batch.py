@@ -0,0 +1,124 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_combat_batch.py
+#
+
+"""批量战斗：数组视图、同一目标的多次攻击、死亡判定、移出属性表、由对局随机数流掷骰"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from game.character import CHARACTERS
+from game.combat_batch import ALIVE, HP, BatchCombat, CombatantTable
+from game.events import GameEventType
+from game.state import GameState
+
+
+def make_table(*names: str):
+    table = CombatantTable(capacity=1)
+    characters = [CHARACTERS[name]() for name in names]
+    for i, character in enumerate(characters):
+        table.add(character, f"p{i}")
+    return table, characters
+
+
+def test_character_stats_are_views_over_table():
+    table, (yin, nekao) = make_table('YinZhu', 'NekaoHewish')
+    # 容量不足时扩容，已绑定的角色仍读写同一张表
+    assert len(table) == 2
+    assert yin.hp == 1250 and nekao.hp == 1000
+    yin.hp = 900
+    assert table.data[HP, 0] == 900
+    table.data[HP, 1] = 10
+    assert nekao.hp == 10
+    with pytest.raises(ValueError):
+        table.add(yin)
+
+
+def test_repeated_hits_on_one_target_accumulate():
+    async def scenario():
+        # 骰子只有一面，伤害为攻击减防御
+        table, (yin, nekao) = make_table('YinZhu', 'NekaoHewish')
+        combat = BatchCombat(table, rng=np.random.default_rng(0), dice_sides=1)
+        damage = await combat.resolve([1, 1, 1], [0, 0, 0])
+        assert damage.tolist() == [50, 50, 50]
+        assert yin.hp == 1250 - 150
+        assert nekao.hp == 1000
+
+    asyncio.run(scenario())
+
+
+def test_death_is_detected_once_and_notified():
+    async def scenario():
+        state = GameState(seed=1)
+        deaths = []
+        state.event_dispatcher.add_listener(GameEventType.CHARACTER_DEATH,
+                                            lambda event: deaths.append(event.data['player']))
+        table, (yin, nekao) = make_table('YinZhu', 'NekaoHewish')
+        combat = BatchCombat(table, state, dice_sides=1)
+        nekao.hp = 60
+
+        await combat.resolve([0, 0], [1, 1])
+        assert nekao.hp == 0 and not nekao.is_alive
+        assert table.data[ALIVE, 1] == 0
+        assert deaths == ['p1']
+
+        # 阵亡的角色既不能攻击也不再受到伤害
+        damage = await combat.resolve([1, 0], [0, 1])
+        assert damage.tolist() == [0, 0]
+        assert yin.hp == 1250
+        assert deaths == ['p1']
+
+    asyncio.run(scenario())
+
+
+def test_remove_copies_values_back():
+    table, (yin, nekao) = make_table('YinZhu', 'NekaoHewish')
+    yin.hp = 700
+    table.remove(yin)
+    assert yin._table is None
+    assert yin.hp == 700
+    # 移出后的修改不影响表，空出的位置不再参与结算
+    yin.hp = 1
+    assert table.data[HP, 0] == 700
+    assert table.data[ALIVE, 0] == 0
+    assert table.player_ids[0] is None
+    assert nekao.hp == 1000
+    # 可以重新加入
+    table.add(yin, 'p0')
+    assert yin.hp == 1
+
+
+def test_rolls_come_from_session_random_streams():
+    async def rolls(state: GameState):
+        table, _ = make_table('YinZhu', 'NekaoHewish')
+        table.data[HP, :2] = 10 ** 9
+        combat = BatchCombat(table, state)
+        return [(await combat.resolve([0] * 8, [1] * 8)).tolist() for _ in range(3)]
+
+    async def scenario():
+        first = await rolls(GameState(seed=7))
+        assert first == await rolls(GameState(seed=7))
+        assert first != await rolls(GameState(seed=8))
+
+        # 生成器不随快照保存，恢复随机数流的状态后掷骰结果相同
+        state = GameState(seed=7)
+        table, _ = make_table('YinZhu', 'NekaoHewish')
+        table.data[HP, :2] = 10 ** 9
+        combat = BatchCombat(table, state)
+        await combat.resolve([0], [1])
+        saved = state.rng.getstate()
+        after = (await combat.resolve([0] * 8, [1] * 8)).tolist()
+        state.rng.setstate(saved)
+        assert (await combat.resolve([0] * 8, [1] * 8)).tolist() == after
+
+    asyncio.run(scenario())
+
+
+def test_batch_combat_requires_a_generator_without_session():
+    table, _ = make_table('YinZhu')
+    with pytest.raises(ValueError):
+        BatchCombat(table)
@@ -0,0 +1,85 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_events.py
+#
+
+"""事件分发器：监听链顺序、取消与监听器变动"""
+
+import asyncio
+
+from game.events import EventDispatcher, GameEvent, GameEventType
+
+
+def dispatch(dispatcher: EventDispatcher, event: GameEvent) -> GameEvent:
+    return asyncio.run(dispatcher.dispatch(event))
+
+
+def test_priority_then_registration_order():
+    dispatcher = EventDispatcher()
+    calls = []
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('low'), priority=-1)
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('first'))
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('high'), priority=10)
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('second'))
+
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {}))
+    assert calls == ['high', 'first', 'second', 'low']
+
+
+def test_async_and_sync_listeners_share_one_chain():
+    dispatcher = EventDispatcher()
+    calls = []
+
+    async def async_listener(event):
+        await asyncio.sleep(0)
+        calls.append('async')
+
+    dispatcher.add_listener(GameEventType.SKILL_USE, async_listener, priority=1)
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('sync'))
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {}))
+    assert calls == ['async', 'sync']
+
+
+def test_cancel_stops_later_listeners():
+    dispatcher = EventDispatcher()
+    calls = []
+
+    def cancel(event):
+        calls.append('cancel')
+        event.cancel = True
+
+    dispatcher.add_listener(GameEventType.PRE_ATTACK, cancel, priority=5)
+    dispatcher.add_listener(GameEventType.PRE_ATTACK, lambda e: calls.append('after'))
+    event = dispatch(dispatcher, GameEvent(GameEventType.PRE_ATTACK, {}))
+    assert event.cancel
+    assert calls == ['cancel']
+
+
+def test_chain_rebuilt_after_listener_changes():
+    dispatcher = EventDispatcher()
+    calls = []
+    handle = dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('a'))
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {}))
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append('b'), priority=1)
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {}))
+    assert dispatcher.remove(handle)
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {}))
+    assert calls == ['a', 'b', 'a', 'b']
+    assert not dispatcher.remove(handle)
+
+
+def test_owner_filtered_listener():
+    dispatcher = EventDispatcher()
+    calls = []
+    dispatcher.add_listener(GameEventType.SKILL_USE, lambda e: calls.append(e.data['player']), owner='p1')
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {'player': 'p2'}))
+    dispatch(dispatcher, GameEvent(GameEventType.SKILL_USE, {'player': 'p1'}))
+    assert calls == ['p1']
+
+
+def test_emit_reports_cancel_and_skips_without_listeners():
+    dispatcher = EventDispatcher()
+    assert asyncio.run(dispatcher.emit(GameEventType.DAMAGE_CALC, {})) is False
+    dispatcher.add_listener(GameEventType.DAMAGE_CALC, lambda e: setattr(e, 'cancel', True))
+    assert asyncio.run(dispatcher.emit(GameEventType.DAMAGE_CALC, {})) is True
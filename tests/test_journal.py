@@ -0,0 +1,97 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_journal.py
+#
+
+"""对局日志：重放与线上一致、会话结束后的记录、会话ID重用"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from game.events import GameEvent, GameEventType
+from game.journal import EVENT, JournalWriter, read_journal
+from game.replay import replay
+from game.session import GameSession
+from game.state import GameState
+
+from test_session import wait_for
+
+
+async def play(journal: JournalWriter, seed: int, count: int = 300, **options) -> GameSession:
+    """运行一局写日志的会话，处理完全部事件后返回（会话已结束）"""
+    session = GameSession('m1', game_state=GameState(seed=seed), journal=journal, **options)
+    processed = []
+
+    async def on_result(result):
+        processed.extend(result['events'])
+
+    session.subscribe(on_result)
+    runner = asyncio.create_task(session.run())
+    await session.player_join('p1')
+    await session.player_join('p2')
+    await session.player_character_select('p1', 'YinZhu')
+    await session.player_character_select('p2', 'NekaoHewish')
+    rng = random.Random(seed)
+    for i in range(count):
+        player = rng.choice(('p1', 'p2'))
+        if rng.random() < 0.6:
+            event = GameEvent(GameEventType.DAMAGE_APPLY, {'player': player, 'damage': rng.randint(10, 120)})
+        else:
+            event = GameEvent(GameEventType.HEAL_APPLY, {'player': player, 'hp': rng.randint(10, 80)})
+        await session.process_event(event)
+    await wait_for(lambda: len(processed) == count)
+    await session.cleanup()
+    await runner
+    return session
+
+
+def test_replay_matches_original_run(tmp_path):
+    async def scenario():
+        journal = JournalWriter(tmp_path)
+        session = await play(journal, seed=11)
+        await journal.close()
+        path = journal.path('m1', session.created_at.timestamp())
+        header, records = read_journal(path)
+        assert header[:2] == ['m1', 11]
+        assert sum(1 for r in records if r[0] == EVENT) == 300
+        replayed = await replay(path)
+        assert replayed.game_state.snapshot() == session.game_state.snapshot()
+
+    asyncio.run(scenario())
+
+
+def test_records_after_close_are_dropped(tmp_path):
+    async def scenario():
+        journal = JournalWriter(tmp_path, flush_interval=0)
+        journal.open('s1', 1, 0.0)
+        journal.append('s1', EVENT, 'SKILL_USE', {'player': 'p1'})
+        journal.close_session('s1')
+        await journal.flush()
+        # 会话结束时仍在处理的tick继续写入：丢弃，不影响之后的写入
+        journal.append('s1', EVENT, 'SKILL_USE', {'player': 'p1'})
+        journal.open('s2', 2, 0.0)
+        journal.append('s2', EVENT, 'SKILL_USE', {'player': 'p2'})
+        await journal.close()
+        assert len(read_journal(journal.path('s1', 0.0))[1]) == 1
+        assert len(read_journal(journal.path('s2', 0.0))[1]) == 1
+
+    asyncio.run(scenario())
+
+
+def test_reused_session_id_starts_a_new_journal(tmp_path):
+    async def scenario():
+        journal = JournalWriter(tmp_path)
+        first = await play(journal, seed=1, count=50)
+        second = await play(journal, seed=2, count=80,
+                            created_at=datetime.now() + timedelta(seconds=1))
+        await journal.close()
+        paths = sorted(tmp_path.iterdir())
+        assert len(paths) == 2
+        for session in (first, second):
+            path = journal.path('m1', session.created_at.timestamp())
+            assert read_journal(path)[0][1] == session.game_state.rng.seed
+            assert (await replay(path)).game_state.snapshot() == session.game_state.snapshot()
+
+    asyncio.run(scenario())
@@ -0,0 +1,128 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_lobby.py
+#
+
+"""大厅：分队写入对局状态与日志、每轮只查找各分段、分数取自账号、重连身份校验"""
+
+import asyncio
+
+from game.journal import JournalWriter
+from game.lobby import Lobby
+from game.manager import GameManager
+from game.replay import replay
+from game.snapshot import capture_session, decode_snapshot, encode_payload, restore_session
+
+from test_server import GAME_SERVER, ACCOUNT_MANAGER, connect, start_client
+from test_session import wait_for
+
+
+def test_teams_are_stored_in_state_and_journal(tmp_path):
+    async def scenario():
+        journal = JournalWriter(tmp_path)
+        manager = GameManager(journal=journal)
+        lobby = Lobby(manager, team_sizes=(2,))
+        tickets = [lobby.enqueue(f"p{i}", 1000 + i * 10, 2) for i in range(4)]
+        assert await lobby.match_once() == 1
+        match = tickets[0].future.result()
+        session = manager.sessions[match.session_id]
+        state = session.game_state
+        assert state.is_team_system_active
+        assert state.teams == match.teams
+        assert sorted(match.teams.values()) == [0, 0, 1, 1]
+
+        # 成局后选择的角色按分队结果设置队伍
+        await session.player_character_select('p0', 'YinZhu')
+        assert state.players['p0'].team == match.teams['p0']
+        assert 'teams' in state.resync()['snapshot']['sections']
+
+        restored = restore_session(decode_snapshot(encode_payload(capture_session(session))))
+        assert restored.game_state.teams == match.teams
+
+        await manager.shutdown()
+        replayed = await replay(journal.path(match.session_id, session.created_at.timestamp()))
+        assert replayed.game_state.teams == match.teams
+        assert replayed.game_state.players['p0'].team == match.teams['p0']
+
+    asyncio.run(scenario())
+
+
+def test_match_round_only_searches_arrivals_and_bucket_heads():
+    async def scenario():
+        manager = GameManager()
+        lobby = Lobby(manager, team_sizes=(1,), bucket_width=50, window_base=10, window_growth=0)
+        queue = lobby.queues[1]
+        first = lobby.enqueue('a', 1000)
+        second = lobby.enqueue('b', 1020)
+        far = lobby.enqueue('c', 2000)
+        assert queue.candidates() == [first, second, far]
+        # 分差超出可接受范围，本轮无人成局；之后只为各分段等待最久的玩家查找
+        assert await lobby.match_once() == 0
+        assert not queue.arrivals
+        assert queue.candidates() == [first, far]
+
+        # 新排队的玩家向附近分段查找，与已排队的玩家成局
+        near = lobby.enqueue('d', 1025)
+        assert await lobby.match_once() == 1
+        assert second.future.result().session_id == near.future.result().session_id
+        assert queue.candidates() == [first, far]
+        await manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_rating_comes_from_account_store():
+    async def scenario():
+        client = await start_client({'lobby': {'enabled': True}})
+        try:
+            accounts = client.app[ACCOUNT_MANAGER]
+            assert await accounts.store.add('alice', 'hash')
+            assert await accounts.store.update_rating('alice', 1800)
+            lobby = client.app[GAME_SERVER].lobby
+
+            # 查询参数中的分数被忽略
+            ws = await connect(client, 'alice', rating=5000)
+            assert (await ws.receive_json(timeout=5))['lobby']['queued']
+            assert lobby.queues[1].tickets['alice'].rating == 1800
+            # 未注册的玩家取默认分数
+            other = await connect(client, 'bob', team_size=2)
+            assert (await other.receive_json(timeout=5))['lobby']['team_size'] == 2
+            assert lobby.queues[2].tickets['bob'].rating == 1000
+            # 不支持的每队人数在排队前被拒绝
+            bad = await connect(client, 'carol', team_size='x')
+            assert 'error' in await bad.receive_json(timeout=5)
+            await ws.close()
+            await other.close()
+            await bad.close()
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_only_players_in_session_can_rejoin():
+    async def scenario():
+        client = await start_client({})
+        try:
+            server = client.app[GAME_SERVER]
+            ws = await connect(client, 'alice')
+            await ws.receive_json(timeout=5)
+            (session_id,) = server.manager.sessions
+            session = server.manager.sessions[session_id]
+            # 会话记录了连接认证的玩家
+            assert session.game_state.player_in_order == ['alice']
+            assert not server._can_rejoin(session, 'mallory')
+            # 仍有连接时本人也不能接管
+            assert not server._can_rejoin(session, 'alice')
+
+            other = await connect(client, 'mallory', session=session_id)
+            await other.receive_json(timeout=5)
+            await wait_for(lambda: len(server.manager.sessions) == 2)
+            assert len(session.subscribers) == 1
+            await other.close()
+            await ws.close()
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
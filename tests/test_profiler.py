@@ -0,0 +1,54 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_profiler.py
+#
+
+"""监听器剖析：各类可调用对象的命名、/debug/profile的参数校验"""
+
+import asyncio
+import functools
+
+from game.profiler import ListenerProfiler
+
+from test_server import start_client
+
+
+class Trait:
+    LISTENS = ()
+    player_id = 'p1'
+
+    def on_damage(self, event):
+        pass
+
+
+def on_heal(event, amount):
+    pass
+
+
+def test_describe_handles_any_callable():
+    profiler = ListenerProfiler()
+    assert profiler._describe(Trait().on_damage, None) == ('Trait.on_damage', 'Trait', 'p1')
+    assert profiler._describe(on_heal, 'p2') == ('on_heal', None, 'p2')
+    # 内置类型的绑定方法没有__func__
+    assert profiler._describe([].append, None)[0] == 'list.append'
+    # partial没有__name__与__qualname__
+    partial = functools.partial(on_heal, amount=1)
+    assert profiler._describe(partial, None)[0] == repr(partial)
+
+
+def test_profile_rejects_invalid_top():
+    async def scenario():
+        client = await start_client({})
+        try:
+            resp = await client.get('/debug/profile', params={'top': 'x'})
+            assert resp.status == 400
+            resp = await client.post('/debug/profile', params={'sample_rate': 'x'})
+            assert resp.status == 400
+            resp = await client.get('/debug/profile', params={'top': '5'})
+            assert resp.status == 200
+            assert (await resp.json())['listeners'] == []
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,123 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_protocol.py
+#
+
+"""消息编解码：格式错误的输入与客户端不能发送的事件只产生协议错误回复"""
+
+import asyncio
+
+import pytest
+
+from game.events import GameEvent, GameEventType
+from game.protocol import HEADER, JSON_CODEC, MSGPACK_CODEC, VERSION, ProtocolError
+from game.session import GameSession
+
+from test_server import GAME_SERVER, connect, start_client
+
+
+@pytest.mark.parametrize('frame', [
+    '{"event_type": "SKILL_USE", "data": [1, 2]}',
+    '{"event_type": "SKILL_USE", "data": {"player": 7}}',
+    '{"event_type": "NO_SUCH_EVENT"}',
+    '{"event_type": ["SKILL_USE"]}',
+    '{"data": {}}',
+    '[1, 2]',
+    '"SKILL_USE"',
+    '{not json',
+    # 结算流程内部的事件只能由服务器触发
+    '{"event_type": "DAMAGE_APPLY", "data": {"player": "p1", "damage": -100000}}',
+    '{"event_type": "HEAL_APPLY", "data": {"player": "p1", "hp": 100}}',
+])
+def test_json_rejects_malformed_message(frame):
+    with pytest.raises(ProtocolError):
+        JSON_CODEC.decode(frame)
+
+
+def skill_use(payload: bytes) -> bytes:
+    return HEADER.pack(VERSION, GameEventType.SKILL_USE.value) + payload
+
+
+@pytest.mark.skipif(MSGPACK_CODEC is None, reason="未安装msgpack")
+@pytest.mark.parametrize('build', [
+    lambda pack: b'',
+    lambda pack: b'\x01',
+    lambda pack: HEADER.pack(VERSION + 1, GameEventType.SKILL_USE.value),
+    lambda pack: HEADER.pack(VERSION, 255),
+    lambda pack: skill_use(pack([1, 2])),
+    lambda pack: skill_use(pack({'player': None, 'x': 1})[:-1]),
+    lambda pack: skill_use(pack({'player': b'p1'})),
+    lambda pack: HEADER.pack(VERSION, GameEventType.DAMAGE_APPLY.value) + pack({'player': 'p1', 'damage': -1}),
+])
+def test_msgpack_rejects_malformed_frame(build):
+    import msgpack
+    with pytest.raises(ProtocolError):
+        MSGPACK_CODEC.decode(build(msgpack.packb))
+
+
+def test_valid_frames_decode():
+    event = JSON_CODEC.decode('{"event_type": "SKILL_USE", "data": {"player": "p1"}}')
+    assert event.event_type is GameEventType.SKILL_USE and event.data == {'player': 'p1'}
+    assert JSON_CODEC.decode('{"event_type": "SKILL_USE"}').data == {}
+    if MSGPACK_CODEC is None:
+        return
+    event = MSGPACK_CODEC.decode(MSGPACK_CODEC.encode_event(GameEventType.SKILL_USE, {'player': 'p1'}))
+    assert event.event_type is GameEventType.SKILL_USE and event.data == {'player': 'p1'}
+
+
+def test_malformed_frame_gets_error_reply_and_connection_stays_usable():
+    async def scenario():
+        client = await start_client({})
+        try:
+            ws = await connect(client)
+            await ws.receive_json(timeout=5)
+            await ws.send_str('{"event_type": "SKILL_USE", "data": [1, 2]}')
+            reply = await ws.receive_json(timeout=5)
+            assert reply['protocol_error']
+
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'p1', 'ref': 1}})
+            result = await ws.receive_json(timeout=5)
+            assert result['events'][0]['ref'] == 1
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_forged_internal_event_is_refused():
+    async def scenario():
+        client = await start_client({})
+        try:
+            manager = client.app[GAME_SERVER].manager
+            ws = await connect(client)
+            await ws.receive_json(timeout=5)
+            (session,) = manager.sessions.values()
+            await session.player_character_select('p1', 'YinZhu')
+            character = session.game_state.players['p1']
+            hp = character.hp
+
+            await ws.send_json({'event_type': 'DAMAGE_APPLY', 'data': {'player': 'p1', 'damage': -100000}})
+            reply = await ws.receive_json(timeout=5)
+            assert reply['protocol_error'] and 'DAMAGE_APPLY' in reply['error']
+            assert session.event_queue.empty()
+            assert character.hp == hp
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_negative_damage_and_heal_are_clamped():
+    async def scenario():
+        session = GameSession('s1')
+        await session.player_join('p1')
+        await session.player_character_select('p1', 'YinZhu')
+        character = session.game_state.players['p1']
+        character.hp = hp = character.hp_max - 10
+        await session.handle_event(GameEvent(GameEventType.DAMAGE_APPLY, {'player': 'p1', 'damage': -500}))
+        assert character.hp == hp
+        await session.handle_event(GameEvent(GameEventType.HEAL_APPLY, {'player': 'p1', 'hp': -500}))
+        assert character.hp == hp
+
+    asyncio.run(scenario())
@@ -0,0 +1,178 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_server.py
+#
+
+"""/game 与 /account 连接：令牌认证、账号消息校验、会话超时结束后的处理"""
+
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from aiohttp import WSCloseCode, WSMsgType, WSServerHandshakeError
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from launcher import GAME_SERVER
+from main import ACCOUNT_MANAGER, create_app
+
+
+async def start_client(game: Dict[str, Any], account: Optional[Dict[str, Any]] = None) -> TestClient:
+    client = TestClient(TestServer(create_app({'game': game, 'account': account or {}})))
+    await client.start_server()
+    return client
+
+
+async def connect(client: TestClient, player: str = 'p1', **query):
+    """以登录令牌认证的玩家身份连接/game"""
+    token = client.app[ACCOUNT_MANAGER].tokens.issue(player)
+    return await client.ws_connect('/game', params={'token': token, **query})
+
+
+async def receive_until_closed(ws):
+    """读取连接上剩余的消息直到连接关闭"""
+    messages = []
+    async for msg in ws:
+        if msg.type == WSMsgType.TEXT:
+            messages.append(json.loads(msg.data))
+    return messages
+
+
+def test_idle_session_expiry_notifies_and_closes():
+    async def scenario():
+        client = await start_client({'session_timeouts': {'default': 0.2}, 'cleanup_interval': 0.05})
+        try:
+            ws = await connect(client)
+            snapshot = await ws.receive_json(timeout=5)
+            assert 'snapshot' in snapshot
+            messages = await asyncio.wait_for(receive_until_closed(ws), timeout=5)
+            assert messages[-1]['expired']
+            assert ws.close_code == WSCloseCode.GOING_AWAY
+            assert not client.app[GAME_SERVER].manager.sessions
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_frame_after_session_end_does_not_recreate_session():
+    async def scenario():
+        client = await start_client({})
+        try:
+            manager = client.app[GAME_SERVER].manager
+            ws = await connect(client)
+            await ws.receive_json(timeout=5)
+            # 会话在连接仍打开时结束（不经过超时通知）
+            (session_id,) = manager.sessions
+            await manager.end_session(session_id)
+
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'p1'}})
+            messages = await asyncio.wait_for(receive_until_closed(ws), timeout=5)
+            assert messages == [{'expired': True, 'error': '会话已结束，请重新加入'}]
+            assert ws.close_code == WSCloseCode.GOING_AWAY
+            assert session_id not in manager.sessions
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_state_resync_replies_only_to_requester():
+    async def scenario():
+        client = await start_client({})
+        try:
+            ws = await connect(client)
+            snapshot = (await ws.receive_json(timeout=5))['snapshot']
+            await ws.send_json({'event_type': 'STATE_RESYNC', 'data': {'version': snapshot['version']}})
+            reply = await ws.receive_json(timeout=5)
+            assert reply == {'resync': {'version': snapshot['version'], 'deltas': []}}
+            await ws.send_json({'event_type': 'STATE_RESYNC', 'data': {'version': 99}})
+            assert 'snapshot' in await ws.receive_json(timeout=5)
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_cleanup_closes_account_store(tmp_path):
+    async def scenario():
+        # 账号数据库建在配置的目录中
+        client = await start_client({}, {'data_dir': str(tmp_path / 'accounts')})
+        accounts = client.app[ACCOUNT_MANAGER]
+        await accounts.store.exists('nobody')
+        assert accounts.store._conn is not None
+        assert (tmp_path / 'accounts' / 'accounts.db').exists()
+        assert not (tmp_path / 'data').exists()
+        await client.close()
+        # 应用清理时关闭账号数据库与哈希线程池
+        assert accounts.store._conn is None
+        assert accounts.hasher._executor._shutdown
+
+    asyncio.run(scenario())
+
+
+def test_game_requires_valid_token():
+    async def scenario():
+        client = await start_client({})
+        try:
+            for query in ('', '?token=bad', '?token=&player=p1'):
+                with pytest.raises(WSServerHandshakeError) as info:
+                    await client.ws_connect(f'/game{query}')
+                assert info.value.status == 401
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_guest_gets_random_identity_and_cannot_claim_players():
+    async def scenario():
+        client = await start_client({'allow_guests': True})
+        try:
+            ws = await client.ws_connect('/game?player=p1')
+            await ws.receive_json(timeout=5)
+            # 游客不能以其他玩家的身份发送事件
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'p1'}})
+            reply = await ws.receive_json(timeout=5)
+            assert reply['protocol_error']
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_token_player_is_enforced_on_events():
+    async def scenario():
+        client = await start_client({})
+        try:
+            ws = await connect(client, 'alice')
+            await ws.receive_json(timeout=5)
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'bob'}})
+            assert (await ws.receive_json(timeout=5))['protocol_error']
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'alice', 'ref': 1}})
+            assert (await ws.receive_json(timeout=5))['events'][0]['ref'] == 1
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_malformed_account_messages_get_error_replies():
+    async def scenario():
+        client = await start_client({})
+        try:
+            ws = await client.ws_connect('/account')
+            for message in ('{"action": "verify", "token": null}', '[1, 2]', '"verify"', '{not json',
+                            '{"action": 5}', '{"action": "login", "username": ["a"], "password": "x"}'):
+                await ws.send_str(message)
+                reply = await ws.receive_json(timeout=5)
+                assert reply['success'] is False
+            # 连接仍可用
+            token = client.app[ACCOUNT_MANAGER].tokens.issue('alice')
+            await ws.send_json({'action': 'verify', 'token': token})
+            assert await ws.receive_json(timeout=5) == {'success': True, 'username': 'alice'}
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,157 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_session.py
+#
+
+"""会话的创建与事件处理、角色特质的注册与移除"""
+
+import asyncio
+
+from game.events import GameEvent, GameEventType
+from game.manager import GameManager
+from game.session import GameSession
+
+
+async def wait_for(predicate, timeout: float = 2.0):
+    """轮询直至predicate()为真"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+def test_session_dispatches_queued_event():
+    async def scenario():
+        manager = GameManager()
+        session = await manager.create_session('s1')
+        assert session is not None
+        handled = []
+        session.dispatcher.add_listener(GameEventType.SKILL_USE, handled.append)
+        await session.event_queue.put(GameEvent(GameEventType.SKILL_USE, data={'player': 'p1'}))
+        await wait_for(lambda: handled)
+        await manager.end_session('s1')
+        return handled
+
+    handled = asyncio.run(scenario())
+    assert [event.data['player'] for event in handled] == ['p1']
+
+
+def test_process_events_publishes_tick_result():
+    async def scenario():
+        manager = GameManager()
+        session = await manager.create_session('s1')
+        assert session is not None
+        results = []
+
+        async def on_result(result):
+            results.append(result)
+
+        session.subscribe(on_result)
+        await session.process_event(GameEvent(GameEventType.SKILL_USE, data={'player': 'p1'}))
+        await session.process_event(GameEvent(GameEventType.PLAYER_READY, data={'player': 'p2'}))
+        await wait_for(lambda: sum(len(result['events']) for result in results) == 2)
+        await manager.end_session('s1')
+        return results
+
+    results = asyncio.run(scenario())
+    events = [event for result in results for event in result['events']]
+    assert [event['event_type'] for event in events] == ['SKILL_USE', 'PLAYER_READY']
+
+
+def update(player: str, **fields) -> GameEvent:
+    return GameEvent(GameEventType.CHARACTER_UPDATE, data={'player': player, **fields})
+
+
+def test_coalesce_merges_only_adjacent_events():
+    session = GameSession('s1')
+    batch = [update('p1', hp=1), update('p1', mp=2),
+             GameEvent(GameEventType.SKILL_USE, data={'player': 'p2'}),
+             update('p1', hp=3)]
+    events, merged = session._coalesce(batch)
+    assert merged == 1
+    assert [event.event_type for event in events] == [
+        GameEventType.CHARACTER_UPDATE, GameEventType.SKILL_USE, GameEventType.CHARACTER_UPDATE]
+    assert events[0].data == {'player': 'p1', 'hp': 1, 'mp': 2}
+    assert events[2].data == {'player': 'p1', 'hp': 3}
+
+
+def test_coalesce_keeps_ready_toggles_around_other_players():
+    session = GameSession('s1')
+    batch = [GameEvent(GameEventType.PLAYER_READY, data={'player': 'p1'}),
+             GameEvent(GameEventType.PLAYER_READY, data={'player': 'p2'}),
+             GameEvent(GameEventType.PLAYER_UNREADY, data={'player': 'p1'}),
+             GameEvent(GameEventType.PLAYER_READY, data={'player': 'p1'})]
+    events, merged = session._coalesce(batch)
+    assert merged == 1
+    assert [(event.event_type.name, event.data['player']) for event in events] == [
+        ('PLAYER_READY', 'p1'), ('PLAYER_READY', 'p2'), ('PLAYER_READY', 'p1')]
+
+
+def test_malformed_event_does_not_stop_session():
+    async def scenario():
+        manager = GameManager()
+        session = await manager.create_session('s1')
+        results = []
+
+        async def on_result(result):
+            results.append(result)
+
+        session.subscribe(on_result)
+        bad = GameEvent(GameEventType.CHARACTER_UPDATE, data={'player': ['p1']})
+        session.dispatcher.add_listener(GameEventType.SKILL_USE, lambda event: event.data['missing'])
+        await session.process_event(bad)
+        await session.process_event(GameEvent(GameEventType.SKILL_USE, data={'player': 'p1'}))
+        await wait_for(lambda: sum(len(result['events']) for result in results) == 2)
+        await session.process_event(GameEvent(GameEventType.PLAYER_READY, data={'player': 'p1'}))
+        await wait_for(lambda: sum(len(result['events']) for result in results) == 3)
+        await manager.end_session('s1')
+        return [event for result in results for event in result['events']]
+
+    events = asyncio.run(scenario())
+    assert events[1]['event_type'] == 'SKILL_USE' and events[1]['error']
+    assert events[2] == {**events[2], 'event_type': 'PLAYER_READY', 'error': None}
+
+
+def listener_count(session: GameSession) -> int:
+    return sum(len(entries) for entries in session.game_state.event_dispatcher.listeners.values())
+
+
+def test_traits_follow_owner_and_are_removed_with_character():
+    async def scenario():
+        session = GameSession('s1')
+        state = session.game_state
+        modified = []
+        state.event_dispatcher.add_listener(GameEventType.SKILL_CD_MODIFIED,
+                                            lambda event: modified.append(event.data['player']))
+        baseline = listener_count(session)
+        for player_id in ('p1', 'p2'):
+            await session.player_join(player_id)
+        await session.player_character_select('p1', 'YinZhu')
+        await session.player_character_select('p2', 'NekaoHewish')
+        assert listener_count(session) == baseline + 3
+
+        # 勤勉观察者只处理持有者的技能事件
+        await state.event_dispatcher.fire_event(GameEventType.SKILL_USE, {'player': 'p1', 'skill': 'x'})
+        assert modified == []
+        await state.event_dispatcher.fire_event(GameEventType.SKILL_USE, {'player': 'p2', 'skill': 'x'})
+        assert modified == ['p2']
+
+        # 离开的玩家的特质随角色移除，更换角色时先移除原角色的特质
+        await session.player_exit('p2')
+        assert 'p2' not in state.traits.active
+        assert listener_count(session) == baseline + 1
+        await session.player_character_select('p1', 'NekaoHewish')
+        assert listener_count(session) == baseline + 2
+        await session.player_character_select('p1', 'YinZhu')
+        assert listener_count(session) == baseline + 1
+        assert not state.event_dispatcher.has_listeners(GameEventType.SKILL_USE)
+
+        await session.player_exit('p1')
+        assert not state.traits.active
+        assert listener_count(session) == baseline
+        await state.event_dispatcher.fire_event(GameEventType.SKILL_USE, {'player': 'p2', 'skill': 'x'})
+        assert modified == ['p2']
+
+    asyncio.run(scenario())
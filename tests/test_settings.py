@@ -0,0 +1,84 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_settings.py
+#
+
+"""配置：修改时间变化后重新加载、协程回调的异常、共享配置的路径"""
+
+import asyncio
+import logging
+import os
+
+import pytest
+
+from config import settings as settings_module
+from config.settings import Settings, SettingsError, get_settings
+
+
+def write_config(path, max_sessions: int, stamp: int):
+    path.write_text(f"game:\n  max_sessions: {max_sessions}\n", encoding='utf-8')
+    # 显式设置修改时间，不依赖文件系统的时间精度
+    os.utime(path, ns=(stamp, stamp))
+
+
+def test_reload_after_file_changes(tmp_path):
+    async def scenario():
+        path = tmp_path / 'config.yaml'
+        write_config(path, 10, 1_000_000_000)
+        settings = Settings(path)
+        changes = []
+
+        async def on_change(new, old):
+            changes.append((new, old))
+
+        settings.subscribe('game.max_sessions', on_change)
+        assert not settings.check()
+
+        write_config(path, 20, 2_000_000_000)
+        # 第一次看到新的修改时间时文件可能仍在写入，下一次检查才读取
+        assert not settings.check()
+        assert settings.current.game.max_sessions == 10
+        assert settings.check()
+        assert settings.current.game.max_sessions == 20
+        await settings.stop_watching()
+        assert changes == [(20, 10)]
+        assert not settings._callbacks
+
+        # 解析失败时保留原配置
+        path.write_text("game: [", encoding='utf-8')
+        os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+        settings.check()
+        assert settings.check()
+        assert settings.current.game.max_sessions == 20
+
+    asyncio.run(scenario())
+
+
+def test_failed_coroutine_callback_is_logged(tmp_path, caplog):
+    async def scenario():
+        settings = Settings(tmp_path / 'config.yaml')
+
+        async def broken(new, old):
+            raise RuntimeError("boom")
+
+        settings.subscribe('game.max_sessions', broken)
+        write_config(tmp_path / 'config.yaml', 5, 1_000_000_000)
+        assert settings.reload()
+        await settings.stop_watching()
+        assert not settings._callbacks
+
+    with caplog.at_level(logging.ERROR, logger='Settings'):
+        asyncio.run(scenario())
+    assert any('game.max_sessions' in r.getMessage() and 'boom' in r.getMessage() for r in caplog.records)
+
+
+def test_shared_settings_reject_other_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings_module, '_shared', None)
+    first = tmp_path / 'a.yaml'
+    write_config(first, 10, 1_000_000_000)
+    shared = get_settings(first)
+    assert get_settings() is shared
+    assert get_settings(str(first)) is shared
+    with pytest.raises(SettingsError):
+        get_settings(tmp_path / 'b.yaml')
@@ -0,0 +1,158 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_shard.py
+#
+
+"""多进程分片路由：请求与回复的对应、并发统计、分片进程退出后的恢复"""
+
+import asyncio
+import json
+import os
+import signal
+from typing import Optional
+
+from config.settings import GameSettings
+from game.backpressure import GOING_AWAY
+from game.shard import ShardRouter
+
+from test_session import wait_for
+
+
+async def start_router(shards: int = 2, settings: Optional[GameSettings] = None, **options) -> ShardRouter:
+    router = ShardRouter(shards, settings or GameSettings(shards=shards), **options)
+    await router.start()
+    return router
+
+
+def test_create_forward_and_concurrent_stats():
+    async def scenario():
+        router = await start_router()
+        try:
+            results = []
+
+            async def on_result(result):
+                results.append(result)
+
+            assert await router.create_session('s1', on_result)
+            # 创建后先收到全量快照
+            await wait_for(lambda: results, timeout=10)
+            assert 'snapshot' in results[0]
+            router.forward('s1', json.dumps({'event_type': 'SKILL_USE', 'data': {'player': 'p1'}}))
+            await wait_for(lambda: len(results) > 1, timeout=5)
+            assert results[1]['events'][0]['event_type'] == 'SKILL_USE'
+
+            # 并发的统计请求各自得到回复，不会互相覆盖
+            first, second = await asyncio.gather(router.stats(timeout=5), router.stats(timeout=5))
+            for stats in (first, second):
+                assert [s['shard'] for s in stats] == [0, 1]
+                assert all('error' not in s for s in stats)
+            assert sum(s['sessions'] for s in first) == 1
+            await router.end_session('s1')
+            assert router.active_sessions == 0
+        finally:
+            await router.stop()
+
+    asyncio.run(scenario())
+
+
+def test_shard_exit_fails_requests_and_restarts():
+    async def scenario():
+        router = await start_router()
+        try:
+            closed = []
+
+            async def on_result(result):
+                pass
+
+            async def on_close(code: int, reason: bytes):
+                closed.append(reason)
+
+            session_id = next(f's{i}' for i in range(100) if router.shard_for(f's{i}') == 0)
+            assert await router.create_session(session_id, on_result, on_close)
+            os.kill(router._processes[0].pid, signal.SIGKILL)
+
+            # 会话的连接被断开并释放名额，发往该分片的请求立即失败而不是等到超时
+            await wait_for(lambda: closed, timeout=5)
+            assert closed == [b'shard restarting']
+            assert router.active_sessions == 0
+            assert router.session_semaphore._value == router.max_sessions
+            stats = await router.stats(timeout=5)
+            assert stats[0]['error'] == 'unavailable' and stats[1].get('error') is None
+
+            # 分片按退避间隔重启后恢复服务
+            await wait_for(lambda: router._senders[0] is not None, timeout=10)
+            assert await router.create_session(session_id, on_result)
+            stats = await router.stats(timeout=5)
+            assert stats[0]['restarts'] == 1 and stats[0]['alive']
+        finally:
+            await router.stop()
+
+    asyncio.run(scenario())
+
+
+def test_request_times_out_without_reply():
+    async def scenario():
+        router = await start_router(shards=2, request_timeout=0.5)
+        try:
+            # 暂停分片进程：请求超时，且不在等待表中残留
+            os.kill(router._processes[1].pid, signal.SIGSTOP)
+            stats = await router.stats(timeout=0.5)
+            assert stats[1]['error'] == 'timeout'
+            assert not router._pending
+            os.kill(router._processes[1].pid, signal.SIGCONT)
+        finally:
+            await router.stop()
+
+    asyncio.run(scenario())
+
+
+def test_expired_session_notifies_and_closes():
+    async def scenario():
+        settings = GameSettings(shards=2, session_timeouts={'default': 0.2}, cleanup_interval=0.05)
+        router = await start_router(settings=settings)
+        try:
+            results, closed = [], []
+
+            async def on_result(result):
+                results.append(result)
+
+            async def on_close(code: int, reason: bytes):
+                closed.append((code, reason))
+
+            assert await router.create_session('s1', on_result, on_close)
+            # 分片中的会话超时结束：转发结束通知后断开连接并释放名额
+            await wait_for(lambda: closed, timeout=5)
+            assert results[-1]['expired']
+            assert closed == [(GOING_AWAY, b'session expired')]
+            assert router.active_sessions == 0
+        finally:
+            await router.stop()
+
+    asyncio.run(scenario())
+
+
+def test_shard_rejects_events_for_other_players():
+    async def scenario():
+        router = await start_router()
+        try:
+            results = []
+
+            async def on_result(result):
+                results.append(result)
+
+            assert await router.create_session('s1', on_result, player_id='alice')
+            await wait_for(lambda: results, timeout=10)
+            router.forward('s1', json.dumps({'event_type': 'SKILL_USE', 'data': {'player': 'bob'}}))
+            await wait_for(lambda: len(results) > 1, timeout=5)
+            assert results[1]['protocol_error']
+
+            # 迁移后分片仍按认证的玩家校验事件
+            assert await router.migrate('s1', 1 - router.shard_for('s1'), timeout=5)
+            router.forward('s1', json.dumps({'event_type': 'SKILL_USE', 'data': {'player': 'bob'}}))
+            await wait_for(lambda: len(results) > 2, timeout=5)
+            assert results[2]['protocol_error']
+        finally:
+            await router.stop()
+
+    asyncio.run(scenario())
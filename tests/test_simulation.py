@@ -0,0 +1,57 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_simulation.py
+#
+
+"""对局模拟：同一种子的分块结果相同、分块合并、进度回调输出中间统计"""
+
+import logging
+
+from game.simulation import _merge, all_matchups, progress_reporter, run_chunk, run_vector_chunk
+
+MATCHUPS = all_matchups(['YinZhu', 'NekaoHewish'])
+
+
+def check_totals(stats, matches: int):
+    assert sum(entry['matches'] for entry in stats.values()) == matches
+    for entry in stats.values():
+        assert entry['wins'][0] + entry['wins'][1] + entry['draws'] == entry['matches']
+        for side in (0, 1):
+            assert sum(entry['damage'][side].values()) == entry['hits'][side]
+
+
+def test_event_chunk_is_deterministic():
+    stats = run_chunk(MATCHUPS, 0, 6, 'random')
+    assert stats == run_chunk(MATCHUPS, 0, 6, 'random')
+    assert set(stats) == set(MATCHUPS)
+    check_totals(stats, 6)
+
+    # 分两块运行后合并与一次运行相同
+    total = {}
+    _merge(total, run_chunk(MATCHUPS, 0, 3, 'random'))
+    _merge(total, run_chunk(MATCHUPS, 3, 6, 'random'))
+    assert total == stats
+
+
+def test_vector_chunk_is_deterministic():
+    stats = run_vector_chunk(MATCHUPS, 0, 30, 'random')
+    assert stats == run_vector_chunk(MATCHUPS, 0, 30, 'random')
+    assert stats != run_vector_chunk(MATCHUPS, 30, 60, 'random')
+    check_totals(stats, 30)
+
+
+def test_progress_reports_interim_stats(caplog):
+    stats = run_chunk(MATCHUPS, 0, 3, 'random')
+    progress = progress_reporter(9, logging.getLogger('Simulation'), interval=5)
+    with caplog.at_level(logging.INFO, logger='Simulation'):
+        progress(3, stats, 1.0)
+        progress(6, stats, 6.0)
+        progress(9, stats, 20.0)
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0].startswith('[3/9]')
+    assert messages[1].startswith('[6/9]')
+    # 间隔到达后输出各对阵的胜率与伤害分布，最后一块由调用方输出最终报告
+    assert 'YinZhu/' in messages[2] and 'win%' in messages[2]
+    assert messages[3].startswith('[9/9]')
+    assert len(messages) == 4
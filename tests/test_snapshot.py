@@ -0,0 +1,160 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_snapshot.py
+#
+
+"""会话快照：回合边界保存、负载复制与编码分离、回合中途崩溃后由对局日志追上、迁移"""
+
+import asyncio
+
+from game.events import GameEvent, GameEventType
+from game.journal import EVENT, JournalWriter, _pack, read_journal
+from game.manager import GameManager
+from game.replay import replay
+from game.session import GameSession
+from game.snapshot import (SUFFIX, SnapshotStore, capture_session, decode_snapshot, encode_payload,
+                           restore_session)
+
+from test_server import GAME_SERVER, connect, start_client
+from test_session import wait_for
+
+
+def read_snapshot(store: SnapshotStore, session_id: str) -> GameSession:
+    return restore_session(decode_snapshot((store.directory / f"{session_id}{SUFFIX}").read_bytes()))
+
+
+def test_snapshots_are_taken_at_turn_boundaries(tmp_path):
+    async def scenario():
+        store = SnapshotStore(tmp_path)
+        session = GameSession('s1', snapshots=store)
+        state = session.game_state
+        # 技能改变当前行动者，属于回合中途的变化
+        session.dispatcher.add_listener(
+            GameEventType.SKILL_USE, lambda e: setattr(state, 'current_turn', e.data['player']))
+        task = asyncio.create_task(session.run())
+        try:
+            async def tick(event_type: GameEventType, player: str, version: int):
+                await session.process_event(GameEvent(event_type, {'player': player}))
+                await wait_for(lambda: state.version == version)
+                await store.flush()
+
+            # 新会话的第一次变化保存一次
+            await tick(GameEventType.SKILL_USE, 'p1', 1)
+            assert store.written == 1
+            # 回合中途不保存
+            await tick(GameEventType.SKILL_USE, 'p2', 2)
+            assert store.written == 1
+            assert read_snapshot(store, 's1').game_state.current_turn == 'p1'
+            # 回合结束的tick保存最新状态
+            await session.process_event(GameEvent(GameEventType.TURN_END, {}))
+            await wait_for(lambda: store.written == 2)
+            assert store.written == 2
+            assert read_snapshot(store, 's1').game_state.current_turn == 'p2'
+        finally:
+            await session.cleanup()
+            await task
+            await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_captured_payload_is_isolated_from_later_changes():
+    session = GameSession('s1')
+    state = session.game_state
+    state.player_in_order.append('p1')
+    state.deck.extend([1, 2, 3])
+    payload = capture_session(session)
+    # 复制之后的修改不影响在线程中编码的快照
+    state.player_in_order.append('p2')
+    state.deck.draw()
+    restored = restore_session(decode_snapshot(encode_payload(payload)))
+    assert restored.game_state.player_in_order == ['p1']
+    assert list(restored.game_state.deck) == [1, 2, 3]
+
+
+def test_restore_after_mid_turn_crash_replays_journal(tmp_path):
+    async def scenario():
+        def damage(player: str, amount: int) -> GameEvent:
+            return GameEvent(GameEventType.DAMAGE_APPLY, {'player': player, 'damage': amount})
+
+        store = SnapshotStore(tmp_path / 'snapshots')
+        journal = JournalWriter(tmp_path / 'journals')
+        session = GameSession('m1', snapshots=store, journal=journal)
+        await session.player_join('p1')
+        await session.player_join('p2')
+        await session.player_character_select('p1', 'YinZhu')
+        await session.player_character_select('p2', 'NekaoHewish')
+        # 快照时队列中还有两个事件，之后的变化都在回合中途，不再保存快照
+        await session.process_event(damage('p1', 100))
+        await session.process_event(damage('p2', 30))
+        store.save(session, force=True)
+        await store.flush()
+        session._snapshot_due = False
+
+        processed = []
+
+        async def on_result(result):
+            processed.extend(result['events'])
+
+        session.subscribe(on_result)
+        task = asyncio.create_task(session.run())
+        await wait_for(lambda: len(processed) == 2)
+        await session.process_event(damage('p2', 45))
+        await wait_for(lambda: len(processed) == 3)
+        await session.cleanup()
+        await task
+        assert store.written == 1
+        expected = session.game_state.snapshot()
+
+        # 进程崩溃：日志末尾有一个未完成tick的事件与半条记录
+        path = journal.path('m1', session.created_at.timestamp())
+        journal.append('m1', EVENT, 'DAMAGE_APPLY', {'player': 'p1', 'damage': 999})
+        await journal.flush()
+        with open(path, 'ab') as f:
+            f.write(_pack([EVENT, 'DAMAGE_APPLY', {'player': 'p1'}], journal.encoding)[:-2])
+
+        manager = GameManager(snapshots=SnapshotStore(tmp_path / 'snapshots'),
+                              journal=JournalWriter(tmp_path / 'journals'))
+        assert await manager.restore_sessions() == ['m1']
+        restored = manager.sessions['m1']
+        state = restored.game_state
+        assert state.snapshot() == expected
+        # 快照队列中的事件已由日志重放，不再重复处理
+        assert restored.event_queue.empty()
+
+        # 恢复后继续追加，完整日志的重放与线上状态一致
+        await restored.process_event(damage('p1', 10))
+        await wait_for(lambda: state.players['p1'].hp == expected['players']['p1']['hp'] - 10)
+        await manager.shutdown()
+        assert (await replay(path)).game_state.snapshot() == state.snapshot()
+        assert sum(1 for r in read_journal(path)[1] if r[0] == EVENT) == 4
+
+    asyncio.run(scenario())
+
+
+def test_migrate_route_moves_session_between_shards():
+    async def scenario():
+        client = await start_client({'shards': 2})
+        try:
+            router = client.app[GAME_SERVER].router
+            ws = await connect(client, 'alice')
+            await ws.receive_json(timeout=10)
+            (session_id,) = router._callbacks
+            target = 1 - router.shard_for(session_id)
+
+            resp = await client.post('/shards/migrate', params={'session': session_id, 'shard': target})
+            assert resp.status == 200
+            assert (await resp.json())['migrated']
+            assert router.shard_for(session_id) == target
+
+            # 迁移后连接继续可用
+            await ws.send_json({'event_type': 'SKILL_USE', 'data': {'player': 'alice', 'ref': 1}})
+            assert (await ws.receive_json(timeout=5))['events'][0]['ref'] == 1
+
+            resp = await client.post('/shards/migrate', params={'session': session_id, 'shard': 'x'})
+            assert resp.status == 400
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file test_state.py
+#
+
+"""对局状态的版本化增量同步与重新同步"""
+
+import asyncio
+import copy
+from typing import Any, Dict
+
+from game.state import DELTA_HISTORY, GameState
+
+
+def apply_delta(view: Dict[str, Any], delta: Dict[str, Any]):
+    """按客户端的方式把增量合并到本地视图"""
+    assert delta['base'] == view['version']
+    view['version'] = delta['version']
+    view['sections'].update(delta['sections'])
+    for key in ('deck_count', 'skill_deck_count', 'discard_count'):
+        view[key] = delta[key]
+    for pid, fields in delta['players'].items():
+        if fields is None:
+            view['players'].pop(pid, None)
+        else:
+            view['players'].setdefault(pid, {}).update(fields)
+    view['logs'].extend(delta['logs'])
+
+
+def test_deltas_rebuild_snapshot():
+    state = GameState()
+    view = copy.deepcopy(state.snapshot())
+    assert state.collect_delta() is None
+
+    state.player_in_order.append('p1')
+    state.mark_dirty('player_in_order')
+    state.current_round = 1
+    apply_delta(view, state.collect_delta())
+
+    state.player_in_order.append('p2')
+    state.mark_dirty('player_in_order')
+    state.current_turn = 'p1'
+    asyncio.run(state.log('round 1'))
+    delta = state.collect_delta()
+    # 增量只包含变化的字段
+    assert set(delta['sections']) == {'player_in_order', 'current_turn'}
+    apply_delta(view, delta)
+
+    assert view == state.snapshot()
+    assert view['version'] == 2
+
+
+def test_resync_returns_missing_deltas_or_snapshot():
+    state = GameState()
+    for turn in range(3):
+        state.current_turn_index = turn + 1
+        state.collect_delta()
+
+    # 已是最新版本：无需增量
+    assert state.resync(3) == {'resync': {'version': 3, 'deltas': []}}
+    # 落后的客户端按顺序补齐增量
+    resync = state.resync(1)['resync']
+    assert [d['version'] for d in resync['deltas']] == [2, 3]
+    # 未带版本或版本无效时发送全量快照
+    assert state.resync()['snapshot']['version'] == 3
+    assert 'snapshot' in state.resync(7)
+
+
+def test_resync_falls_back_to_snapshot_after_history_is_trimmed():
+    state = GameState()
+    for turn in range(DELTA_HISTORY + 2):
+        state.current_turn_index = turn + 1
+        state.collect_delta()
+    assert 'snapshot' in state.resync(0)
+    oldest = state.history[0]['base']
+    assert len(state.resync(oldest)['resync']['deltas']) == DELTA_HISTORY
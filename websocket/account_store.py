@@ -0,0 +1,230 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file account_store.py
+#
+
+"""
+账号存储
+使用WAL模式的SQLite保存账号（密码哈希与匹配分数），按用户名主键索引、按需读取，
+最近使用的账号缓存在有上限的LRU中；
+所有磁盘操作在单独的线程中执行，并发注册的写入合并为一次事务提交。
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# 新账号的匹配分数
+DEFAULT_RATING = 1000
+
+
+class AccountStore:
+    def __init__(self,
+                 db_path: Path,
+                 legacy_file: Optional[Path] = None,
+                 batch_delay: float = 0.01,
+                 checkpoint_every: int = 1000,
+                 cache_size: int = 10000):
+        """
+        Args:
+            db_path: 数据库文件路径
+            legacy_file: 旧版accounts.json，数据库为空时导入一次
+            batch_delay: 合并写入的等待时间（秒）
+            checkpoint_every: 每写入多少条账号压缩一次WAL
+            cache_size: 缓存的账号数上限，超出时淘汰最久未使用的账号
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        self.batch_delay = batch_delay
+        self.checkpoint_every = checkpoint_every
+        self.cache_size = max(cache_size, 0)
+
+        # sqlite连接只在这个线程中使用
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="account-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._writes_since_checkpoint = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _ensure_open(self):
+        """首次使用时打开数据库"""
+        if self._ready is None:
+            self._ready = asyncio.ensure_future(self._run(self._open))
+        await self._ready
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            "username TEXT PRIMARY KEY, password_hash TEXT NOT NULL, "
+            f"rating INTEGER NOT NULL DEFAULT {DEFAULT_RATING})"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(accounts)")}
+        if 'rating' not in columns:
+            # 旧版数据库没有匹配分数，已有账号取默认分数
+            self._conn.execute(
+                f"ALTER TABLE accounts ADD COLUMN rating INTEGER NOT NULL DEFAULT {DEFAULT_RATING}"
+            )
+        self._conn.commit()
+        self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """把旧版accounts.json导入数据库，仅在数据库为空时执行一次"""
+        if not self.legacy_file or not self.legacy_file.exists():
+            return
+        if self._conn.execute("SELECT 1 FROM accounts LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                accounts = json.load(f)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO accounts (username, password_hash) VALUES (?, ?)",
+                    accounts.items()
+                )
+            self.legacy_file.rename(self.legacy_file.with_suffix('.json.migrated'))
+            self.logger.info(f"已导入旧版账号文件，共{len(accounts)}个账号")
+        except Exception as e:
+            self.logger.error(f"导入旧版账号文件失败: {e}")
+
+    def _select(self, username: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT password_hash FROM accounts WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _remember(self, username: str, password_hash: str):
+        """放入LRU缓存，超出上限时淘汰最久未使用的账号"""
+        self._cache[username] = password_hash
+        self._cache.move_to_end(username)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, username: str) -> Optional[str]:
+        """读取账号的密码哈希，不存在时返回None"""
+        password_hash = self._cache.get(username)
+        if password_hash is not None:
+            self._cache.move_to_end(username)
+            return password_hash
+        await self._ensure_open()
+        password_hash = await self._run(self._select, username)
+        if password_hash is not None:
+            self._remember(username, password_hash)
+        return password_hash
+
+    async def exists(self, username: str) -> bool:
+        """账号是否存在"""
+        return await self.get(username) is not None
+
+    async def add(self, username: str, password_hash: str) -> bool:
+        """
+        新增账号，与同时到达的其他注册合并为一次事务写入
+
+        Returns:
+            是否写入成功，用户名已存在时为False
+        """
+        await self._ensure_open()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((username, password_hash, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_delay)
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+        try:
+            results = await self._run(self._insert_batch, [(u, h) for u, h, _ in batch])
+        except Exception as e:
+            self.logger.error(f"保存账号失败: {e}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (username, password_hash, future), inserted in zip(batch, results):
+            if inserted:
+                self._remember(username, password_hash)
+            if not future.done():
+                future.set_result(inserted)
+
+    def _insert_batch(self, rows: List[Tuple[str, str]]) -> List[bool]:
+        results = []
+        with self._conn:
+            for row in rows:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO accounts (username, password_hash) VALUES (?, ?)", row
+                )
+                results.append(cursor.rowcount == 1)
+        self._writes_since_checkpoint += len(rows)
+        if self._writes_since_checkpoint >= self.checkpoint_every:
+            # 把WAL合并回主库并截断，避免日志无限增长
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._writes_since_checkpoint = 0
+        return results
+
+    def _update(self, username: str, password_hash: str) -> bool:
+        with self._conn:
+            cursor = self._conn.execute(
+                "UPDATE accounts SET password_hash = ? WHERE username = ?", (password_hash, username)
+            )
+        return cursor.rowcount == 1
+
+    async def update(self, username: str, password_hash: str) -> bool:
+        """更新已有账号的密码哈希"""
+        await self._ensure_open()
+        updated = await self._run(self._update, username, password_hash)
+        if updated:
+            self._remember(username, password_hash)
+        return updated
+
+    def _select_rating(self, username: str) -> Optional[int]:
+        row = self._conn.execute(
+            "SELECT rating FROM accounts WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else None
+
+    async def rating(self, username: str) -> Optional[int]:
+        """读取账号的匹配分数，不存在时返回None；分数只在排队时读取，不缓存"""
+        await self._ensure_open()
+        return await self._run(self._select_rating, username)
+
+    def _update_rating(self, username: str, rating: int) -> bool:
+        with self._conn:
+            cursor = self._conn.execute(
+                "UPDATE accounts SET rating = ? WHERE username = ?", (rating, username)
+            )
+        return cursor.rowcount == 1
+
+    async def update_rating(self, username: str, rating: int) -> bool:
+        """更新已有账号的匹配分数"""
+        await self._ensure_open()
+        return await self._run(self._update_rating, username, rating)
+
+    async def close(self):
+        """写完待提交的账号并关闭数据库"""
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._conn is not None:
+            await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _close(self):
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.close()
+        self._conn = None
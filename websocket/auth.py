@@ -0,0 +1,128 @@
+#
+# -*- coding: UTF-8 -*-
+# @project Strife-and-Strike_web
+# @file auth.py
+#
+
+"""
+密码哈希与会话令牌
+密码使用加盐scrypt，在有并发上限的线程池中计算，不阻塞事件循环；
+登录成功后签发HMAC签名的令牌，校验令牌无需重新计算密码哈希。
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+
+
+class HasherBusy(Exception):
+    """哈希任务排队已满"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 4, max_queue: int = 64):
+        """
+        Args:
+            workers: 同时计算哈希的线程数
+            max_queue: 允许排队等待的任务数，超出时拒绝
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = asyncio.Semaphore(workers)
+        self._waiting = 0
+
+    async def _run(self, func, *args):
+        if self._waiting >= self.max_queue:
+            raise HasherBusy("登录请求过多，请稍后重试")
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=64 * 1024 * 1024)
+
+    @classmethod
+    def _hash_sync(cls, password: str) -> str:
+        salt = os.urandom(SALT_SIZE)
+        digest = cls._scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+    @classmethod
+    def _verify_sync(cls, password: str, stored: str) -> Tuple[bool, bool]:
+        if not stored.startswith("scrypt$"):
+            # 旧版无盐SHA-256
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, stored), True
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        computed = cls._scrypt(password, bytes.fromhex(salt), n, r, p)
+        outdated = (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return hmac.compare_digest(computed.hex(), digest), outdated
+
+    async def hash(self, password: str) -> str:
+        """计算密码哈希"""
+        return await self._run(self._hash_sync, password)
+
+    async def verify(self, password: str, stored: str) -> Tuple[bool, bool]:
+        """
+        校验密码
+
+        Returns:
+            (是否匹配, 是否需要用当前参数重新哈希)
+        """
+        return await self._run(self._verify_sync, password, stored)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class TokenSigner:
+    """签发与校验 HMAC-SHA256 会话令牌：base64(用户名|过期时间).签名"""
+
+    def __init__(self, secret: Optional[bytes] = None, ttl: int = 86400):
+        self.secret = secret or os.urandom(32)
+        self.ttl = ttl
+
+    def _sign(self, payload: bytes) -> str:
+        return hmac.new(self.secret, payload, hashlib.sha256).hexdigest()
+
+    def issue(self, username: str) -> str:
+        """为用户签发令牌"""
+        payload = f"{username}|{int(time.time()) + self.ttl}".encode()
+        return f"{base64.urlsafe_b64encode(payload).decode()}.{self._sign(payload)}"
+
+    def verify(self, token: Any) -> Optional[str]:
+        """校验令牌，有效时返回用户名；令牌不是字符串或格式错误时返回None"""
+        if not isinstance(token, str):
+            return None
+        try:
+            encoded, signature = token.split(".", 1)
+            payload = base64.urlsafe_b64decode(encoded.encode())
+            username, _, expires = payload.decode().rpartition("|")
+        except (ValueError, TypeError):
+            # 包括base64与UTF-8解码错误
+            return None
+        if not hmac.compare_digest(self._sign(payload).encode(), signature.encode()):
+            return None
+        if not username or not expires.isdigit() or int(expires) < time.time():
+            return None
+        return username
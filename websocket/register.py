@@ -1,50 +1,49 @@
 import re
-import json
-import os
 from pathlib import Path
-import hashlib
 import logging
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, Union
+
+from config.settings import AccountSettings
+from .account_store import DEFAULT_RATING, AccountStore
+from .auth import HasherBusy, PasswordHasher, TokenSigner
 
 class AccountManager:
-    def __init__(self):
+    def __init__(self, config: Union[AccountSettings, dict, None] = None):
+        if not isinstance(config, AccountSettings):
+            config = AccountSettings.from_dict(config)
+        self.config = config
         self.logger = logging.getLogger(__name__)
-        self.data_dir = Path("data/accounts")
+        self.data_dir = Path(config.data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.accounts_file = self.data_dir / "accounts.json"
-        self.accounts: Dict[str, str] = self._load_accounts()
+        # 账号按需从数据库读取，旧版accounts.json在首次使用时导入
+        self.store = AccountStore(
+            self.data_dir / "accounts.db",
+            legacy_file=self.accounts_file,
+            cache_size=config.cache_size,
+        )
+        # 密码哈希在线程池中计算，限制并发与排队数
+        self.hasher = PasswordHasher(
+            workers=config.hash_workers,
+            max_queue=config.hash_queue,
+        )
+        # 未配置密钥时每次启动随机生成，重启后旧令牌失效
+        secret = config.token_secret
+        self.tokens = TokenSigner(
+            secret=secret.encode() if secret else None,
+            ttl=config.token_ttl,
+        )
 
-    def _load_accounts(self) -> Dict[str, str]:
-        """加载已存在的账号信息"""
-        if not self.accounts_file.exists():
-            return {}
-        try:
-            with open(self.accounts_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            self.logger.error(f"加载账号文件失败: {e}")
-            return {}
-
-    def _save_accounts(self) -> bool:
-        """保存账号信息到文件"""
-        try:
-            with open(self.accounts_file, 'w', encoding='utf-8') as f:
-                json.dump(self.accounts, f, indent=2)
-            return True
-        except Exception as e:
-            self.logger.error(f"保存账号文件失败: {e}")
-            return False
-
-    def _hash_password(self, password: str) -> str:
+    async def _hash_password(self, password: str) -> str:
         """对密码进行哈希处理"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        return await self.hasher.hash(password)
 
     def _validate_username(self, username: str) -> bool:
         """验证用户名格式"""
         pattern = r'^[a-zA-Z0-9_]{3,16}$'
         return bool(re.match(pattern, username))
 
-    def register(self, username: str, password: str, confirm_password: str) -> Tuple[bool, str]:
+    async def register(self, username: str, password: str, confirm_password: str) -> Tuple[bool, str]:
         """
         注册新账号
         
@@ -61,7 +60,7 @@ class AccountManager:
             return False, "用户名只能包含英文、数字和下划线，长度3-16位"
 
         # 检查用户名是否已存在
-        if username in self.accounts:
+        if await self.store.exists(username):
             return False, "用户名已存在"
 
         # 验证密码匹配
@@ -73,7 +72,57 @@ class AccountManager:
             return False, "密码长度不能小于6位"
 
         # 保存账号信息
-        self.accounts[username] = self._hash_password(password)
-        if self._save_accounts():
-            return True, "注册成功"
-        return False, "注册失败，请稍后重试"
\ No newline at end of file
+        try:
+            if await self.store.add(username, await self._hash_password(password)):
+                return True, "注册成功"
+            return False, "用户名已存在"
+        except HasherBusy as e:
+            return False, str(e)
+        except Exception:
+            return False, "注册失败，请稍后重试"
+
+    async def login(self, username: str, password: str) -> Tuple[bool, str, Optional[str]]:
+        """
+        登录，旧版SHA-256哈希在登录成功后升级为scrypt
+
+        Args:
+            username: 用户名
+            password: 密码
+
+        Returns:
+            (成功标志, 消息, 会话令牌)
+        """
+        stored = await self.store.get(username)
+        if stored is None:
+            return False, "用户名或密码错误", None
+
+        try:
+            matched, outdated = await self.hasher.verify(password, stored)
+        except HasherBusy as e:
+            return False, str(e), None
+        if not matched:
+            return False, "用户名或密码错误", None
+
+        if outdated:
+            try:
+                await self.store.update(username, await self._hash_password(password))
+            except Exception as e:
+                self.logger.warning(f"升级密码哈希失败: {e}")
+
+        return True, "登录成功", self.tokens.issue(username)
+
+    async def rating(self, username: str) -> int:
+        """玩家的匹配分数，游客与未注册的玩家取默认分数"""
+        rating = await self.store.rating(username)
+        return DEFAULT_RATING if rating is None else rating
+
+    async def close(self):
+        """写完待提交的账号、关闭数据库并停止哈希线程池"""
+        try:
+            await self.store.close()
+        finally:
+            self.hasher.close()
+
+    def verify_token(self, token: str) -> Optional[str]:
+        """校验会话令牌，有效时返回用户名"""
+        return self.tokens.verify(token)
\ No newline at end of file
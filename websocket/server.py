@@ -1,11 +1,29 @@
+import json
+import logging
+
+from typing import Any, Union
+
 from aiohttp import web
+from config.settings import AppSettings
 from game.server import GameServer
 from .register import AccountManager
 
+# 各账号操作需要的字符串字段
+ACCOUNT_FIELDS = {
+    "register": ("username", "password", "confirm_password"),
+    "login": ("username", "password"),
+    "verify": ("token",),
+}
+
 class WSServer:
-    def __init__(self):
-        self.game_server = GameServer()
-        self.account_manager = AccountManager()
+    def __init__(self, config: Union[AppSettings, dict, None] = None):
+        if not isinstance(config, AppSettings):
+            config = AppSettings.from_dict(config)
+        self.config = config
+        self.account_manager = AccountManager(config.account)
+        # /game连接以账号登录签发的令牌认证玩家身份
+        self.game_server = GameServer(config.game, accounts=self.account_manager)
+        self.logger = logging.getLogger('WSServer')
         
     async def handle_connection(self, request):
         ws = web.WebSocketResponse()
@@ -16,4 +34,50 @@ class WSServer:
         if path == '/game':
             return await self.game_server.websocket_handler(request)
         elif path == '/account':
-            return await self.handle_account(ws)
\ No newline at end of file
+            return await self.handle_account(ws)
+
+    async def handle_account(self, request):
+        """账号WebSocket处理器：注册、登录与令牌校验"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        async for msg in ws:
+            if msg.type == web.WSMsgType.TEXT:
+                try:
+                    message = json.loads(msg.data)
+                except ValueError:
+                    response = {"success": False, "message": "Invalid message format"}
+                else:
+                    # 单条消息处理失败只回复错误，不断开连接
+                    try:
+                        response = await self.handle_account_message(message)
+                    except Exception as e:
+                        self.logger.error(f"账号消息处理失败: {e}", exc_info=True)
+                        response = {"success": False, "message": "服务器内部错误"}
+                await ws.send_str(json.dumps(response))
+            elif msg.type == web.WSMsgType.ERROR:
+                self.logger.error("WebSocket连接错误")
+
+        return ws
+
+    async def handle_account_message(self, message: Any) -> dict:
+        """处理账号消息，消息须为对象，各操作的字段须为字符串"""
+        if not isinstance(message, dict):
+            return {"success": False, "message": "Invalid message format"}
+        action = message.get("action")
+        fields = ACCOUNT_FIELDS.get(action) if isinstance(action, str) else None
+        if fields is None:
+            return {"success": False, "message": f"未知操作: {action}"}
+        values = [message.get(name, "") for name in fields]
+        for name, value in zip(fields, values):
+            if not isinstance(value, str):
+                return {"success": False, "message": f"{name}必须为字符串"}
+
+        if action == "register":
+            success, text = await self.account_manager.register(*values)
+            return {"success": success, "message": text}
+        elif action == "login":
+            success, text, token = await self.account_manager.login(*values)
+            return {"success": success, "message": text, "token": token}
+        username = self.account_manager.verify_token(*values)
+        return {"success": username is not None, "username": username}